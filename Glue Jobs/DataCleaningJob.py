@@ -1,11 +1,25 @@
+import os
+import shutil
+import tempfile
 import pandas as pd
-import json
 import ast
 import re
+import numpy as np
 import psycopg2
 import boto3
-from botocore.exceptions import ClientError
-from sqlalchemy import create_engine
+from job_args import optional_arg
+from connections import get_engine, close_all
+from bulk_load import CopyLoader, copy_dataframe, map_dtype_to_pg
+from fingerprints import changed_datasets
+from instrumentation import timed_step, instrumented, print_summary
+import schemas
+import string_kernels
+from string_kernels import clean_customer_id, clean_text_columns, normalize_names
+from stage_cache import get_stage_cache, cached_frame, code_version, input_hash
+from staging import (
+    read_staged, write_staged, iter_staged, write_staged_part, register_staged, frame_hash,
+    load_manifest, staged_partitions, partitioned_key, combine_hashes, entry_keys, staged_hash, merge_column_dtypes
+)
 
 input_datasets = {
     "state_with_region": "active-processing/state_region.csv",
@@ -25,52 +39,30 @@ output_datasets = {
     "loan_data": "post-processing/loan_data.csv"
 }
 
-def get_secret():
-    secret_name = "db-secret"
-    region_name = "us-east-1"
-    session = boto3.session.Session()
-    client = session.client(
-        service_name="secretsmanager",
-        region_name=region_name
-    )
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-        secret = get_secret_value_response["SecretString"]
-        return json.loads(secret)
-    except ClientError as e:
-        print(f"Error Occurred: {e}")
-        return None
-
-secret = get_secret()
-RDS_HOST = secret["host"]
-RDS_PORT = int(secret["port"])
-RDS_USER = secret["username"]
-RDS_PASSWORD = secret["password"]
 RDS_DB = "fintech"
 RDS_SCHEMA = "loans"
 S3_BUCKET = "source-system-754"
 GX_BUCKET = "project-utility-754"
+# Cached cleaned datasets are reused only while the cleaning code is unchanged
+CODE_VERSION = code_version(__file__, string_kernels, schemas)
 
-CONNECTION_STRING = f"postgresql+psycopg2://{RDS_USER}:{RDS_PASSWORD}@{RDS_HOST}:{RDS_PORT}/{RDS_DB}"
-try:
-    engine = create_engine(CONNECTION_STRING)
-    connection = engine.connect()
-    print("Connection successful!")
-    connection.close()
-except Exception as e:
-    print(f"Connection failed: {e}")
-
-def read_file(file_path):
-    path = f"s3://{S3_BUCKET}/{file_path}"
-    data = pd.read_csv(path)
-    return data
+def read_file(dataset_name, partitions=None):
+    return read_staged(dataset_name, layer="raw", fallback_key=input_datasets[dataset_name], partitions=partitions)
 
 def write_file(df, file_path):
     path = f"s3://{S3_BUCKET}/{file_path}"
     df.to_csv(path, index=False)
 
+def get_chunk_size():
+    """Rows per chunk from the optional --CHUNK_SIZE job argument; 0 keeps the in-memory mode."""
+    return int(optional_arg("CHUNK_SIZE", 0))
+
+
+def get_partitions():
+    """Partitions named in the optional --PARTITIONS argument are recleaned even if unchanged."""
+    value = optional_arg("PARTITIONS", "")
+    return [partition.strip() for partition in value.split(",") if partition.strip()]
+
 
 def decode_ibm866(byte_values):
     """Decode IBM866 byte values."""
@@ -88,28 +80,80 @@ def convert_to_bytes(encoded_str):
         print(f"Error converting string to bytes: {e}")
         return None
     
-def clean_customer_id(customer_id):
-    """Clean customer ID by removing non-ASCII and special characters."""
-    # Ensure the string is in UTF-8 format
-    customer_id = customer_id.encode("utf-8").decode("utf-8", errors="ignore")
-    # Remove non-ASCII characters
-    customer_id = re.sub(r"[^\x00-\x7F]+", "", customer_id)
-    # Remove special characters except for alphanumeric, '-', and '_'
-    customer_id = re.sub(r"[^a-zA-Z0-9-_]", "", customer_id)
-    return customer_id
+# Batch decoder equivalent to convert_to_bytes -> decode_ibm866 -> clean_customer_id
+# followed by the removal of '-' and '_': only bytes whose IBM866 character is an
+# ASCII letter or digit survive, so the whole chain reduces to one byte translation.
+# Other forms literal_eval accepts (B'', br'', b'''...''', surrounding whitespace, raw tabs,
+# implicit concatenation) and values that are not literals at all go through the scalar chain.
+BYTES_LITERAL_PATTERN = re.compile(
+    r"b'(?:[ -&(-\[\]-~]|\\x[0-9a-fA-F]{2}|\\[ -wyz{-~])*'"
+    r'|b"(?:[ !#-\[\]-~]|\\x[0-9a-fA-F]{2}|\\[ -wyz{-~])*"'
+)
+ESCAPE_SEQUENCE_PATTERN = re.compile(r"\\(?:x([0-9a-fA-F]{2})|([0-7]{1,3})|(.))")
+# Most escapes are of bytes that are not ASCII letters or digits (\x00-\x2f, \x3a-\x40,
+# \x5b-\x60, \x7b-\xff) or stand for control characters, and leave nothing
+DROPPED_ESCAPE_PATTERN = re.compile(
+    r"\\(?:x(?:[0-28-9a-fA-F][0-9a-fA-F]|3[a-fA-F]|40|5[b-fB-F]|60|7[b-fB-F])|[\\'\"abfnrtv])"
+)
+# Escapes of a bytes literal that stand for one byte; any other \c is kept as both characters
+SIMPLE_ESCAPES = "\\'\"abfnrtv"
+# The character each byte leaves after the chain, '' for the bytes it removes
+IBM866_KEPT = tuple(
+    c if c.isascii() and c.isalnum() else "" for c in bytes(range(256)).decode("ibm866")
+)
+IBM866_DELETE_TABLE = bytes(b for b in range(256) if b != ord("\n") and not IBM866_KEPT[b])
+decoded_customer_ids = {}
+# Bounds the memo so that streaming a large loan file keeps a flat memory profile
+DECODED_ID_MEMO_LIMIT = 1_000_000
+
+def escaped_character(match):
+    """What one escape sequence of a bytes literal leaves after the chain, e.g. \\x41 -> 'A'."""
+    hex_digits, octal_digits, character = match.groups()
+    if character is not None:
+        # The backslash of an unknown escape such as \q is removed later by the translation
+        return "" if character in SIMPLE_ESCAPES else character
+    # Octal escapes above \377 wrap around, as literal_eval does
+    return IBM866_KEPT[int(hex_digits, 16) if hex_digits else int(octal_digits, 8) % 256]
+
+def decode_customer_id(literal):
+    """The scalar chain, for values the batch decoder does not handle; None if it is not a bytes literal."""
+    byte_values = convert_to_bytes(literal)
+    if not isinstance(byte_values, bytes):
+        return None
+    return clean_customer_id(decode_ibm866(byte_values)).replace("-", "").replace("_", "")
+
+def decode_literal_batch(literals):
+    """Decode a list of b'...' strings in one pass over a newline-joined buffer."""
+    valid = [isinstance(x, str) and BYTES_LITERAL_PATTERN.fullmatch(x) is not None for x in literals]
+    bodies = [x[2:-1] for x, ok in zip(literals, valid) if ok]
+    decoded = iter([])
+    if bodies:
+        # Dropped escapes become '-', which the translation removes and which cannot extend an
+        # octal escape; the rest are replaced by what their byte leaves, never a newline
+        buffer = DROPPED_ESCAPE_PATTERN.sub("-", "\n".join(bodies))
+        buffer = ESCAPE_SEQUENCE_PATTERN.sub(escaped_character, buffer).encode("ascii")
+        decoded = iter(buffer.translate(None, IBM866_DELETE_TABLE).decode("ascii").split("\n"))
+    return [next(decoded) if ok else decode_customer_id(x) for x, ok in zip(literals, valid)]
+
+def decode_customer_ids(values):
+    """Decode and clean a Series of customer IDs, memoizing repeated IDs."""
+    codes, uniques = pd.factorize(values)
+    if len(decoded_customer_ids) + len(uniques) > DECODED_ID_MEMO_LIMIT:
+        decoded_customer_ids.clear()
+    pending = [u for u in uniques if u not in decoded_customer_ids]
+    if pending:
+        decoded_customer_ids.update(zip(pending, decode_literal_batch(pending)))
+    # The trailing None is picked up by the -1 code pandas assigns to missing values
+    lookup = np.array([decoded_customer_ids[u] for u in uniques] + [None], dtype=object)
+    return pd.Series(lookup[codes], index=values.index, name=values.name)
 
 # Step 2: Processing Functions
 def decode_and_clean_customer_ids(df):
     """Apply decoding and cleaning transformations to the 'customer_id' column."""
-    df["customer_id"] = df["customer_id"].apply(convert_to_bytes)
-    df["customer_id"] = df["customer_id"].apply(lambda x: decode_ibm866(x))
-    df["customer_id"] = df["customer_id"].apply(clean_customer_id)
-    df["customer_id"] = df["customer_id"].str.replace(r"[^\x00-\x7F]+", "", regex=True)
-    df["customer_id"] = df["customer_id"].str.replace("�", "", regex=False)
-    df["customer_id"] = df["customer_id"].str.replace("-", "", regex=False)
-    df["customer_id"] = df["customer_id"].str.replace("_", "", regex=False)
+    df["customer_id"] = decode_customer_ids(df["customer_id"])
     return df
 
+@instrumented()
 def clean_data(data):
     if not isinstance(data, pd.DataFrame):
         df = pd.DataFrame(data)
@@ -119,63 +163,70 @@ def clean_data(data):
     return df
 
 
-def handle_missing_values(customer, loan):
+@instrumented()
+def handle_missing_customer_values(customer):
     customer.dropna(subset=["customer_id"], inplace=True)
-    loan.dropna(subset=["loan_id", "customer_id"], inplace=True)
     customer["emp_length"] = customer["emp_length"].fillna("Unknown")
-    return customer, loan
+    return customer
 
+@instrumented()
+def handle_missing_loan_values(loan):
+    loan.dropna(subset=["loan_id", "customer_id"], inplace=True)
+    return loan
+
+def handle_missing_values(customer, loan):
+    return handle_missing_customer_values(customer), handle_missing_loan_values(loan)
 
-def replace_na_values(datasets):
+
+@instrumented()
+def replace_na_values(datasets, number_columns=()):
+    # One pass per string column; columns in number_columns keep only their digits, as Float64
     for df in datasets:
-        df.replace(["n/a", ""], pd.NA, inplace=True)
+        clean_text_columns(df, number_columns)
     return datasets
 
+@instrumented()
 def normalize_columns(df):
-    df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
+    df.columns = normalize_names(df.columns)
     return df
 
-def rename_columns(customer, loan, state_region):
-    """Rename columns for consistency across datasets."""
-    customer.rename(
-        columns={
-            "emp_length": "employment_length",
-            "avg_cur_bal": "average_current_balance",
-            "tot_cur_bal": "total_current_balance",
-            "addr_state": "state",
-            "emp_title": "employee_title",
-            "annual_inc": "annual_income",
-            "annual_inc_joint": "annual_joint_income",
-        },
-        inplace=True,
-    )
+customer_column_renames = {
+    "emp_length": "employment_length",
+    "avg_cur_bal": "average_current_balance",
+    "tot_cur_bal": "total_current_balance",
+    "addr_state": "state",
+    "emp_title": "employee_title",
+    "annual_inc": "annual_income",
+    "annual_inc_joint": "annual_joint_income",
+}
 
-    loan.rename(
-        columns={
-            "term": "loan_term",
-            "int_rate": "interest_rate",
-            "pymnt_plan": "payment_plan",
-        },
-        inplace=True,
-    )
+loan_column_renames = {
+    "term": "loan_term",
+    "int_rate": "interest_rate",
+    "pymnt_plan": "payment_plan",
+}
 
-    state_region.rename(columns={"subregion": "sub_region"}, inplace=True)
+state_region_column_renames = {"subregion": "sub_region"}
 
+def rename_columns(customer, loan, state_region):
+    """Rename columns for consistency across datasets."""
+    customer.rename(columns=customer_column_renames, inplace=True)
+    loan.rename(columns=loan_column_renames, inplace=True)
+    state_region.rename(columns=state_region_column_renames, inplace=True)
     return customer, loan, state_region
 
+@instrumented()
 def clean_loan_data(loan):
-    loan["loan_term"] = loan["loan_term"].str.extract(r"(\d+)").astype(float)
-
-    # Convert interest_rate to numeric, handling errors
-    loan["interest_rate"] = pd.to_numeric(loan["interest_rate"], errors="coerce")
+    # loan_term was reduced to its number of months while replacing the NA placeholders
 
-    # Replace NaN values in interest_rate and loan_term with 'Unknown'
-    loan["interest_rate"] = loan["interest_rate"].fillna("Unknown")
-    loan["loan_term"] = loan["loan_term"].fillna("Unknown")
+    # Convert interest_rate to numeric, handling errors; missing values stay NA so
+    # both columns remain numeric instead of mixing in 'Unknown' strings
+    loan["interest_rate"] = pd.to_numeric(loan["interest_rate"], errors="coerce").astype("Float64")
 
     return loan
 
 # Drop Unnecessary Columns
+@instrumented()
 def drop_unnecessary_columns(loan):
     """Drop specified columns from the loan dataset."""
     columns_to_drop = ["notes", "issue_d"]
@@ -183,113 +234,274 @@ def drop_unnecessary_columns(loan):
     return loan
 
 # Convert Columns to Numeric
-def convert_to_numeric(customer, loan):
+@instrumented()
+def convert_customer_to_numeric(customer):
     customer["annual_income"] = pd.to_numeric(customer["annual_income"], errors="coerce")
+    return customer
+
+@instrumented()
+def convert_loan_to_numeric(loan):
     loan["interest_rate"] = pd.to_numeric(loan["interest_rate"], errors="coerce")
-    return customer, loan
+    return loan
 
+def convert_to_numeric(customer, loan):
+    return convert_customer_to_numeric(customer), convert_loan_to_numeric(loan)
+
+# Per-dataset cleaning pipelines; they work on whole frames as well as on streamed chunks
+def clean_customers(customer):
+    customer = handle_missing_customer_values(clean_data(customer))
+    customer = normalize_columns(replace_na_values([customer])[0])
+    customer.rename(columns=customer_column_renames, inplace=True)
+    return convert_customer_to_numeric(customer)
+
+def clean_loans(loan):
+    loan = handle_missing_loan_values(clean_data(loan))
+    loan = normalize_columns(replace_na_values([loan], number_columns=["term"])[0])
+    loan.rename(columns=loan_column_renames, inplace=True)
+    loan = drop_unnecessary_columns(clean_loan_data(loan))
+    return convert_loan_to_numeric(loan)
+
+def clean_lookup(df):
+    return normalize_columns(replace_na_values([df])[0])
+
+def clean_state_region(state_region):
+    state_region = clean_lookup(state_region)
+    state_region.rename(columns=state_region_column_renames, inplace=True)
+    return state_region
+
+# Input dataset -> (output table, cleaning pipeline, whether it can be streamed in chunks)
+dataset_pipelines = {
+    "customers": ("customer_data", clean_customers, True),
+    "loan_data": ("loan_data", clean_loans, True),
+    "loan_with_region": ("loan_with_region", clean_lookup, False),
+    "loan_purposes": ("loan_purposes", clean_lookup, False),
+    "state_with_region": ("state_with_region", clean_state_region, False),
+    "loan_count_yearwise": ("loan_count_yearwise", clean_lookup, False),
+}
+
+@instrumented()
 def save_to_db(df, table_name, schema="loans"):
     try:
-        with engine.connect() as connection:
-            df.to_sql(
-                name=table_name,
-                con=connection,
-                schema=schema,
-                if_exists="replace",
-                index=False
-            )
+        copy_dataframe(df, table_name, get_engine(), schema=schema)
         print(f"Table '{table_name}' saved to database successfully.")
         write_file(df, output_datasets[table_name])
+        write_staged(df, table_name, layer="clean")
     except Exception as e:
         print(f"Error saving DataFrame: {e}")
-
-
-def main():
+        raise
+
+
+class ChunkSink:
+    """
+    Append cleaned chunks to the database table, the post-processing CSV and the
+    staged Parquet parts, holding no more than one chunk in memory. A sink for one
+    partition writes that partition's CSV and Parquet parts and leaves the database alone.
+    """
+    def __init__(self, table_name, schema="loans", column_types=None, partition=None):
+        self.table_name = table_name
+        self.schema = schema
+        self.partition = partition
+        self.loader = None
+        if partition is None:
+            self.loader = CopyLoader(get_engine(), table_name, schema=schema, column_types=column_types)
+            self.csv_key = output_datasets[table_name]
+        else:
+            self.csv_key = partitioned_key(output_datasets[table_name], partition)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, f"{table_name}.csv")
+        self.parts = []
+        self.part_hashes = []
+        self.rows = 0
+        self.columns = {}
+
+    def append(self, chunk):
+        first_chunk = not self.parts
+        if self.loader is not None:
+            self.loader.write(chunk)
+        chunk.to_csv(self.csv_path, mode="a", header=first_chunk, index=False)
+        self.parts.append(write_staged_part(chunk, self.table_name, len(self.parts), partition=self.partition))
+        self.part_hashes.append(frame_hash(chunk))
+        self.rows += len(chunk)
+        # Chunks infer their types separately, e.g. int64 until one has a null
+        self.columns = merge_column_dtypes([self.columns, chunk.dtypes.to_dict()])
+
+    def close(self):
+        if self.loader is not None:
+            self.loader.commit()
+        # upload_file streams the local CSV to S3 as a multipart upload
+        boto3.client("s3").upload_file(self.csv_path, S3_BUCKET, self.csv_key)
+        entry = {
+            "parts": self.parts,
+            "content_hash": frame_hash(pd.DataFrame({"part_hash": self.part_hashes})),
+            "rows": self.rows,
+            "columns": self.columns
+        }
+        if self.partition is None:
+            register_staged(self.table_name, entry, layer="clean")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        label = self.table_name if self.partition is None else f"{self.table_name}/{self.partition}"
+        print(f"Table '{label}' saved in {len(self.parts)} chunks ({self.rows} rows).")
+        return entry
+
+    def abort(self):
+        if self.loader is not None:
+            self.loader.abort()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def stream_dataset(dataset_name, table_name, clean_chunk, chunk_size):
+    sink = ChunkSink(table_name)
     try:
-        # Load original files for auxiliary datasets
-        customer_data = read_file(input_datasets['customers'])
-        loan_data = read_file(input_datasets['loan_data'])
-        loan_count_by_year = read_file(input_datasets['loan_count_yearwise'])
-        loan_purpose = read_file(input_datasets['loan_purposes'])
-        loan_with_region = read_file(input_datasets['loan_with_region'])
-        state_region = read_file(input_datasets['state_with_region'])
-        decoded_customer_data = clean_data(customer_data)
-        decoded_loan_data = clean_data(loan_data)
-        print("Data loaded successfully.")
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        return
-
+        for chunk in iter_staged(dataset_name, chunk_size, layer="raw", fallback_key=input_datasets[dataset_name]):
+            sink.append(clean_chunk(chunk))
+        sink.close()
+    except Exception:
+        sink.abort()
+        raise
+
+
+def clean_partition(dataset_name, table_name, partition, clean, chunk_size=0):
+    """Clean one raw partition into the same partition of the cleaned table and return its entry."""
+    if chunk_size > 0:
+        chunks = iter_staged(dataset_name, chunk_size, layer="raw", partitions=[partition])
+    else:
+        chunks = [read_file(dataset_name, partitions=[partition])]
+    sink = ChunkSink(table_name, partition=partition)
     try:
-        customer_data, loan_data = handle_missing_values(decoded_customer_data, decoded_loan_data)
-        print("Missing values handled.")
-    except Exception as e:
-        print(f"Error handling missing values: {e}")
-        return
+        for chunk in chunks:
+            sink.append(clean(chunk))
+        return sink.close()
+    except Exception:
+        sink.abort()
+        raise
 
-    try:
-        datasets = [customer_data, loan_data, loan_count_by_year, loan_purpose, loan_with_region, state_region]
-        datasets = replace_na_values(datasets)
-        customer_data, loan_data, loan_count_by_year, loan_purpose, loan_with_region, state_region = datasets
-        print("Replaced 'n/a' and empty strings with NaN.")
-    except Exception as e:
-        print(f"Error replacing 'n/a' values: {e}")
-        return
 
+def load_partitions_to_db(table_name, partitions, chunk_size=0, schema="loans", column_types=None):
+    """Reload a table from its staged clean partitions, swapping it in once all are copied."""
+    loader = CopyLoader(get_engine(), table_name, schema=schema, column_types=column_types)
     try:
-        customer_data = normalize_columns(customer_data)
-        loan_data = normalize_columns(loan_data)
-        loan_count_by_year = normalize_columns(loan_count_by_year)
-        loan_purpose = normalize_columns(loan_purpose)
-        loan_with_region = normalize_columns(loan_with_region)
-        state_region = normalize_columns(state_region)
-        print("Column names normalized.")
-    except Exception as e:
-        print(f"Error normalizing column names: {e}")
-        return
+        for partition in partitions:
+            if chunk_size > 0:
+                for chunk in iter_staged(table_name, chunk_size, layer="clean", partitions=[partition]):
+                    loader.write(chunk)
+            else:
+                loader.write(read_staged(table_name, layer="clean", partitions=[partition]))
+        loader.commit()
+    except Exception:
+        loader.abort()
+        raise
+    print(f"Table '{table_name}' loaded from {len(partitions)} partitions ({loader.rows} rows).")
+
+
+def clean_partitioned_dataset(dataset_name, table_name, clean, chunk_size=0, forced=()):
+    """
+    Clean the new, changed and explicitly requested partitions of a partitioned dataset, each
+    independently, drop the outputs of partitions that no longer exist, and reload the table.
+    A clean partition records the hash of the raw partition it was built from.
+    """
+    raw_partitions = load_manifest("raw", refresh=True)[dataset_name]["partitions"]
+    previous = (load_manifest("clean", refresh=True).get(table_name) or {}).get("partitions", {})
+    partitions = {name: entry for name, entry in previous.items() if name in raw_partitions}
+
+    s3 = boto3.client("s3")
+    for name in sorted(set(previous) - set(raw_partitions)):
+        for key in entry_keys(previous[name]) + [partitioned_key(output_datasets[table_name], name)]:
+            s3.delete_object(Bucket=S3_BUCKET, Key=key)
+        print(f"Removed partition '{name}' of '{table_name}'.")
+
+    for name, raw_entry in sorted(raw_partitions.items()):
+        if name not in forced and partitions.get(name, {}).get("source_hash") == raw_entry["content_hash"]:
+            continue
+        partitions[name] = {
+            **clean_partition(dataset_name, table_name, name, clean, chunk_size),
+            "source_hash": raw_entry["content_hash"]
+        }
+        print(f"Partition '{name}' of '{dataset_name}' cleaned.")
+
+    # A column can be int64 in one partition and float64 in another that has nulls
+    columns = merge_column_dtypes(entry["columns"] for entry in partitions.values())
+    register_staged(table_name, {
+        "partitions": partitions,
+        "content_hash": combine_hashes({name: entry["content_hash"] for name, entry in partitions.items()}),
+        "rows": sum(entry["rows"] for entry in partitions.values()),
+        "columns": columns
+    }, layer="clean")
+    column_types = {col: map_dtype_to_pg(dtype) for col, dtype in columns.items()}
+    load_partitions_to_db(table_name, sorted(partitions), chunk_size, column_types=column_types)
+
+
+def read_and_clean(dataset_name, clean):
+    with timed_step(f"read:{dataset_name}") as step:
+        data = read_file(dataset_name)
+        step["rows_out"] = len(data)
+    return clean(data)
+
+
+def clean_cached(dataset_name, clean):
+    """Clean a whole dataset, or reuse the cleaned frame cached for the same input and code."""
+    return cached_frame(
+        get_stage_cache(), f"clean:{dataset_name}", input_hash(staged_hash(dataset_name)), CODE_VERSION,
+        lambda: read_and_clean(dataset_name, clean)
+    )
 
-    try:
-        customer_data, loan_data, state_region = rename_columns(customer_data, loan_data, state_region)
-        print("Columns renamed for consistency.")
-    except Exception as e:
-        print(f"Error renaming columns: {e}")
-        return
 
+def find_changed_datasets():
+    connection = get_engine().raw_connection()
     try:
-        loan_data = clean_loan_data(loan_data)
-        print("Loan data cleaned.")
-    except Exception as e:
-        print(f"Error cleaning loan data: {e}")
-        return
-
+        cursor = connection.cursor()
+        pending = changed_datasets(cursor, dataset_pipelines, RDS_SCHEMA, skip_quarantined=True)
+        cursor.close()
+    finally:
+        connection.close()
+    return pending
+
+
+def main(chunk_size=0, forced_partitions=()):
+    """
+    Clean every dataset whose input changed since the last successful run.
+    With chunk_size > 0, customers and loans are streamed so peak memory follows chunk_size.
+    Partitioned datasets are cleaned partition by partition, together with any partitions
+    named in forced_partitions.
+    Errors are re-raised so the job run fails and the state machine stops before the
+    transformations mark the inputs as processed; a failed dataset is cleaned again next run.
+    """
     try:
-        loan_data = drop_unnecessary_columns(loan_data)
-        print("Unnecessary columns dropped.")
+        with timed_step("find_changed_datasets"):
+            pending = find_changed_datasets()
     except Exception as e:
-        print(f"Error dropping unnecessary columns: {e}")
+        print(f"Error checking dataset fingerprints: {e}")
+        raise
+    pending += [
+        name for name in dataset_pipelines
+        if name not in pending and set(forced_partitions) & set(staged_partitions(name, "raw"))
+    ]
+    if not pending:
+        print("No dataset changed since the last successful run, nothing to clean.")
         return
 
-    try:
-        customer_data, loan_data = convert_to_numeric(customer_data, loan_data)
-        print("Columns converted to numeric.")
-    except Exception as e:
-        print(f"Error converting columns to numeric: {e}")
-        return
-    
-    try:
-        save_to_db(customer_data, "customer_data", schema="loans")
-        save_to_db(loan_data, "loan_data", schema="loans")
-        save_to_db(loan_with_region, "loan_with_region", schema="loans")
-        save_to_db(loan_purpose, "loan_purposes", schema="loans")
-        save_to_db(state_region, "state_with_region", schema="loans")
-        save_to_db(loan_count_by_year, "loan_count_yearwise", schema="loans")
-        print("Cleaned data saved to database.")
-    except Exception as e:
-        print(f"Error saving data to database: {e}")
-        return
+    for dataset_name in pending:
+        table_name, clean, streamable = dataset_pipelines[dataset_name]
+        try:
+            with timed_step(f"clean:{dataset_name}"):
+                if staged_partitions(dataset_name, "raw"):
+                    clean_partitioned_dataset(
+                        dataset_name, table_name, clean, chunk_size if streamable else 0, forced_partitions
+                    )
+                elif chunk_size > 0 and streamable:
+                    stream_dataset(dataset_name, table_name, clean, chunk_size)
+                else:
+                    save_to_db(clean_cached(dataset_name, clean), table_name, schema="loans")
+            print(f"Dataset '{dataset_name}' cleaned.")
+        except Exception as e:
+            print(f"Error cleaning dataset '{dataset_name}': {e}")
+            raise
 
     print("Data processing completed successfully.")
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main(get_chunk_size(), get_partitions())
+    finally:
+        close_all()
+        print_summary()
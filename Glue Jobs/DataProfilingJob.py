@@ -1,59 +1,64 @@
-import boto3
-from botocore.exceptions import ClientError
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import numpy as np
 import datetime
-import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
 import great_expectations as gx
 from great_expectations.core import ExpectationConfiguration
 from great_expectations.core.expectation_configuration import ExpectationConfiguration
 from great_expectations.exceptions import InvalidExpectationConfigurationError
+from job_args import optional_arg
+from staging import read_staged, iter_staged, staged_hash
+from fingerprints import changed_datasets
+from instrumentation import timed_step, print_summary
+from connections import connection_params, get_pool, return_connection, close_all
+import column_stats
+from column_stats import compute_column_stats, compute_chunked_stats
+from stage_cache import get_stage_cache, cached_json, code_version, input_hash
 
 
-def get_secret():
-    secret_name = "db-secret"
-    region_name = "us-east-1"
-    session = boto3.session.Session()
-    client = session.client(
-        service_name="secretsmanager",
-        region_name=region_name
-    )
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-        secret = get_secret_value_response["SecretString"]
-        return json.loads(secret)
-    except ClientError as e:
-        print(f"Error Occurred: {e}")
-        return None
-
-
-secret = get_secret()
-RDS_HOST = secret["host"]
-RDS_PORT = int(secret["port"])
-RDS_USER = secret["username"]
-RDS_PASSWORD = secret["password"]
 RDS_DB = "fintech"
 RDS_SCHEMA = "loans"
 S3_BUCKET = "source-system-754"
 GX_BUCKET = "project-utility-754"
+# Profiling is dominated by S3 and RDS round trips, so datasets run on threads
+MAX_PROFILING_WORKERS = 6
+# With --CHUNK_SIZE each dataset is profiled in chunks of this many rows; 0 reads it whole
+CHUNK_SIZE = int(optional_arg("CHUNK_SIZE", 0))
+# Cached rules are reused only while the profiling code is unchanged
+CODE_VERSION = code_version(__file__, column_stats)
 
-# Read the CSV files from S3
-def read_file(file_path):
-    path = f"s3://{S3_BUCKET}/{file_path}"
-    return pd.read_csv(path)
+# Read the staged Parquet copy of a dataset
+def read_file(dataset_name, file_path, columns=None):
+    return read_staged(dataset_name, columns=columns, fallback_key=file_path)
 
 # Connect to RDS
 def connect_rds():
-    return psycopg2.connect(
-        host=RDS_HOST,
-        port=RDS_PORT,
-        user=RDS_USER,
-        password=RDS_PASSWORD,
-        database=RDS_DB
-    )
+    return psycopg2.connect(**connection_params(RDS_DB))
+
+# One pooled RDS connection per worker thread, returned to the pool once all datasets are profiled
+worker_state = threading.local()
+worker_connections = []
+worker_connections_lock = threading.Lock()
+
+def get_worker_connection():
+    if getattr(worker_state, "conn", None) is None:
+        pool = get_pool(RDS_DB, maxconn=MAX_PROFILING_WORKERS)
+        worker_state.conn = pool.getconn()
+        with worker_connections_lock:
+            worker_connections.append((pool, worker_state.conn))
+    return worker_state.conn
+
+def close_worker_connections():
+    with worker_connections_lock:
+        # Each connection goes back to the pool it came from, which a rotation may have replaced
+        for pool, conn in worker_connections:
+            # Nothing left uncommitted goes back to the pool
+            conn.rollback()
+            return_connection(pool, conn)
+        worker_connections.clear()
 
 # Fetch metadata for a dataset
 def get_dataset_metadata(cursor, dataset_name):
@@ -68,25 +73,24 @@ def get_dataset_metadata(cursor, dataset_name):
     )
     return cursor.fetchall()
 
-# Generate validation rules
-def generate_validation_rules(data, column_name, column_metadata):
-    col_data = data[column_name]
+# Generate validation rules from the single-pass column statistics
+def generate_validation_rules(col_stats, column_metadata):
     rules = []
 
-    if not col_data.isnull().any():
+    if not col_stats.nullable:
         rules.append({"rule": "expect_column_values_to_not_be_null"})
 
-    if column_metadata.get("unique", False) or col_data.is_unique:
+    if column_metadata.get("unique", False) or col_stats.is_unique:
         rules.append({"rule": "expect_column_values_to_be_unique"})
 
-    if pd.api.types.is_numeric_dtype(col_data):
+    if col_stats.is_numeric:
         rules.append({
             "rule": "expect_column_values_to_be_between",
-            "min": col_data.min(),
-            "max": col_data.max()
+            "min": col_stats.minimum,
+            "max": col_stats.maximum
         })
 
-    if pd.api.types.is_string_dtype(col_data):
+    if col_stats.is_string:
         rules.append({
             "rule": "expect_column_values_to_match_regex",
             "regex": "^[A-Za-z0-9_\\s]*$"
@@ -209,55 +213,105 @@ def add_column_rules_to_suite(suite, column_name, column_rules):
             print(f"Invalid expectation for column '{column_name}': {str(e)}. Skipping this rule.")
 
 
-def update_validation_rules_in_rds(cursor, column_rules, column_name, dataset_name, schema):
-    column_rules_serializable = json.dumps(column_rules, default=convert_to_serializable)
-    cursor.execute(
+def get_dataset_id(cursor, dataset_name, schema):
+    cursor.execute(f"SELECT dataset_id FROM {schema}.datasets WHERE dataset_name = %s;", (dataset_name,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def update_validation_rules_in_rds(cursor, rules_by_column, dataset_name, schema):
+    """Write the rules of every column of a dataset with one UPDATE ... FROM (VALUES ...)."""
+    dataset_id = get_dataset_id(cursor, dataset_name, schema)
+    if dataset_id is None or not rules_by_column:
+        return
+    execute_values(
+        cursor,
         f"""
-        UPDATE {schema}.columns
-        SET validation_rules = %s
-        WHERE column_name = %s AND (SELECT dataset_id FROM {schema}.datasets WHERE dataset_name = %s) = dataset_id;
+        UPDATE {schema}.columns AS c
+        SET validation_rules = v.validation_rules::jsonb
+        FROM (VALUES %s) AS v (dataset_id, column_name, validation_rules)
+        WHERE c.dataset_id = v.dataset_id AND c.column_name = v.column_name;
         """,
-        (column_rules_serializable, column_name, dataset_name)
+        [
+            (dataset_id, column_name, json.dumps(column_rules, default=convert_to_serializable))
+            for column_name, column_rules in rules_by_column.items()
+        ],
+        page_size=len(rules_by_column)
     )
 
 
-def process_columns(data, column_metadata, suite, cursor, dataset_name, schema):
-    for col in column_metadata:
-        column_name = col[0]
-        column_rules = generate_validation_rules(data, column_name, {
+def generate_rules(stats, column_metadata):
+    return {
+        col[0]: generate_validation_rules(stats[col[0]], {
             "data_type": col[1],
             "nullable": col[2],
             "uniqueness": col[3]
         })
+        for col in column_metadata
+    }
 
+
+def process_columns(rules_by_column, suite, cursor, dataset_name, schema):
+    for column_name, column_rules in rules_by_column.items():
         print(f"Adding rules for column: {column_name}")
         add_column_rules_to_suite(suite, column_name, column_rules)
-        update_validation_rules_in_rds(cursor, column_rules, column_name, dataset_name, schema)
-
-
-def profile_dataset(dataset_name, s3_key, conn):
-    data = read_file(s3_key)
 
-    # Fetch metadata from RDS
-    cursor = conn.cursor()
-    column_metadata = get_dataset_metadata(cursor, dataset_name)
-
-    # Initialize Great Expectations context
-    context = initialize_context(GX_BUCKET)
+    update_validation_rules_in_rds(cursor, rules_by_column, dataset_name, schema)
 
-    # Create or fetch the expectation suite
-    suite = get_or_create_expectation_suite(context, suite_name=dataset_name)
 
-    # Process columns and update validation rules
-    process_columns(data, column_metadata, suite, cursor, dataset_name, RDS_SCHEMA)
+def profile_columns(dataset_name, s3_key, column_metadata):
+    # Only the columns registered in the metadata are profiled
+    columns = [col[0] for col in column_metadata] or None
+    if CHUNK_SIZE:
+        # Column stats merge across chunks, so only one chunk is in memory at a time
+        with timed_step(f"profile_columns:{dataset_name}") as step:
+            stats = compute_chunked_stats(iter_staged(dataset_name, CHUNK_SIZE, columns=columns, fallback_key=s3_key))
+            step["rows_in"] = next(iter(stats.values())).rows if stats else 0
+            return generate_rules(stats, column_metadata)
+    with timed_step(f"read:{dataset_name}") as step:
+        data = read_file(dataset_name, s3_key, columns=columns)
+        step["rows_out"] = len(data)
+    with timed_step(f"profile_columns:{dataset_name}", rows_in=len(data)):
+        return generate_rules(compute_column_stats(data), column_metadata)
 
-    # Save the expectation suite and build data docs
-    context.save_expectation_suite(suite)
-    context.build_data_docs()
 
-    # Commit changes and close the cursor
-    conn.commit()
-    cursor.close()
+def profile_dataset(dataset_name, s3_key, conn, context=None):
+    try:
+        with conn.cursor() as cursor:
+            # Fetch metadata from RDS
+            column_metadata = get_dataset_metadata(cursor, dataset_name)
+
+            # Rules generated earlier from the same content, metadata and code are reused
+            rules_by_column = cached_json(
+                get_stage_cache(), f"profile:{dataset_name}", input_hash(staged_hash(dataset_name), column_metadata),
+                CODE_VERSION, lambda: profile_columns(dataset_name, s3_key, column_metadata), default=convert_to_serializable
+            )
+
+            # Initialize Great Expectations context unless a shared one is passed in
+            build_docs = context is None
+            if context is None:
+                context = initialize_context(GX_BUCKET)
+
+            # Create or fetch the expectation suite
+            suite = get_or_create_expectation_suite(context, suite_name=dataset_name)
+
+            # Add the rules to the suite and store them in RDS
+            process_columns(rules_by_column, suite, cursor, dataset_name, RDS_SCHEMA)
+
+            # Save the expectation suite; a shared context builds data docs once for all datasets
+            with timed_step(f"save_suite:{dataset_name}"):
+                context.save_expectation_suite(suite)
+                if build_docs:
+                    context.build_data_docs()
+
+        conn.commit()
+    except Exception:
+        # The worker's connection is reused for its next dataset, so the failed transaction is discarded
+        conn.rollback()
+        raise
+
+def profile_in_worker(dataset_name, s3_key, context):
+    profile_dataset(dataset_name, s3_key, get_worker_connection(), context)
 
 def main():
     datasets = {
@@ -268,11 +322,37 @@ def main():
         "customers": "active-processing/customers.csv",
         "loan_data": "active-processing/loan_data.csv"
     }
-    conn = connect_rds()
-    for dataset_name, s3_key in datasets.items():
-        profile_dataset(dataset_name, s3_key, conn)
-    conn.close()
+    with timed_step("find_changed_datasets"):
+        conn = connect_rds()
+        cursor = conn.cursor()
+        pending = changed_datasets(cursor, datasets, RDS_SCHEMA)
+        cursor.close()
+        conn.close()
+    if not pending:
+        print("No dataset changed since the last successful run, nothing to profile.")
+        return
+
+    # Datasets are profiled concurrently against one shared GX context
+    context = initialize_context(GX_BUCKET)
+    try:
+        with ThreadPoolExecutor(max_workers=min(MAX_PROFILING_WORKERS, len(pending))) as executor:
+            futures = {
+                executor.submit(profile_in_worker, dataset_name, datasets[dataset_name], context): dataset_name
+                for dataset_name in pending
+            }
+            for future in as_completed(futures):
+                future.result()
+                print(f"Profiled dataset: {futures[future]}")
+    finally:
+        close_worker_connections()
+
+    with timed_step("build_data_docs"):
+        context.build_data_docs()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        close_all()
+        print_summary()
\ No newline at end of file
@@ -1,57 +1,43 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
-from botocore.exceptions import ClientError
-import psycopg2
-import pandas as pd
 import json
-import great_expectations as gx
 from datetime import datetime
-from great_expectations.core.batch import RuntimeBatchRequest
-
-# Fetch secret from AWS Secrets Manager
-def get_secret():
-    secret_name = "db-secret"
-    region_name = "us-east-1"
-    session = boto3.session.Session()
-    client = session.client(
-        service_name="secretsmanager",
-        region_name=region_name
-    )
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-        secret = get_secret_value_response["SecretString"]
-        return json.loads(secret)
-    except ClientError as e:
-        print(f"Error Occurred: {e}")
-        return None
-
-
-# Database connection parameters
-secret = get_secret()
-RDS_HOST = secret["host"]
-RDS_PORT = int(secret["port"])
-RDS_USER = secret["username"]
-RDS_PASSWORD = secret["password"]
+from staging import read_staged, iter_staged, staged_hash
+from fingerprints import changed_datasets, quarantined_datasets, record_quality_status
+from instrumentation import timed_step, print_summary
+from connections import pooled_connection, close_all
+from job_args import optional_arg
+import rule_evaluator
+from rule_evaluator import compile_rules, evaluate_rules, evaluate_chunks
+from stage_cache import get_stage_cache, cached_json, code_version, input_hash
+from quality_gate import load_thresholds, dataset_verdict, gate_verdict, quarantine_dataset
+
 RDS_DB = "fintech"
 RDS_SCHEMA = "loans"
 S3_BUCKET = "source-system-754"
 GX_BUCKET = "project-utility-754"
+SUITE_PREFIX = "expectations/"
+RESULTS_PREFIX = "validation_results/"
+# Verdict of the latest run, read by the QualityGate Choice state of the state machine
+VERDICT_KEY = f"{RESULTS_PREFIX}verdict.json"
+# Suites downloaded by earlier runs on the same host, kept with the ETag they were fetched at
+SUITE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "gx_suites")
+# Validation is dominated by reading and checking independent datasets, so they run on threads
+MAX_VALIDATION_WORKERS = 4
+# "native" evaluates the rules stored in loans.columns directly; "gx" runs the Great Expectations suites
+VALIDATION_ENGINE = optional_arg("VALIDATION_ENGINE", "native")
+# With --CHUNK_SIZE the native engine streams each dataset in chunks of this many rows; 0 reads it whole
+CHUNK_SIZE = int(optional_arg("CHUNK_SIZE", 0))
+# JSON object overriding entries of quality_gate.RULE_THRESHOLDS
+QUALITY_THRESHOLDS = optional_arg("QUALITY_THRESHOLDS")
+# Cached reports are reused only while this code is unchanged
+CODE_VERSION = code_version(__file__, rule_evaluator)
 
-# Read the CSV files from S3
-def read_file(file_path):
-    path = f"s3://{S3_BUCKET}/{file_path}"
-    return pd.read_csv(path)
-
-# Connect to RDS
-def connect_rds():
-    return psycopg2.connect(
-        host=RDS_HOST,
-        port=RDS_PORT,
-        user=RDS_USER,
-        password=RDS_PASSWORD,
-        database=RDS_DB
-    )
+# Read the staged Parquet copy of a dataset
+def read_file(dataset_name, file_path, columns=None):
+    return read_staged(dataset_name, columns=columns, fallback_key=file_path)
 
 # Fetch validation rules for a dataset
 def fetch_validation_rules(cursor, dataset_name):
@@ -66,57 +52,13 @@ def fetch_validation_rules(cursor, dataset_name):
     )
     return cursor.fetchall()
 
-# Fetch the dataset from S3
-def fetch_dataset_from_s3(s3_key):
-    path = f"s3://{S3_BUCKET}/{s3_key}"
-    data = pd.read_csv(path)
-    return data
-
-def validate_dataset(dataset_name, dataset, context):
-    runtime_batch_request = RuntimeBatchRequest(
-        datasource_name="my_data",
-        data_connector_name="default_runtime_data_connector_name",
-        data_asset_name=dataset_name,  
-        runtime_parameters={"batch_data": dataset},  
-        batch_identifiers={"default_identifier_name": "default"} 
-    )
-
-    # Create a Validator object using the RuntimeBatchRequest
-    validator = context.get_validator(batch_request=runtime_batch_request, expectation_suite_name=dataset_name)
-
-    # Run validation
-    results = validator.validate()
-    return results
-
-def save_validation_results_to_s3(results, dataset_name):
-    s3 = boto3.client("s3")
-    result_key = f"validation_results/{dataset_name}_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    s3.put_object(
-        Bucket=GX_BUCKET,
-        Key=result_key,
-        Body=json.dumps(results.to_json_dict(), indent=4),
-        ContentType="application/json"
-    )
-    print(f"Validation results saved to s3://{GX_BUCKET}/{result_key}")
-
+# Fetch the staged dataset from S3
+def fetch_dataset_from_s3(dataset_name, s3_key):
+    return read_file(dataset_name, s3_key)
 
-def main():
-    # Dataset configuration
-    datasets = {
-        "state_with_region": "active-processing/state_region.csv",
-        "loan_count_yearwise": "active-processing/loan_count_yearwise.csv",
-        "loan_purposes": "active-processing/loan_purposes.csv",
-        "loan_with_region": "active-processing/loan_with_region.csv",
-        "customers": "active-processing/customers.csv",
-        "loan_data": "active-processing/loan_data.csv"
-    }
-
-    # Connect to RDS
-    conn = connect_rds()
-    cursor = conn.cursor()
-
-    # Initialize Great Expectations context
-    context = gx.data_context.BaseDataContext(
+def initialize_context(bucket_name):
+    import great_expectations as gx
+    return gx.data_context.BaseDataContext(
         project_config={
             "config_version": 3,
             "datasources": {
@@ -138,7 +80,7 @@ def main():
                     "class_name": "ExpectationsStore",
                     "store_backend": {
                         "class_name": "TupleS3StoreBackend",
-                        "bucket": GX_BUCKET,
+                        "bucket": bucket_name,
                         "prefix": "expectations/"
                     }
                 },
@@ -146,7 +88,7 @@ def main():
                     "class_name": "ValidationsStore",
                     "store_backend": {
                         "class_name": "TupleS3StoreBackend",
-                        "bucket": GX_BUCKET,
+                        "bucket": bucket_name,
                         "prefix": "validations/"
                     }
                 },
@@ -159,7 +101,7 @@ def main():
                     "class_name": "SiteBuilder",
                     "store_backend": {
                         "class_name": "TupleS3StoreBackend",
-                        "bucket": GX_BUCKET,
+                        "bucket": bucket_name,
                         "prefix": "data_docs/"
                     },
                     "site_index_builder": {
@@ -174,27 +116,217 @@ def main():
         }
     )
 
-    # Validate each dataset
-    for dataset_name, s3_key in datasets.items():
-        print(f"Validating dataset: {dataset_name}")
+def load_suites(suite_names, bucket=GX_BUCKET, cache_dir=SUITE_CACHE_DIR):
+    """
+    Fetch the JSON of the expectation suites once per run instead of once per validator.
+    A single listing gives every suite's ETag, and suites whose ETag matches the copy in
+    cache_dir are read locally. Suites that do not exist yet are left out.
+    """
+    s3 = boto3.client("s3")
+    etags = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=SUITE_PREFIX):
+        for obj in page.get("Contents", []):
+            etags[obj["Key"]] = obj["ETag"].strip('"')
 
-        # Fetch dataset
-        dataset = fetch_dataset_from_s3(s3_key)
+    os.makedirs(cache_dir, exist_ok=True)
+    suites = {}
+    for suite_name in suite_names:
+        key = f"{SUITE_PREFIX}{suite_name}.json"
+        if key not in etags:
+            continue
+        local_path = os.path.join(cache_dir, f"{suite_name}.json")
+        etag_path = f"{local_path}.etag"
+        cached_etag = None
+        if os.path.exists(etag_path):
+            with open(etag_path) as f:
+                cached_etag = f.read()
+        if cached_etag == etags[key]:
+            with open(local_path) as f:
+                suites[suite_name] = f.read()
+            continue
+        suites[suite_name] = s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+        with open(local_path, "w") as f:
+            f.write(suites[suite_name])
+        with open(etag_path, "w") as f:
+            f.write(etags[key])
+    return suites
 
-        # Fetch validation rules
-        validation_rules = fetch_validation_rules(cursor, dataset_name)
-        print(f"Validation rules for {dataset_name}: {validation_rules}")
+def validate_dataset(dataset_name, dataset, context, suite):
+    from great_expectations.core.batch import RuntimeBatchRequest
+    runtime_batch_request = RuntimeBatchRequest(
+        datasource_name="my_data",
+        data_connector_name="default_runtime_data_connector_name",
+        data_asset_name=dataset_name,
+        runtime_parameters={"batch_data": dataset},
+        batch_identifiers={"default_identifier_name": "default"}
+    )
 
-        # Run validation
-        results = validate_dataset(dataset_name, dataset, context)
+    # The suite is passed in, so the validator does not look it up in the S3 store
+    validator = context.get_validator(batch_request=runtime_batch_request, expectation_suite=suite)
 
-        # Save results
-        save_validation_results_to_s3(results, dataset_name)
+    # Run validation
+    results = validator.validate()
+    return results
+
+def validate_in_worker(dataset_name, s3_key, context, suite_json):
+    from great_expectations.core import ExpectationSuite
+    from great_expectations.core.expectation_suite import expectationSuiteSchema
+    with timed_step(f"read:{dataset_name}") as step:
+        dataset = fetch_dataset_from_s3(dataset_name, s3_key)
+        step["rows_out"] = len(dataset)
+    suite = ExpectationSuite(**expectationSuiteSchema.loads(suite_json), data_context=context)
+    with timed_step(f"validate:{dataset_name}", rows_in=len(dataset)):
+        return validate_dataset(dataset_name, dataset, context, suite).to_json_dict()
 
-    # Close RDS connection
-    cursor.close()
-    conn.close()
+def evaluate_in_worker(dataset_name, s3_key, compiled_rules):
+    if CHUNK_SIZE:
+        # Only one chunk is in memory at a time; partial results are merged into the same report
+        with timed_step(f"validate:{dataset_name}") as step:
+            chunks = iter_staged(dataset_name, CHUNK_SIZE, fallback_key=s3_key)
+            report = evaluate_chunks(chunks, compiled_rules)
+            step["rows_in"] = report["results"][0]["element_count"]
+        return report
+    with timed_step(f"read:{dataset_name}") as step:
+        dataset = fetch_dataset_from_s3(dataset_name, s3_key)
+        step["rows_out"] = len(dataset)
+    with timed_step(f"validate:{dataset_name}", rows_in=len(dataset)):
+        return evaluate_rules(dataset, compiled_rules)
+
+def validate_cached(cache, dataset_name, rules, worker, *arguments):
+    """Run a validation worker unless the dataset's content was already validated against the same rules."""
+    inputs = input_hash(staged_hash(dataset_name), VALIDATION_ENGINE, rules)
+    return cached_json(
+        cache, f"validate:{dataset_name}", inputs, CODE_VERSION, lambda: worker(dataset_name, *arguments)
+    )
+
+def save_validation_results_to_s3(results_by_dataset, run_time, engine):
+    """Write the results of every dataset validated in this run as one compact JSON object."""
+    s3 = boto3.client("s3")
+    result_key = f"{RESULTS_PREFIX}run_{run_time.strftime('%Y%m%d_%H%M%S')}.json"
+    s3.put_object(
+        Bucket=GX_BUCKET,
+        Key=result_key,
+        Body=json.dumps(
+            {"run_time": run_time.isoformat(), "engine": engine, "results": results_by_dataset},
+            separators=(",", ":")
+        ),
+        ContentType="application/json"
+    )
+    print(f"Validation results saved to s3://{GX_BUCKET}/{result_key}")
+
+def save_verdict_to_s3(verdict):
+    boto3.client("s3").put_object(
+        Bucket=GX_BUCKET,
+        Key=VERDICT_KEY,
+        Body=json.dumps(verdict, separators=(",", ":")),
+        ContentType="application/json"
+    )
+    print(f"Quality gate {verdict['status']}, verdict saved to s3://{GX_BUCKET}/{VERDICT_KEY}")
+
+def apply_quality_gate(results_by_dataset, pending, quarantined, datasets, run_time):
+    """Turn the results into per-dataset verdicts, quarantine failing datasets and record the outcome."""
+    thresholds = load_thresholds(QUALITY_THRESHOLDS)
+    verdicts = {
+        dataset_name: dataset_verdict(dataset_name, report, thresholds)
+        for dataset_name, report in results_by_dataset.items()
+    }
+    for dataset_name, verdict in verdicts.items():
+        if verdict["passed"]:
+            print(f"Dataset '{dataset_name}' passed the quality gate ({len(verdict['warnings'])} warnings).")
+        else:
+            print(f"Dataset '{dataset_name}' failed the quality gate: {', '.join(verdict['failed_rules'])}")
+            quarantine_dataset(dataset_name, datasets[dataset_name], verdict, run_time)
+    # Cleaning and transformation skip datasets whose current input failed
+    with pooled_connection(RDS_DB) as conn:
+        cursor = conn.cursor()
+        record_quality_status(
+            cursor, {name: "passed" if verdict["passed"] else "failed" for name, verdict in verdicts.items()}, RDS_SCHEMA
+        )
+        cursor.close()
+    return gate_verdict(verdicts, [name for name in pending if name not in verdicts], run_time, quarantined)
+
+
+def main():
+    # Dataset configuration
+    datasets = {
+        "state_with_region": "active-processing/state_region.csv",
+        "loan_count_yearwise": "active-processing/loan_count_yearwise.csv",
+        "loan_purposes": "active-processing/loan_purposes.csv",
+        "loan_with_region": "active-processing/loan_with_region.csv",
+        "customers": "active-processing/customers.csv",
+        "loan_data": "active-processing/loan_data.csv"
+    }
+
+    # Only datasets whose input changed since the last successful run are validated. Inputs that
+    # already failed the gate are not validated or quarantined again until they change.
+    with timed_step("find_changed_datasets"):
+        with pooled_connection(RDS_DB) as conn:
+            cursor = conn.cursor()
+            pending = changed_datasets(cursor, datasets, RDS_SCHEMA, skip_quarantined=True)
+            quarantined = sorted(set(datasets) & quarantined_datasets(cursor, RDS_SCHEMA))
+            cursor.close()
+    run_time = datetime.now()
+    if not pending:
+        print("No dataset changed since the last successful run, nothing to validate.")
+        save_verdict_to_s3(gate_verdict({}, [], run_time, quarantined))
+        return
+
+    if VALIDATION_ENGINE == "gx":
+        if CHUNK_SIZE:
+            print("CHUNK_SIZE only applies to the native engine, Great Expectations validates whole datasets.")
+        with timed_step("load_suites"):
+            suites = load_suites(pending)
+        for dataset_name in pending:
+            if dataset_name not in suites:
+                print(f"No expectation suite for dataset '{dataset_name}', skipping validation.")
+        # Datasets are validated concurrently against one shared GX context
+        context = initialize_context(GX_BUCKET)
+        tasks = {
+            dataset_name: (suites[dataset_name], validate_in_worker, datasets[dataset_name], context, suites[dataset_name])
+            for dataset_name in pending if dataset_name in suites
+        }
+    elif VALIDATION_ENGINE == "native":
+        with timed_step("compile_rules"):
+            with pooled_connection(RDS_DB) as conn:
+                cursor = conn.cursor()
+                rules = {dataset_name: fetch_validation_rules(cursor, dataset_name) for dataset_name in pending}
+                cursor.close()
+            compiled = {dataset_name: compile_rules(dict(rows)) for dataset_name, rows in rules.items()}
+        for dataset_name in pending:
+            if not compiled[dataset_name]:
+                print(f"No validation rules for dataset '{dataset_name}', skipping validation.")
+        tasks = {
+            dataset_name: (rules[dataset_name], evaluate_in_worker, datasets[dataset_name], compiled[dataset_name])
+            for dataset_name in pending if compiled[dataset_name]
+        }
+    else:
+        raise ValueError(f"Unknown VALIDATION_ENGINE '{VALIDATION_ENGINE}', expected 'native' or 'gx'")
+
+    # A retry reuses the reports of datasets whose content, rules and code are unchanged
+    cache = get_stage_cache()
+    results_by_dataset = {}
+    with ThreadPoolExecutor(max_workers=MAX_VALIDATION_WORKERS) as executor:
+        futures = {
+            executor.submit(validate_cached, cache, dataset_name, *task): dataset_name
+            for dataset_name, task in tasks.items()
+        }
+        for future in as_completed(futures):
+            dataset_name = futures[future]
+            results_by_dataset[dataset_name] = future.result()
+            print(f"Validated dataset: {dataset_name} (success: {results_by_dataset[dataset_name]['success']})")
+
+    with timed_step("quality_gate"):
+        verdict = apply_quality_gate(results_by_dataset, pending, quarantined, datasets, run_time)
+
+    # Save the results of all datasets as one artifact, then the verdict the state machine reads
+    with timed_step("save_results"):
+        save_validation_results_to_s3(results_by_dataset, run_time, VALIDATION_ENGINE)
+        save_verdict_to_s3(verdict)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        close_all()
+        print_summary()
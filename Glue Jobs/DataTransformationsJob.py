@@ -1,11 +1,18 @@
 import pandas as pd
-import json
 import ast
 import re
+import hashlib
 import psycopg2
-import boto3
-from botocore.exceptions import ClientError
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from job_args import optional_arg
+from connections import get_engine, close_all
+from staging import RAW_DATASETS, read_staged, load_manifest, staged_partitions, combine_hashes
+from fingerprints import changed_datasets, quarantined_datasets, mark_processed
+from instrumentation import timed_step, instrumented, print_summary
+from aggregate_store import (
+    PARTITION_COLUMN, ensure_ledger, fetch_partition_hashes, record_partitions,
+    replace_partitions, replace_rows, create_view
+)
 
 input_datasets = {
     "state_with_region": "post-processing/state_region.csv",
@@ -16,48 +23,57 @@ input_datasets = {
     "loan_data": "post-processing/loan_data.csv"
 }
 
-# Fetch secret from AWS Secrets Manager
-def get_secret():
-    secret_name = "db-secret"
-    region_name = "us-east-1"
-    session = boto3.session.Session()
-    client = session.client(
-        service_name="secretsmanager",
-        region_name=region_name
-    )
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-        secret = get_secret_value_response["SecretString"]
-        return json.loads(secret)
-    except ClientError as e:
-        print(f"Error Occurred: {e}")
-        return None
+# Formatted copies for visualization, written only when --FORMATTED_OUTPUTS is set
+presentation_outputs = {
+    "approval_rate": "presentation/approval_rate.csv",
+    "regional_loan_trends": "presentation/regional_loan_trends.csv",
+    "loan_purpose_trends": "presentation/loan_purpose_trends.csv",
+    "performance_by_segment": "presentation/performance_by_segment.csv"
+}
+
+# Display formats per table; missing values are shown as 'Unknown'
+display_formats = {
+    "approval_rate": {
+        "Loan Approval Rate": "{:.0f}%",
+        "Average Loan Amount (USD)": "${:,.2f}"
+    },
+    "regional_loan_trends": {
+        "loan_amount": "{:,.0f}",
+        "interest_rate": "{:.2f}%",
+        "loan_term": "{:02.0f}"
+    },
+    "performance_by_segment": {
+        "Average Return (USD)": "{:,.2f}",
+        "Default Rate (%)": "{:.2f}%"
+    }
+}
+
+# Only the columns used by the transformations are loaded from the staged Parquet
+dataset_columns = {
+    "customer_data": ["customer_id", "home_ownership", "employment_length", "verification_status"],
+    "loan_data": [
+        "loan_id", "customer_id", "loan_status", "loan_amount",
+        "interest_rate", "loan_term", "purpose", "issue_year"
+    ]
+}
 
-# Database connection parameters
-secret = get_secret()
-RDS_HOST = secret["host"]
-RDS_PORT = int(secret["port"])
-RDS_USER = secret["username"]
-RDS_PASSWORD = secret["password"]
 RDS_DB = "fintech"
 RDS_SCHEMA = "loans"
 S3_BUCKET = "source-system-754"
 GX_BUCKET = "project-utility-754"
-
-CONNECTION_STRING = f"postgresql+psycopg2://{RDS_USER}:{RDS_PASSWORD}@{RDS_HOST}:{RDS_PORT}/{RDS_DB}"
-try:
-    engine = create_engine(CONNECTION_STRING)
-    connection = engine.connect()
-    print("Connection successful!")
-    connection.close()
-except Exception as e:
-    print(f"Connection failed: {e}")
-
-def read_file(file_path):
-    path = f"s3://{S3_BUCKET}/{file_path}"
-    data = pd.read_csv(path)
+# One worker (and one pooled connection) per aggregated table
+MAX_TRANSFORMATION_WORKERS = 4
+
+def read_file(dataset_name, partitions=None):
+    with timed_step(f"read:{dataset_name}") as step:
+        data = read_staged(
+            dataset_name,
+            columns=dataset_columns.get(dataset_name),
+            layer="clean",
+            fallback_key=input_datasets[dataset_name],
+            partitions=partitions
+        )
+        step["rows_out"] = len(data)
     return data
 
 def write_file(df, file_path):
@@ -65,111 +81,377 @@ def write_file(df, file_path):
     df.to_csv(path, index=False)
 
 # Step 1: Loan Approval Indicator
+loan_approval_mapping = {
+    'Fully Paid': 'Approved',
+    'Current': 'Approved',
+    'Default': 'Defaulted',
+    'Charged Off': 'Defaulted',
+    'Late (16-30 days)': 'Late',
+    'Late (31-120 days)': 'Late'
+}
+loan_approval_labels = ['Approved', 'Defaulted', 'Late', 'Other']
+
+@instrumented()
 def add_loan_approval_indicator(loan):
     """
-    Add a 'loan_approval' column to indicate the loan status.
+    Add a categorical 'loan_approval' column to indicate the loan status.
     """
-    loan['loan_approval'] = loan['loan_status'].apply(
-        lambda x: 'Approved' if x in ['Fully Paid', 'Current'] else
-        ('Defaulted' if x in ['Default', 'Charged Off'] else
-         ('Late' if x in ['Late (16-30 days)', 'Late (31-120 days)'] else 'Other'))
-    )
+    # Mapping a categorical status touches each category once rather than each row
+    approval = pd.Categorical(loan['loan_status'].map(loan_approval_mapping), categories=loan_approval_labels)
+    loan['loan_approval'] = approval.fillna('Other')
     return loan
 
-def calculate_approval_rate(loan, customer):
+# Risk mapping
+risk_mapping = {
+    'Fully Paid': 'Low',
+    'Current': 'Low',
+    'Late (16-30 days)': 'High',
+    'Late (31-120 days)': 'High',
+    'Default': 'High',
+    'Charged Off': 'High'
+}
+
+customer_attributes = ['customer_id', 'home_ownership', 'employment_length', 'verification_status']
+
+# Loans are folded into the aggregates one issue year at a time
+UNKNOWN_PARTITION = "unknown"
+# Region rows whose loan is not in loan_data still count towards the regional loan amount
+UNMATCHED_PARTITION = "unmatched"
+# Clean loan_data partitions named issue_year=<year> map onto the aggregate partitions
+YEAR_PARTITION = "issue_year="
+# Cleaned inputs every aggregate partition depends on besides its own loans
+SHARED_INPUTS = ["customer_data", "loan_with_region", "state_with_region", "loan_purposes"]
+# Cleaned table of a raw input whose name differs
+CLEAN_TABLES = {"customers": "customer_data"}
+
+# Shared Loan Facts
+@instrumented()
+def build_loan_facts(loan, customer):
     """
-    Merge loan and customer data, and calculate approval rate by demographics.
+    Join loans with customer attributes once, add the boolean and derived columns the
+    aggregations need, and index the result by loan_id for the regional lookup.
     """
-    loan_approval_by_demographics = pd.merge(loan, customer, on='customer_id', how='left')
-    approval_rate = loan_approval_by_demographics.groupby(
-        ['home_ownership', 'employment_length', 'verification_status']
-    ).agg({
-        'loan_approval': lambda x: (x == 'Approved').mean(),
-        'loan_amount': 'mean'
-    }).reset_index()
-
-    approval_rate['Loan Approval Rate'] = (approval_rate['loan_approval'] * 100).round(0)
-    approval_rate['Loan Approval Rate'] = approval_rate['Loan Approval Rate'].apply(lambda x: f"{int(x)}%")
-    approval_rate['Average Loan Amount (USD)'] = approval_rate['loan_amount'].apply(
-        lambda x: f"${x:,.2f}"
-    )
-    approval_rate.drop(columns=['loan_approval'], inplace=True)
-
-    return approval_rate
-
-def calculate_regional_trends(loan, loan_with_region, state_region):
+    # One row per customer keeps the join from multiplying loans
+    customer = customer[customer_attributes].drop_duplicates('customer_id')
+    facts = pd.merge(loan, customer, on='customer_id', how='left')
+    facts['is_approved'] = facts['loan_approval'] == 'Approved'
+    facts['is_high_risk'] = facts['loan_status'].map(risk_mapping) == 'High'
+    facts['return'] = facts['loan_amount'] * (1 + facts['interest_rate'])
+    facts[PARTITION_COLUMN] = facts['issue_year'].astype('string').fillna(UNKNOWN_PARTITION)
+    return facts.set_index('loan_id')
+
+@instrumented()
+def build_region_facts(facts, loan_with_region, state_region, known_loan_ids=None):
     """
-    Calculate regional loan trends by merging loan data with region and state data.
+    Join region data to the loan facts on loan_id, tagging each row with its loan's partition.
+    Rows of known_loan_ids, the loans of partitions that were not read, are left out instead
+    of being counted as unmatched.
     """
+    if known_loan_ids is not None:
+        loan_with_region = loan_with_region[~loan_with_region['loan_id'].isin(known_loan_ids)]
     loan_region_data = pd.merge(loan_with_region, state_region, how='left', on='region')
-    loan_region_data_full = pd.merge(loan_region_data, loan[['loan_id', 'interest_rate', 'loan_term']], how='left', on='loan_id')
-
-    group_columns = ['region', 'subregion'] if 'subregion' in loan_region_data_full.columns else ['region']
-
-    regional_loan_trends = loan_region_data_full.groupby(group_columns).agg({
-        'loan_amount': 'sum',
-        'interest_rate': 'mean',
-        'loan_term': 'mean'
-    }).reset_index()
+    loan_region_data = loan_region_data.join(facts[['interest_rate', 'loan_term', PARTITION_COLUMN]], on='loan_id')
+    loan_region_data[PARTITION_COLUMN] = loan_region_data[PARTITION_COLUMN].fillna(UNMATCHED_PARTITION)
+    return loan_region_data
+
+def _hashable(df):
+    # Nullable numeric columns hash far slower than plain floats, and NaN still marks a missing value
+    nullable = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.api.extensions.ExtensionDtype)
+                and pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+    return df.astype({col: 'float64' for col in nullable})
+
+@instrumented()
+def partition_hashes(facts, region_facts, lookups):
+    """
+    Fingerprint every partition from its loan facts, its region rows and the shared lookup
+    tables, so a partition is refolded whenever anything that feeds its statistics changes.
+    """
+    base = hashlib.sha256()
+    for df in lookups:
+        base.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digests = {}
+    for frame in (facts, region_facts):
+        # Hash every row once, then split the row hashes by partition
+        row_hashes = pd.util.hash_pandas_object(_hashable(frame.drop(columns=PARTITION_COLUMN))).values
+        for key, positions in frame.groupby(PARTITION_COLUMN, sort=False).indices.items():
+            digest = digests.setdefault(key, base.copy())
+            digest.update(row_hashes[positions].tobytes())
+    return {key: digest.hexdigest() for key, digest in digests.items()}
+
+def manifest_partition_hashes():
+    """
+    Fingerprint every aggregate partition from the clean manifest, so the changed years are known
+    before any loans are read. A year combines the content hash of its loan_data partition with
+    those of the shared inputs, and the unmatched region rows depend on every loan partition.
+    Returns None unless loan_data is staged in issue_year partitions.
+    """
+    manifest = load_manifest("clean", refresh=True)
+    loan_partitions = (manifest.get("loan_data") or {}).get("partitions")
+    if not loan_partitions or any(name not in manifest for name in SHARED_INPUTS):
+        return None
+    years = {name: name[len(YEAR_PARTITION):] for name in loan_partitions}
+    if not all(name.startswith(YEAR_PARTITION) and year for name, year in years.items()):
+        return None
+    shared = {name: manifest[name]["content_hash"] for name in SHARED_INPUTS}
+    hashes = {
+        years[name]: combine_hashes({**shared, "loan_data": entry["content_hash"]})
+        for name, entry in loan_partitions.items()
+    }
+    hashes[UNMATCHED_PARTITION] = combine_hashes({**shared, "loan_data": manifest["loan_data"]["content_hash"]})
+    return hashes
 
-    # Format results
-    regional_loan_trends['loan_amount'] = pd.to_numeric(regional_loan_trends['loan_amount'], errors='coerce')
-    regional_loan_trends['loan_amount'] = regional_loan_trends['loan_amount'].apply(lambda x: "{:,.0f}".format(x) if pd.notna(x) else "Unknown")
-    regional_loan_trends['interest_rate'] = regional_loan_trends['interest_rate'].apply(lambda x: "{:.2f}%".format(x * 100) if isinstance(x, (float, int)) else "Unknown")
-    regional_loan_trends['loan_term'] = regional_loan_trends['loan_term'].apply(lambda x: "{:02d}".format(round(x)) if isinstance(x, (float, int)) else "Unknown")
+# Sufficient Statistics
+# Each builder returns counts and sums per partition and group key. They add up across
+# partitions, so the published means and rates are derived from them on read.
+approval_keys = ['home_ownership', 'employment_length', 'verification_status']
+segment_keys = ['home_ownership', 'verification_status']
 
-    return regional_loan_trends
+@instrumented()
+def approval_rate_stats(facts):
+    """
+    Loan and approval counts and loan amount totals by demographics.
+    """
+    return facts.groupby([PARTITION_COLUMN] + approval_keys, observed=True).agg(
+        loan_count=('is_approved', 'size'),
+        approved_count=('is_approved', 'sum'),
+        loan_amount_sum=('loan_amount', 'sum'),
+        loan_amount_count=('loan_amount', 'count')
+    ).reset_index()
+
+@instrumented()
+def regional_trends_stats(region_facts):
+    """
+    Loan amount, interest rate and loan term totals by region.
+    """
+    group_columns = ['region', 'subregion'] if 'subregion' in region_facts.columns else ['region']
+    return region_facts.groupby([PARTITION_COLUMN] + group_columns, observed=True).agg(
+        loan_amount_sum=('loan_amount', 'sum'),
+        interest_rate_sum=('interest_rate', 'sum'),
+        interest_rate_count=('interest_rate', 'count'),
+        loan_term_sum=('loan_term', 'sum'),
+        loan_term_count=('loan_term', 'count')
+    ).reset_index()
 
 # Loan Purpose Trends
-def calculate_loan_purpose_trends(loan, loan_purposes, loan_count_by_year):
+@instrumented()
+def loan_purpose_stats(facts, loan_purposes):
     """
-    Calculate loan trends by purpose and year.
+    Loan counts by purpose and year.
     """
-    loan_with_purpose = pd.merge(loan, loan_purposes, how='left', on='purpose')
-    loan_purpose_trends = loan_with_purpose.groupby(['purpose', 'issue_year']).size().reset_index(name='loan_count_by_purpose')
-    loan_purpose_trends = pd.merge(loan_purpose_trends, loan_count_by_year, on='issue_year', how='left')
-
-    loan_purpose_trends.rename(columns={
-        'loan_count_x': 'loan_count_by_purpose',
-        'loan_count_y': 'total_loan_count_by_year'
-    }, inplace=True)
-
-    return loan_purpose_trends
+    loan_with_purpose = pd.merge(
+        facts[[PARTITION_COLUMN, 'purpose', 'issue_year']], loan_purposes, how='left', on='purpose'
+    )
+    return loan_with_purpose.groupby(
+        [PARTITION_COLUMN, 'purpose', 'issue_year'], observed=True
+    ).size().reset_index(name='loan_count_by_purpose')
 
 # Customer Risk and Returns
-def calculate_customer_risk_and_returns(loan, customer):
+@instrumented()
+def customer_risk_stats(facts):
     """
-    Calculate return and risk for customer segments.
+    Return totals and high-risk counts for customer segments.
     """
-    loan['return'] = loan['loan_amount'] * (1 + loan['interest_rate'])
-
-    # Risk mapping
-    risk_mapping = {
-        'Fully Paid': 'Low',
-        'Current': 'Low',
-        'Late (16-30 days)': 'High',
-        'Late (31-120 days)': 'High',
-        'Default': 'High',
-        'Charged Off': 'High'
+    # Loans without a matching customer have no segment and drop out of the groupby
+    return facts.groupby([PARTITION_COLUMN] + segment_keys, observed=True).agg(
+        loan_count=('is_high_risk', 'size'),
+        high_risk_count=('is_high_risk', 'sum'),
+        return_sum=('return', 'sum'),
+        return_count=('return', 'count')
+    ).reset_index()
+
+# Published views: table name -> (statistics table, SELECT deriving the metrics)
+def _keys(columns):
+    return ", ".join(f'"{col}"' for col in columns)
+
+def aggregate_views(stats, schema="loans"):
+    regional_keys = [
+        col for col in stats["regional_loan_trends"].columns
+        if col in ('region', 'subregion')
+    ]
+    return {
+        "approval_rate": f"""
+            SELECT {_keys(approval_keys)},
+                SUM(loan_amount_sum) / NULLIF(SUM(loan_amount_count), 0) AS loan_amount,
+                ROUND((100.0 * SUM(approved_count) / SUM(loan_count))::NUMERIC, 0)::DOUBLE PRECISION
+                    AS "Loan Approval Rate",
+                ROUND((SUM(loan_amount_sum) / NULLIF(SUM(loan_amount_count), 0))::NUMERIC, 2)::DOUBLE PRECISION
+                    AS "Average Loan Amount (USD)"
+            FROM {schema}.approval_rate_stats
+            GROUP BY {_keys(approval_keys)}
+        """,
+        "regional_loan_trends": f"""
+            SELECT {_keys(regional_keys)},
+                SUM(loan_amount_sum) AS loan_amount,
+                ROUND((100 * SUM(interest_rate_sum) / NULLIF(SUM(interest_rate_count), 0))::NUMERIC, 2)::DOUBLE PRECISION
+                    AS interest_rate,
+                ROUND((SUM(loan_term_sum) / NULLIF(SUM(loan_term_count), 0))::NUMERIC, 0)::DOUBLE PRECISION
+                    AS loan_term
+            FROM {schema}.regional_loan_trends_stats
+            GROUP BY {_keys(regional_keys)}
+        """,
+        "loan_purpose_trends": f"""
+            SELECT s.purpose, s.issue_year,
+                SUM(s.loan_count_by_purpose) AS loan_count_by_purpose,
+                y.loan_count
+            FROM {schema}.loan_purpose_trends_stats s
+            LEFT JOIN {schema}.loan_year_totals y ON y.issue_year = s.issue_year
+            GROUP BY s.purpose, s.issue_year, y.loan_count
+        """,
+        "performance_by_segment": f"""
+            SELECT {_keys(segment_keys)},
+                ROUND((SUM(return_sum) / NULLIF(SUM(return_count), 0))::NUMERIC, 2)::DOUBLE PRECISION
+                    AS "Average Return (USD)",
+                ROUND((100.0 * SUM(high_risk_count) / SUM(loan_count))::NUMERIC, 2)::DOUBLE PRECISION
+                    AS "Default Rate (%)"
+            FROM {schema}.performance_by_segment_stats
+            GROUP BY {_keys(segment_keys)}
+        """
     }
-    loan['risk'] = loan['loan_status'].map(risk_mapping)
-
-    customer_loan_performance = pd.merge(loan, customer, on='customer_id')
-
-    performance_by_segment = customer_loan_performance.groupby(['home_ownership', 'verification_status']).agg({
-        'return': 'mean',
-        'risk': lambda x: (x == 'High').mean()
-    }).reset_index()
 
-    performance_by_segment.rename(columns={
-        'return': 'Average Return (USD)',
-        'risk': 'Default Rate (%)'
-    }, inplace=True)
+# Concurrent Aggregations
+def run_aggregations(facts, region_facts, loan_purposes):
+    """
+    Compute the four sets of statistics concurrently and return {table_name: stats} in a fixed
+    order. Threads share the read-only facts frame in place instead of receiving pickled copies,
+    and pandas releases the GIL inside the groupby and merge kernels.
+    """
+    tasks = {
+        "approval_rate": (approval_rate_stats, (facts,)),
+        "regional_loan_trends": (regional_trends_stats, (region_facts,)),
+        "loan_purpose_trends": (loan_purpose_stats, (facts, loan_purposes)),
+        "performance_by_segment": (customer_risk_stats, (facts,))
+    }
+    with ThreadPoolExecutor(max_workers=MAX_TRANSFORMATION_WORKERS) as executor:
+        futures = {name: executor.submit(func, *args) for name, (func, args) in tasks.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                raise RuntimeError(f"calculating {name} failed: {e}") from e
+            print(f"Calculated {name} statistics.")
+    return results
+
+@instrumented()
+def save_partition_stats(stats, table_name, partitions, engine, schema="loans"):
+    """
+    Replace the statistics of the given partitions in one table over a pooled connection.
+    """
+    connection = engine.raw_connection()
+    try:
+        replace_partitions(connection.cursor(), f"{table_name}_stats", stats, partitions, schema)
+        connection.commit()
+        print(f"Statistics for '{table_name}' saved to database successfully.")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def save_tables(stats, partitions, engine, schema="loans"):
+    """
+    Save the statistics of several tables concurrently, each over its own connection from the
+    engine's pool. Replacing partitions is idempotent, so a partial failure is repaired by the
+    next run, which refolds every partition the ledger has not recorded.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_TRANSFORMATION_WORKERS) as executor:
+        futures = [
+            executor.submit(save_partition_stats, df, table_name, partitions, engine, schema)
+            for table_name, df in stats.items()
+        ]
+        for future in futures:
+            future.result()
+
+def fetch_folded(engine, schema="loans"):
+    """Fingerprints of the partitions already folded into the statistics tables."""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        ensure_ledger(cursor, schema)
+        folded = fetch_partition_hashes(cursor, schema)
+        connection.commit()
+    finally:
+        connection.close()
+    return folded
+
+@instrumented()
+def fold_aggregates(facts, loan_with_region, state_region, loan_purposes, loan_count_by_year, engine,
+                    schema="loans", scope=None, hashes=None, known_loan_ids=None):
+    """
+    Fold new and changed loan partitions into the statistics tables, drop the statistics of
+    partitions that disappeared and publish the metrics as views. With a scope, only those
+    partitions are considered. Without hashes, partitions are fingerprinted from the rows of
+    the facts; with the hashes of every partition (manifest_partition_hashes), facts only need
+    to hold the changed partitions. Returns the folded partitions.
+    """
+    region_facts = build_region_facts(facts, loan_with_region, state_region, known_loan_ids)
+    if scope is not None:
+        # Only the selected partitions are loaded; region rows of other loans stay as folded
+        facts = facts[facts[PARTITION_COLUMN].isin(scope)]
+        region_facts = region_facts[region_facts[PARTITION_COLUMN].isin(scope)]
+    if hashes is None:
+        hashes = partition_hashes(facts, region_facts, [state_region, loan_purposes])
+
+    folded = fetch_folded(engine, schema)
+
+    # Selected partitions are always refolded, which is how a single year is reprocessed
+    changed = [key for key, digest in hashes.items() if scope is not None or folded.get(key) != digest]
+    removed = [key for key in folded if key not in hashes and (scope is None or key in scope)]
+    print(f"Partitions to fold: {len(changed)} of {len(hashes)}, partitions removed: {len(removed)}")
+    if not changed and not removed:
+        return changed
+
+    stats = run_aggregations(
+        facts[facts[PARTITION_COLUMN].isin(changed)],
+        region_facts[region_facts[PARTITION_COLUMN].isin(changed)],
+        loan_purposes
+    )
+    save_tables(stats, changed + removed, engine, schema)
 
-    performance_by_segment['Average Return (USD)'] = performance_by_segment['Average Return (USD)'].apply(lambda x: f"{x:,.2f}")
-    performance_by_segment['Default Rate (%)'] = performance_by_segment['Default Rate (%)'].apply(lambda x: f"{x*100:.2f}%")
+    # The ledger is only advanced once every statistics table holds the new partitions
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        replace_rows(cursor, "loan_year_totals", loan_count_by_year[['issue_year', 'loan_count']], schema)
+        for view_name, select_sql in aggregate_views(stats, schema).items():
+            create_view(cursor, view_name, select_sql, schema)
+        record_partitions(cursor, {key: hashes[key] for key in changed}, removed, schema)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return changed
+
+# Presentation
+def format_for_display(df, column_formats):
+    """
+    Return a copy of an aggregated table with its numeric columns rendered as display strings.
+    """
+    formatted = df.copy()
+    for column, fmt in column_formats.items():
+        values = formatted[column].astype("float64")
+        formatted[column] = values.map(fmt.format, na_action='ignore').fillna("Unknown")
+    return formatted
+
+def get_partitions():
+    """loan_data partitions named in the optional --PARTITIONS argument, e.g. issue_year=2015."""
+    value = optional_arg("PARTITIONS", "")
+    return [partition.strip() for partition in value.split(",") if partition.strip()]
+
+def partition_scope(partitions):
+    """
+    Aggregate partitions covered by the selected loan_data partitions. Only issue_year partitions
+    map onto the aggregate partitions, so any other selection returns None.
+    """
+    years = [partition.split("=", 1)[1] for partition in partitions if partition.startswith("issue_year=")]
+    if partitions and len(years) == len(partitions):
+        return years
+    return None
 
-    return performance_by_segment
+def formatted_outputs_requested():
+    return optional_arg("FORMATTED_OUTPUTS", "false").lower() == "true"
 
 # Save Transformed Data
 def save_transformed_data(dfs, file_names):
@@ -180,23 +462,6 @@ def save_transformed_data(dfs, file_names):
         df.to_csv(file_name, index=False)
         print(f"Saved transformed data to {file_name}")
 
-def save_to_db(df, table_name, engine, schema="public"):
-    """
-    Save DataFrame to the specified database table.
-    """
-    try:
-        with engine.connect() as connection:
-            df.to_sql(
-                name=table_name,
-                con=connection,
-                schema=schema,
-                if_exists="replace",  # Replace the table if it already exists
-                index=False  # Do not write DataFrame index as a column
-            )
-        print(f"Table '{table_name}' saved to database successfully.")
-    except Exception as e:
-        print(f"Error saving table '{table_name}' to database: {e}")
-
 def generate_ddl(df, table_name, schema="loans"):
     """
     Generate a SQL DDL statement based on the DataFrame's schema.
@@ -217,20 +482,94 @@ def generate_ddl(df, table_name, schema="loans"):
     ddl = ddl.rstrip(",\n") + "\n);"
     return ddl
 
-def main_data_transformations():
+def read_loan_ids(partitions):
+    """loan_id of the given clean loan_data partitions."""
+    with timed_step("read:loan_ids") as step:
+        loan_ids = read_staged("loan_data", columns=["loan_id"], layer="clean", partitions=partitions)["loan_id"]
+        step["rows_out"] = len(loan_ids)
+    return loan_ids
+
+def plan_loan_partitions(hashes, engine):
+    """
+    The clean loan_data partitions whose fingerprint differs from the folded one and the loan
+    IDs of all other partitions, so a run only reads the years that changed.
+    """
+    folded = fetch_folded(engine)
+    changed = sorted(
+        f"{YEAR_PARTITION}{key}" for key, digest in hashes.items()
+        if key != UNMATCHED_PARTITION and folded.get(key) != digest
+    )
+    unchanged = [name for name in staged_partitions("loan_data", "clean") if name not in changed]
+    print(f"Reading {len(changed)} of {len(changed) + len(unchanged)} loan_data partitions.")
+    return changed, read_loan_ids(unchanged) if unchanged else None
+
+def main_data_transformations(partitions=()):
+    # Credentials are fetched and the connection pool is created on first use
+    try:
+        engine = get_engine(pool_size=MAX_TRANSFORMATION_WORKERS)
+    except Exception as e:
+        print(f"Error connecting to RDS: {e}")
+        raise
+
+    # A run over selected issue_year partitions reprocesses only those years
+    scope = partition_scope(partitions)
+    if partitions and scope is None:
+        print(f"Partitions {', '.join(partitions)} are not issue_year partitions, processing all loans.")
+    if scope is not None:
+        print(f"Reprocessing partitions: {', '.join(partitions)}")
+        pending = []
+    else:
+        # Skip the run when no input changed since the last successful run
+        try:
+            connection = engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                pending = changed_datasets(cursor, RAW_DATASETS, RDS_SCHEMA, skip_quarantined=True)
+                quarantined = quarantined_datasets(cursor, RDS_SCHEMA)
+            finally:
+                connection.close()
+        except Exception as e:
+            print(f"Error checking dataset fingerprints: {e}")
+            raise
+        if not pending:
+            print("No dataset changed since the last successful run, nothing to transform.")
+            return
+        # Every input is joined, so one held back by the quality gate before it was ever cleaned
+        # leaves nothing to transform until its input changes
+        cleaned = load_manifest("clean", refresh=True)
+        never_cleaned = sorted(
+            name for name in quarantined if name in RAW_DATASETS and CLEAN_TABLES.get(name, name) not in cleaned
+        )
+        if never_cleaned:
+            print(f"Quarantined inputs {', '.join(never_cleaned)} have never been cleaned, nothing to transform.")
+            return
+
+    # Partitioned loans are fingerprinted from the clean manifest, so only changed years are read
+    try:
+        hashes = manifest_partition_hashes()
+        known_loan_ids = None
+        loan_partitions = partitions if scope is not None else None
+        if hashes is not None and scope is not None:
+            hashes = {key: hashes[key] for key in scope if key in hashes}
+        elif hashes is not None:
+            loan_partitions, known_loan_ids = plan_loan_partitions(hashes, engine)
+    except Exception as e:
+        print(f"Error planning the loan partitions to read: {e}")
+        raise
+
     # Load Data
     try:
         # Load required datasets
-        customer_data = read_file(input_datasets['customer_data'])
-        loan_data = read_file(input_datasets['loan_data'])
-        loan_count_by_year = read_file(input_datasets['loan_count_yearwise'])
-        loan_purpose = read_file(input_datasets['loan_purposes'])
-        loan_with_region = read_file(input_datasets['loan_with_region'])
-        state_region = read_file(input_datasets['state_with_region'])
+        customer_data = read_file('customer_data')
+        loan_data = read_file('loan_data', loan_partitions)
+        loan_count_by_year = read_file('loan_count_yearwise')
+        loan_purpose = read_file('loan_purposes')
+        loan_with_region = read_file('loan_with_region')
+        state_region = read_file('state_with_region')
         print("Data loaded successfully.")
     except Exception as e:
         print(f"Error loading data: {e}")
-        return
+        raise
 
     # Add Loan Approval Indicator
     try:
@@ -238,50 +577,57 @@ def main_data_transformations():
         print("Loan approval indicator added.")
     except Exception as e:
         print(f"Error adding loan approval indicator: {e}")
-        return
+        raise
 
-    # Calculate Approval Rates
+    # Join loans and customers once for all aggregations
     try:
-        approval_rate = calculate_approval_rate(loan, customer_data)
-        print("Approval rates calculated.")
+        facts = build_loan_facts(loan, customer_data)
+        print("Loan facts built.")
     except Exception as e:
-        print(f"Error calculating approval rates: {e}")
-        return
+        print(f"Error building loan facts: {e}")
+        raise
 
-    # Calculate Regional Loan Trends
+    # Fold new and changed loan partitions into the aggregates
     try:
-        regional_loan_trends = calculate_regional_trends(loan, loan_with_region, state_region)
-        print("Regional loan trends calculated.")
-    except Exception as e:
-        print(f"Error calculating regional loan trends: {e}")
-        return
-
-    # Calculate Loan Purpose Trends
-    try:
-        loan_purpose_trends = calculate_loan_purpose_trends(loan, loan_purpose, loan_count_by_year)
-        print("Loan purpose trends calculated.")
+        fold_aggregates(
+            facts, loan_with_region, state_region, loan_purpose, loan_count_by_year, engine,
+            schema="loans", scope=scope, hashes=hashes, known_loan_ids=known_loan_ids
+        )
+        print("Transformed data saved to database successfully.")
     except Exception as e:
-        print(f"Error calculating loan purpose trends: {e}")
-        return
+        print(f"Error folding transformed data into the database: {e}")
+        raise
+
+    # Write formatted copies for visualization only when requested
+    if formatted_outputs_requested():
+        try:
+            tables = {name: pd.read_sql(f"SELECT * FROM loans.{name}", engine) for name in presentation_outputs}
+            save_transformed_data(
+                [format_for_display(df, display_formats.get(name, {})) for name, df in tables.items()],
+                [f"s3://{S3_BUCKET}/{presentation_outputs[name]}" for name in tables]
+            )
+        except Exception as e:
+            print(f"Error saving formatted outputs: {e}")
+            raise
 
-    # Calculate Customer Risk and Returns
-    try:
-        performance_by_segment = calculate_customer_risk_and_returns(loan, customer_data)
-        print("Customer risk and returns calculated.")
-    except Exception as e:
-        print(f"Error calculating customer risk and returns: {e}")
+    # Mark the inputs as processed so the next run skips them until they change
+    if not pending:
         return
-
-    # Save Transformed Data to Database
     try:
-        save_to_db(approval_rate, "approval_rate", engine, schema="loans")
-        save_to_db(regional_loan_trends, "regional_loan_trends", engine, schema="loans")
-        save_to_db(loan_purpose_trends, "loan_purpose_trends", engine, schema="loans")
-        save_to_db(performance_by_segment, "performance_by_segment", engine, schema="loans")
-        print("Transformed data saved to database successfully.")
+        connection = engine.raw_connection()
+        try:
+            mark_processed(connection.cursor(), pending, RDS_SCHEMA)
+            connection.commit()
+        finally:
+            connection.close()
+        print(f"Marked datasets as processed: {', '.join(pending)}")
     except Exception as e:
-        print(f"Error saving transformed data to database: {e}")
-        return
+        print(f"Error marking datasets as processed: {e}")
+        raise
 
 if __name__ == "__main__":
-    main_data_transformations()
\ No newline at end of file
+    try:
+        main_data_transformations(get_partitions())
+    finally:
+        close_all()
+        print_summary()
\ No newline at end of file
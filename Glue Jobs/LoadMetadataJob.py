@@ -1,10 +1,10 @@
-import sys
-import boto3
-import pandas as pd
-import psycopg2
-import json
-from botocore.exceptions import ClientError
-from awsglue.utils import getResolvedOptions
+from job_args import optional_arg
+from staging import read_staged, iter_staged, load_manifest
+from column_stats import compute_column_stats, compute_chunked_stats
+from fingerprints import ensure_fingerprint_columns, fetch_fingerprints, record_fingerprints
+from metadata_store import upsert_datasets, upsert_columns
+from instrumentation import timed_step, print_summary
+from connections import pooled_connection, close_all
 
 
 DEFAULT_PATH_MAP = {
@@ -18,24 +18,8 @@ DEFAULT_PATH_MAP = {
 RDS_DB = "fintech"
 RDS_SCHEMA = "loans"
 S3_BUCKET = "source-system-754"
-
-def get_secret():
-    secret_name = "db-secret"
-    region_name = "us-east-1"
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except ClientError as e:
-        print(f"Error Occured: {e}")
-    secret = get_secret_value_response['SecretString']
-    secret = json.loads(secret)
-    return secret
+# With --CHUNK_SIZE each dataset is summarized in chunks of this many rows; 0 reads it whole
+CHUNK_SIZE = int(optional_arg("CHUNK_SIZE", 0))
 
 def map_dtype_to_sql(pandas_dtype):
     mapping = {
@@ -43,85 +27,83 @@ def map_dtype_to_sql(pandas_dtype):
         "float64": "FLOAT",
         "object": "VARCHAR",
         "bool": "BOOLEAN",
-        "datetime64[ns]": "TIMESTAMP"
+        "datetime64[ns]": "TIMESTAMP",
+        "Int64": "INTEGER",
+        "Float64": "FLOAT",
+        "category": "VARCHAR",
+        "boolean": "BOOLEAN"
     }
     return mapping.get(pandas_dtype, "TEXT")
 
-def read_file(file_path):
-    path = f"s3://{S3_BUCKET}/{file_path}"
-    data = pd.read_csv(path)
-    return data
+def read_file(dataset_name, file_path):
+    return read_staged(dataset_name, fallback_key=file_path)
 
 
-secret = get_secret()
-RDS_HOST = secret['host']
-RDS_PORT = int(secret['port'])
-RDS_USER = secret['username']
-RDS_PASSWORD = secret['password']
-conn = psycopg2.connect(
-    host=RDS_HOST,
-    port=RDS_PORT,
-    user=RDS_USER,
-    password=RDS_PASSWORD,
-    database=RDS_DB
-)
-cursor = conn.cursor()
-print("Connected to RDS")
+def dataset_stats(dataset_name, file_path):
+    """Column statistics of a dataset, folded chunk by chunk when CHUNK_SIZE is set."""
+    if CHUNK_SIZE:
+        # Only one chunk is in memory at a time; the merged stats equal those of the whole file
+        with timed_step(f"column_stats:{dataset_name}") as step:
+            stats = compute_chunked_stats(iter_staged(dataset_name, CHUNK_SIZE, fallback_key=file_path))
+            step["rows_in"] = next(iter(stats.values())).rows if stats else 0
+        return stats
+    with timed_step(f"read:{dataset_name}") as step:
+        data = read_file(dataset_name, file_path)
+        step["rows_out"] = len(data)
+    with timed_step(f"column_stats:{dataset_name}", rows_in=len(data)):
+        return compute_column_stats(data)
+
 
 def load_metadata(cursor):
+    ensure_fingerprint_columns(cursor, RDS_SCHEMA)
+    manifest = load_manifest("raw", S3_BUCKET)
+    fingerprints = fetch_fingerprints(cursor, RDS_SCHEMA)
+
+    # Profile every changed dataset first, then write all metadata in a few set-based statements
+    columns_by_dataset = {}
+    staged_entries = {}
     for dataset_name, object_key in DEFAULT_PATH_MAP.items():
-        data = read_file(object_key)
-        columns_metadata = [
-            {
-                "column_name": col,
-                "data_type": str(data[col].dtypes),
-                "nullable": bool(data[col].isnull().any()),
-                "uniqueness": bool(data[col].is_unique)
-            }
-            for col in data.columns
+        # The staging manifest already holds the content hash, so unchanged inputs are never read
+        staged = manifest.get(dataset_name)
+        if staged and fingerprints.get(dataset_name, (None, None))[0] == staged["content_hash"]:
+            print(f"Dataset '{dataset_name}' unchanged, skipping metadata load.")
+            continue
+
+        column_stats = dataset_stats(dataset_name, object_key)
+        columns_by_dataset[dataset_name] = [
+            (col, map_dtype_to_sql(str(stats.dtype)), stats.nullable, stats.is_unique)
+            for col, stats in column_stats.items()
         ]
+        if staged:
+            staged_entries[dataset_name] = staged
 
-        cursor.execute(
-            f"""
-            INSERT INTO {RDS_SCHEMA}.datasets (dataset_name, s3_path)
-            VALUES (%s, %s)
-            ON CONFLICT (dataset_name) DO NOTHING
-            RETURNING dataset_id;
-            """,
-            (dataset_name, f"s3://{S3_BUCKET}/{object_key}")
+    with timed_step("upsert_metadata") as step:
+        dataset_ids = upsert_datasets(
+            cursor,
+            [(name, f"s3://{S3_BUCKET}/{DEFAULT_PATH_MAP[name]}") for name in columns_by_dataset],
+            RDS_SCHEMA
         )
-        dataset_id_result = cursor.fetchone()
-        if dataset_id_result:
-            dataset_id = dataset_id_result[0]
-        else:
-            cursor.execute(
-                f"SELECT dataset_id FROM {RDS_SCHEMA}.datasets WHERE dataset_name = %s;",
-                (dataset_name,)
-            )
-            dataset_id = cursor.fetchone()[0]
-        for col_meta in columns_metadata:
-            cursor.execute(
-                f"""
-                INSERT INTO {RDS_SCHEMA}.columns 
-                (dataset_id, column_name, data_type, nullable, uniqueness, validation_rules)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (dataset_id, column_name) DO UPDATE SET
-                    data_type = EXCLUDED.data_type,
-                    nullable = EXCLUDED.nullable,
-                    uniqueness = EXCLUDED.uniqueness;
-                """,
-                (
-                    dataset_id,
-                    col_meta["column_name"],
-                    map_dtype_to_sql(col_meta["data_type"]),
-                    col_meta["nullable"],
-                    col_meta["uniqueness"],
-                    None
-                )
-            )
-    print(f"Metadata for dataset '{dataset_name}' successfully loaded into RDS.")
+        column_rows = [
+            (dataset_ids[name], *column)
+            for name, columns in columns_by_dataset.items()
+            for column in columns
+        ]
+        upsert_columns(cursor, column_rows, RDS_SCHEMA)
+        record_fingerprints(cursor, staged_entries, RDS_SCHEMA)
+        step["rows_out"] = len(column_rows)
+    for dataset_name in columns_by_dataset:
+        print(f"Metadata for dataset '{dataset_name}' successfully loaded into RDS.")
+
+def main():
+    with pooled_connection(RDS_DB) as conn:
+        cursor = conn.cursor()
+        load_metadata(cursor)
+        cursor.close()
 
-load_metadata()
-conn.commit()
-cursor.close()
-conn.close()
\ No newline at end of file
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        close_all()
+        print_summary()
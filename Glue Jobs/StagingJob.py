@@ -0,0 +1,21 @@
+from job_args import optional_arg
+from staging import RAW_DATASETS, S3_BUCKET, stage_datasets
+from instrumentation import print_summary
+
+# With --CHUNK_SIZE each CSV is converted in chunks of this many rows; 0 parses it whole
+CHUNK_SIZE = int(optional_arg("CHUNK_SIZE", 0))
+
+
+def main():
+    # Convert every raw CSV to Parquet once so downstream jobs never parse CSV
+    manifest = stage_datasets(RAW_DATASETS, layer="raw", bucket=S3_BUCKET, chunk_rows=CHUNK_SIZE)
+    for dataset_name, entry in manifest.items():
+        print(f"{dataset_name}: {entry['rows']} rows, hash {entry['content_hash'][:12]}")
+    print("Staging completed successfully.")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        print_summary()
@@ -0,0 +1,124 @@
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from bulk_load import map_dtype_to_pg
+
+RDS_SCHEMA = "loans"
+PARTITION_COLUMN = "partition_key"
+LEDGER_TABLE = "aggregate_partitions"
+
+
+def ensure_ledger(cursor, schema=RDS_SCHEMA):
+    """Create the table recording the content hash of every folded loan partition."""
+    cursor.execute(
+        sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {} (
+                partition_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                folded_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+            """
+        ).format(sql.Identifier(schema, LEDGER_TABLE))
+    )
+
+
+def fetch_partition_hashes(cursor, schema=RDS_SCHEMA):
+    cursor.execute(
+        sql.SQL("SELECT partition_key, content_hash FROM {};").format(sql.Identifier(schema, LEDGER_TABLE))
+    )
+    return dict(cursor.fetchall())
+
+
+def record_partitions(cursor, hashes, removed=(), schema=RDS_SCHEMA):
+    """Store the hashes of freshly folded partitions and forget partitions that disappeared."""
+    ledger = sql.Identifier(schema, LEDGER_TABLE)
+    if removed:
+        cursor.execute(
+            sql.SQL("DELETE FROM {} WHERE partition_key = ANY(%s);").format(ledger),
+            (list(removed),)
+        )
+    if hashes:
+        execute_values(
+            cursor,
+            sql.SQL(
+                """
+                INSERT INTO {} (partition_key, content_hash) VALUES %s
+                ON CONFLICT (partition_key) DO UPDATE SET
+                    content_hash = EXCLUDED.content_hash,
+                    folded_at = NOW();
+                """
+            ).format(ledger).as_string(cursor),
+            list(hashes.items()),
+            page_size=len(hashes)
+        )
+
+
+def _rows(df):
+    # object columns hold Python scalars, which psycopg2 adapts, and None for missing values
+    values = df.astype(object)
+    return list(values.where(values.notna(), None).itertuples(index=False, name=None))
+
+
+def ensure_stats_table(cursor, table_name, df, schema=RDS_SCHEMA):
+    column_defs = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(map_dtype_to_pg(dtype)))
+        for col, dtype in df.dtypes.items()
+    )
+    cursor.execute(
+        sql.SQL("CREATE TABLE IF NOT EXISTS {} ({});").format(sql.Identifier(schema, table_name), column_defs)
+    )
+
+
+def _insert(cursor, table_name, df, schema):
+    if df.empty:
+        return
+    execute_values(
+        cursor,
+        sql.SQL("INSERT INTO {} ({}) VALUES %s;").format(
+            sql.Identifier(schema, table_name),
+            sql.SQL(", ").join(sql.Identifier(col) for col in df.columns)
+        ).as_string(cursor),
+        _rows(df),
+        page_size=10_000
+    )
+
+
+def replace_partitions(cursor, table_name, df, partition_keys, schema=RDS_SCHEMA):
+    """
+    Replace the statistics of the given partitions with the rows of df. Deleting before
+    inserting makes folding a partition idempotent, so a failed run can simply be repeated.
+    """
+    ensure_stats_table(cursor, table_name, df, schema)
+    cursor.execute(
+        sql.SQL("DELETE FROM {} WHERE {} = ANY(%s);").format(
+            sql.Identifier(schema, table_name), sql.Identifier(PARTITION_COLUMN)
+        ),
+        (list(partition_keys),)
+    )
+    _insert(cursor, table_name, df, schema)
+
+
+def replace_rows(cursor, table_name, df, schema=RDS_SCHEMA):
+    """Replace every row of a small table without dropping it, so dependent views stay valid."""
+    ensure_stats_table(cursor, table_name, df, schema)
+    cursor.execute(sql.SQL("DELETE FROM {};").format(sql.Identifier(schema, table_name)))
+    _insert(cursor, table_name, df, schema)
+
+
+def create_view(cursor, view_name, select_sql, schema=RDS_SCHEMA):
+    """(Re)create a view, replacing a table of the same name left by full-refresh runs."""
+    cursor.execute(
+        """
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s;
+        """,
+        (schema, view_name)
+    )
+    existing = cursor.fetchone()
+    view = sql.Identifier(schema, view_name)
+    if existing and existing[0] == "r":
+        cursor.execute(sql.SQL("DROP TABLE {};").format(view))
+    elif existing:
+        cursor.execute(sql.SQL("DROP VIEW {};").format(view))
+    cursor.execute(sql.SQL("CREATE VIEW {} AS ").format(view) + sql.SQL(select_sql))
@@ -0,0 +1,133 @@
+import io
+import pandas as pd
+from psycopg2 import sql
+
+# Rows serialized per COPY batch, which bounds the size of the in-memory CSV buffer
+COPY_BATCH_ROWS = 100_000
+
+
+def map_dtype_to_pg(dtype):
+    """Map a pandas dtype to the PostgreSQL column type used for bulk loads."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def widen_pg_type(current, needed):
+    """A column type holding the values of both types: numbers widen to DOUBLE PRECISION, anything else to TEXT."""
+    if current == needed:
+        return current
+    if {current, needed} <= {"BIGINT", "DOUBLE PRECISION"}:
+        return "DOUBLE PRECISION"
+    return "TEXT"
+
+
+class CopyLoader:
+    """
+    Stream DataFrames into a staging table with COPY FROM STDIN and swap it in for
+    the live table in the same transaction, so readers never see a partial load.
+    Columns without an explicit type take the first frame's type and are widened when a
+    later frame does not fit it, e.g. a BIGINT column once a chunk has nulls and is float64.
+    """
+    def __init__(self, engine, table_name, schema="loans", column_types=None):
+        self.engine = engine
+        self.table_name = table_name
+        self.schema = schema
+        self.column_types = column_types or {}
+        self.staging_name = f"{table_name}__staging"
+        self.connection = None
+        self.cursor = None
+        self.columns = None
+        self.types = {}
+        self.rows = 0
+
+    def _table(self, name):
+        return sql.Identifier(self.schema, name)
+
+    def _create_staging_table(self, df):
+        self.columns = list(df.columns)
+        self.types = {col: self.column_types.get(col, map_dtype_to_pg(dtype)) for col, dtype in df.dtypes.items()}
+        column_defs = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(pg_type)) for col, pg_type in self.types.items()
+        )
+        self.connection = self.engine.raw_connection()
+        self.cursor = self.connection.cursor()
+        self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(self._table(self.staging_name)))
+        self.cursor.execute(
+            sql.SQL("CREATE TABLE {} ({});").format(self._table(self.staging_name), column_defs)
+        )
+
+    def _widen_columns(self, df):
+        for col, dtype in df.dtypes.items():
+            if col in self.column_types or col not in self.types:
+                continue
+            widened = widen_pg_type(self.types[col], map_dtype_to_pg(dtype))
+            if widened != self.types[col]:
+                self.cursor.execute(
+                    sql.SQL("ALTER TABLE {} ALTER COLUMN {} TYPE {} USING {}::{};").format(
+                        self._table(self.staging_name), sql.Identifier(col), sql.SQL(widened),
+                        sql.Identifier(col), sql.SQL(widened)
+                    )
+                )
+                print(f"Column '{col}' of '{self.table_name}' widened from {self.types[col]} to {widened}.")
+                self.types[col] = widened
+
+    def write(self, df, batch_rows=COPY_BATCH_ROWS):
+        """COPY one DataFrame (or chunk) into the staging table."""
+        if self.connection is None:
+            self._create_staging_table(df)
+        else:
+            self._widen_columns(df)
+        # to_csv quotes the missing values of a single-column frame, so quoted empty fields are NULL too
+        column_list = sql.SQL(", ").join(sql.Identifier(col) for col in self.columns)
+        copy_statement = sql.SQL(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '', FORCE_NULL ({}))"
+        ).format(self._table(self.staging_name), column_list, column_list).as_string(self.cursor)
+        for start in range(0, len(df), batch_rows):
+            buffer = io.StringIO()
+            df.iloc[start:start + batch_rows][self.columns].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            self.cursor.copy_expert(copy_statement, buffer)
+        self.rows += len(df)
+
+    def commit(self):
+        """Replace the live table with the staging table and commit."""
+        try:
+            self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(self._table(self.table_name)))
+            self.cursor.execute(
+                sql.SQL("ALTER TABLE {} RENAME TO {};").format(
+                    self._table(self.staging_name), sql.Identifier(self.table_name)
+                )
+            )
+            self.connection.commit()
+        finally:
+            self.close()
+
+    def abort(self):
+        if self.connection is not None:
+            self.connection.rollback()
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.cursor.close()
+            self.connection.close()
+            self.connection = None
+
+
+def copy_dataframe(df, table_name, engine, schema="loans", column_types=None):
+    """Bulk-load a DataFrame through COPY, replacing the table atomically."""
+    loader = CopyLoader(engine, table_name, schema=schema, column_types=column_types)
+    try:
+        loader.write(df)
+        loader.commit()
+    except Exception:
+        loader.abort()
+        raise
+    return loader.rows
@@ -0,0 +1,193 @@
+import math
+import numpy as np
+import pandas as pd
+from pandas.core.dtypes.cast import find_common_type
+
+# Pattern the profiling job uses for its default string rule
+DEFAULT_STRING_PATTERN = r"^[A-Za-z0-9_\s]*$"
+HLL_PRECISION = 14
+
+
+# Shared hash for nulls, so they merge into one distinct value across chunks and dtypes
+NULL_HASH = np.uint64(pd.util.hash_array(np.array([None], dtype=object), categorize=False)[0])
+
+
+def hash_values(series):
+    """
+    64-bit hashes of a numeric column. Values are hashed as float64 whatever the chunk's dtype,
+    so 1 in an Int64 chunk and 1.0 in a Float64 chunk are one distinct value; nulls hash to NULL_HASH.
+    """
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    hashes = pd.util.hash_array(values, categorize=False)
+    hashes[np.isnan(values)] = NULL_HASH
+    return hashes
+
+
+def hash_uniques(uniques):
+    """Hashes of the distinct values of a non-numeric column; numbers among them hash like hash_values."""
+    values = np.asarray(uniques, dtype=object)
+    hashes = pd.util.hash_array(values, categorize=False)
+    if pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty"):
+        return hashes
+    numbers = np.array([isinstance(value, (int, float, np.number)) for value in values], dtype=bool)
+    if numbers.any():
+        hashes[numbers] = hash_values(pd.Series(values[numbers].astype(np.float64)))
+    return hashes
+
+
+def _bit_length(values):
+    # frexp is exact on 32-bit halves, so the 64-bit bit length is computed in two steps
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    high_bits = np.frexp(high)[1]
+    low_bits = np.frexp(low)[1]
+    return np.where(high > 0, high_bits + 32, low_bits)
+
+
+class HyperLogLog:
+    """Fixed-memory distinct-count sketch over 64-bit hashes; merging is a register-wise max."""
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class ColumnStats:
+    """
+    Mergeable single-column summary: row and null counts, distinct count (exact hash
+    set or HyperLogLog sketch), min/max for numeric columns and a string-pattern summary.
+    """
+    def __init__(self, dtype, rows=0, nulls=0, minimum=None, maximum=None, distinct=None,
+                 pattern_mismatches=0, max_length=None):
+        self.dtype = dtype
+        self.rows = rows
+        self.nulls = nulls
+        self.minimum = minimum
+        self.maximum = maximum
+        self.distinct = distinct
+        self.pattern_mismatches = pattern_mismatches
+        self.max_length = max_length
+
+    @property
+    def is_numeric(self):
+        return pd.api.types.is_numeric_dtype(self.dtype)
+
+    @property
+    def is_string(self):
+        # Categoricals of strings are profiled like the object columns they replace
+        if isinstance(self.dtype, pd.CategoricalDtype):
+            return pd.api.types.is_string_dtype(self.dtype.categories.dtype)
+        return pd.api.types.is_string_dtype(self.dtype)
+
+    @property
+    def nullable(self):
+        return self.nulls > 0
+
+    @property
+    def distinct_count(self):
+        if isinstance(self.distinct, HyperLogLog):
+            return self.distinct.estimate()
+        return int(len(self.distinct))
+
+    @property
+    def is_unique(self):
+        # Matches Series.is_unique, where nulls count as one value
+        return self.distinct_count >= self.rows
+
+    def merge(self, other):
+        if isinstance(self.distinct, HyperLogLog):
+            distinct = self.distinct.merge(other.distinct)
+        else:
+            distinct = np.union1d(self.distinct, other.distinct)
+        # The wider dtype wins, as it would if the chunks were read as one frame; this
+        # covers the nullable Int64/Float64 extension dtypes, which numpy cannot promote
+        dtype = self.dtype if self.dtype == other.dtype else find_common_type([self.dtype, other.dtype])
+        return ColumnStats(
+            dtype,
+            rows=self.rows + other.rows,
+            nulls=self.nulls + other.nulls,
+            minimum=_combine(min, self.minimum, other.minimum),
+            maximum=_combine(max, self.maximum, other.maximum),
+            distinct=distinct,
+            pattern_mismatches=self.pattern_mismatches + other.pattern_mismatches,
+            max_length=_combine(max, self.max_length, other.max_length)
+        )
+
+
+def _combine(reducer, left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return reducer(left, right)
+
+
+def _scalar(value):
+    if value is None or pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def compute_column_stats(df, sketch=False, pattern=DEFAULT_STRING_PATTERN):
+    """
+    Compute ColumnStats for every column of a frame. Numeric columns are hashed directly;
+    other columns are factorized once and every later step works on their unique values.
+    """
+    stats = {}
+    for col in df.columns:
+        series = df[col]
+        column = ColumnStats(series.dtype, rows=int(len(series)))
+        if column.is_numeric:
+            hashes = hash_values(series)
+            column.nulls = int(series.isna().sum())
+            column.minimum = _scalar(series.min())
+            column.maximum = _scalar(series.max())
+        else:
+            codes, uniques = pd.factorize(series)
+            column.nulls = int(np.count_nonzero(codes == -1))
+            hashes = hash_uniques(uniques)
+            if column.nulls:
+                hashes = np.append(hashes, NULL_HASH)
+            if column.is_string and len(uniques):
+                values = pd.Series(uniques).astype(str)
+                counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+                column.pattern_mismatches = int(counts[~values.str.fullmatch(pattern).to_numpy()].sum())
+                column.max_length = int(values.str.len().max())
+        column.distinct = HyperLogLog().add_hashes(hashes) if sketch else np.unique(hashes)
+        stats[col] = column
+    return stats
+
+
+def merge_column_stats(left, right):
+    """Merge two {column: ColumnStats} maps, e.g. from consecutive chunks of one file."""
+    merged = dict(left)
+    for col, column in right.items():
+        merged[col] = merged[col].merge(column) if col in merged else column
+    return merged
+
+
+def compute_chunked_stats(chunks, sketch=False, pattern=DEFAULT_STRING_PATTERN):
+    """Fold the stats of an iterable of chunks so files larger than memory can be summarized."""
+    stats = {}
+    for chunk in chunks:
+        stats = merge_column_stats(stats, compute_column_stats(chunk, sketch, pattern))
+    return stats
@@ -0,0 +1,140 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+import boto3
+from psycopg2.pool import ThreadedConnectionPool
+from sqlalchemy import create_engine
+from instrumentation import timed_step
+
+SECRET_NAME = "db-secret"
+REGION_NAME = "us-east-1"
+RDS_DB = "fintech"
+# Rotated credentials are picked up within this many seconds
+SECRET_TTL_SECONDS = 900
+
+# Secrets, engines and pools are created on first use and shared by every thread of the job
+_lock = threading.RLock()
+_secrets = {}
+_engines = {}
+_pools = {}
+# Pools replaced after a credential rotation, closed once their borrowed connections are returned
+_retired_pools = []
+
+
+def get_secret(secret_name=SECRET_NAME, ttl=SECRET_TTL_SECONDS):
+    """Secrets Manager secret as a dict, fetched on first use and cached for ttl seconds."""
+    with _lock:
+        cached = _secrets.get(secret_name)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        with timed_step(f"bootstrap:secret:{secret_name}"):
+            client = boto3.session.Session().client(service_name="secretsmanager", region_name=REGION_NAME)
+            secret = json.loads(client.get_secret_value(SecretId=secret_name)["SecretString"])
+        _secrets[secret_name] = (time.monotonic(), secret)
+        return secret
+
+
+def connection_params(database=RDS_DB, secret_name=SECRET_NAME):
+    secret = get_secret(secret_name)
+    return {
+        "host": secret["host"],
+        "port": int(secret["port"]),
+        "user": secret["username"],
+        "password": secret["password"],
+        "database": database
+    }
+
+
+def _credentials(params):
+    return tuple(params[key] for key in ("host", "port", "user", "password"))
+
+
+def get_engine(database=RDS_DB, secret_name=SECRET_NAME, **engine_options):
+    """
+    SQLAlchemy engine for the database, created on first use and reused afterwards. The pool
+    opens connections lazily and checks them before use. If the credentials in the secret
+    change, the engine is disposed and rebuilt.
+    """
+    params = connection_params(database, secret_name)
+    key = (database, secret_name, tuple(sorted(engine_options.items())))
+    with _lock:
+        cached = _engines.get(key)
+        if cached is not None and cached[0] == _credentials(params):
+            return cached[1]
+        if cached is not None:
+            cached[1].dispose()
+        engine = create_engine(
+            "postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}".format(**params),
+            **{"pool_pre_ping": True, **engine_options}
+        )
+        _engines[key] = (_credentials(params), engine)
+        return engine
+
+
+def _in_use(pool):
+    # ThreadedConnectionPool keeps the connections it has handed out in _used
+    return bool(pool._used)
+
+
+def get_pool(database=RDS_DB, secret_name=SECRET_NAME, maxconn=4):
+    """
+    psycopg2 ThreadedConnectionPool for the database, created on first use. If the credentials
+    in the secret change, a new pool replaces it; the old one is closed right away only if none
+    of its connections are borrowed, otherwise when the last one is returned.
+    """
+    params = connection_params(database, secret_name)
+    key = (database, secret_name, maxconn)
+    with _lock:
+        cached = _pools.get(key)
+        if cached is not None and cached[0] == _credentials(params) and not cached[1].closed:
+            return cached[1]
+        if cached is not None and not cached[1].closed:
+            if _in_use(cached[1]):
+                _retired_pools.append(cached[1])
+            else:
+                cached[1].closeall()
+        with timed_step(f"bootstrap:connect:{database}"):
+            pool = ThreadedConnectionPool(1, maxconn, **params)
+        _pools[key] = (_credentials(params), pool)
+        return pool
+
+
+def return_connection(pool, conn):
+    """Give a connection back to the pool it was borrowed from, closing that pool if it was replaced."""
+    pool.putconn(conn)
+    with _lock:
+        if pool in _retired_pools and not _in_use(pool):
+            pool.closeall()
+            _retired_pools.remove(pool)
+
+
+@contextmanager
+def pooled_connection(database=RDS_DB, secret_name=SECRET_NAME):
+    """
+    Borrow a psycopg2 connection from the pool. The transaction is committed when the block
+    succeeds and rolled back when it raises, and the connection goes back to the pool.
+    """
+    pool = get_pool(database, secret_name)
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_connection(pool, conn)
+
+
+def close_all():
+    """Dispose of every engine and pool, e.g. at the end of a job."""
+    with _lock:
+        for _, engine in _engines.values():
+            engine.dispose()
+        for pool in [pool for _, pool in _pools.values()] + _retired_pools:
+            if not pool.closed:
+                pool.closeall()
+        _engines.clear()
+        _pools.clear()
+        _retired_pools.clear()
@@ -0,0 +1,103 @@
+from psycopg2.extras import execute_values
+
+RDS_SCHEMA = "loans"
+
+
+def ensure_fingerprint_columns(cursor, schema=RDS_SCHEMA):
+    """Add the fingerprint columns to the datasets table if they do not exist yet."""
+    cursor.execute(
+        f"""
+        ALTER TABLE {schema}.datasets
+            ADD COLUMN IF NOT EXISTS source_etag TEXT,
+            ADD COLUMN IF NOT EXISTS source_size BIGINT,
+            ADD COLUMN IF NOT EXISTS content_hash TEXT,
+            ADD COLUMN IF NOT EXISTS processed_hash TEXT,
+            ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS quality_status TEXT,
+            ADD COLUMN IF NOT EXISTS quality_hash TEXT;
+        """
+    )
+
+
+def fetch_fingerprints(cursor, schema=RDS_SCHEMA):
+    cursor.execute(f"SELECT dataset_name, content_hash, processed_hash FROM {schema}.datasets;")
+    return {name: (content_hash, processed_hash) for name, content_hash, processed_hash in cursor.fetchall()}
+
+
+def record_fingerprints(cursor, entries, schema=RDS_SCHEMA):
+    """Store the fingerprints of several datasets with a single UPDATE ... FROM (VALUES ...)."""
+    if not entries:
+        return
+    execute_values(
+        cursor,
+        f"""
+        UPDATE {schema}.datasets AS d
+        SET source_etag = v.etag, source_size = v.size, content_hash = v.content_hash
+        FROM (VALUES %s) AS v (dataset_name, etag, size, content_hash)
+        WHERE d.dataset_name = v.dataset_name;
+        """,
+        [
+            (name, entry.get("etag"), entry.get("size"), entry["content_hash"])
+            for name, entry in entries.items()
+        ],
+        template="(%s, %s, %s::BIGINT, %s)",
+        page_size=len(entries)
+    )
+
+
+def changed_datasets(cursor, dataset_names, schema=RDS_SCHEMA, skip_quarantined=False):
+    """
+    Return the datasets whose input changed since the last successful run.
+    Datasets without a recorded fingerprint are always treated as changed.
+    With skip_quarantined, datasets whose current input failed the quality gate are left out.
+    """
+    fingerprints = fetch_fingerprints(cursor, schema)
+    quarantined = quarantined_datasets(cursor, schema) if skip_quarantined else set()
+    changed = []
+    for name in dataset_names:
+        content_hash, processed_hash = fingerprints.get(name, (None, None))
+        if name in quarantined:
+            print(f"Dataset '{name}' failed the quality gate and is quarantined, skipping it.")
+        elif content_hash is None or content_hash != processed_hash:
+            changed.append(name)
+    return changed
+
+
+def record_quality_status(cursor, statuses, schema=RDS_SCHEMA):
+    """Store the quality gate outcome ({dataset_name: 'passed' | 'failed'}) for each dataset's current input."""
+    if not statuses:
+        return
+    execute_values(
+        cursor,
+        f"""
+        UPDATE {schema}.datasets AS d
+        SET quality_status = v.status, quality_hash = d.content_hash
+        FROM (VALUES %s) AS v (dataset_name, status)
+        WHERE d.dataset_name = v.dataset_name;
+        """,
+        list(statuses.items()),
+        page_size=len(statuses)
+    )
+
+
+def quarantined_datasets(cursor, schema=RDS_SCHEMA):
+    """Datasets whose current input failed the quality gate; a new input lifts the quarantine."""
+    cursor.execute(
+        f"""
+        SELECT dataset_name FROM {schema}.datasets
+        WHERE quality_status = 'failed' AND quality_hash = content_hash;
+        """
+    )
+    return {name for name, in cursor.fetchall()}
+
+
+def mark_processed(cursor, dataset_names, schema=RDS_SCHEMA):
+    """Record that the current input of each dataset went through the whole pipeline."""
+    cursor.execute(
+        f"""
+        UPDATE {schema}.datasets
+        SET processed_hash = content_hash, processed_at = NOW()
+        WHERE dataset_name = ANY(%s);
+        """,
+        (list(dataset_names),)
+    )
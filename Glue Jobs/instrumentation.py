@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import functools
+import resource
+from contextlib import contextmanager
+import pandas as pd
+
+SUMMARY_COLUMNS = [
+    "step", "calls", "errors", "wall_seconds", "cpu_seconds", "peak_rss_mb",
+    "rows_in", "rows_out", "mb_read", "mb_written"
+]
+
+# Step records of this process, in the order the steps finished
+_records = []
+_state = {"job": os.path.splitext(os.path.basename(sys.argv[0]))[0] or "job"}
+
+
+def set_job(name):
+    """Name the job the following step records belong to (defaults to the script name)."""
+    _state["job"] = name
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def io_counters():
+    """
+    Bytes read and written by this process, including S3 and database traffic, from
+    /proc/self/io. Returns (None, None) where the counters are not available.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def count_rows(value):
+    """Rows of a DataFrame, or of the DataFrames in a list, tuple or dict; None otherwise."""
+    if isinstance(value, pd.DataFrame):
+        return int(len(value))
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        counts = [count_rows(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def _delta(end, start):
+    return end - start if end is not None and start is not None else None
+
+
+@contextmanager
+def timed_step(name, rows_in=None):
+    """
+    Measure one pipeline step and emit it as a JSON line. The yielded dict can be filled in
+    with rows_out (or rows_in) while the step runs. CPU time, I/O and peak RSS are process-wide,
+    so steps running concurrently on threads share them.
+    """
+    record = {"job": _state["job"], "step": name, "rows_in": rows_in, "rows_out": None}
+    read_start, written_start = io_counters()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    status = "error"
+    try:
+        yield record
+        status = "ok"
+    finally:
+        read_end, written_end = io_counters()
+        record.update({
+            "status": status,
+            "wall_seconds": round(time.perf_counter() - wall_start, 3),
+            "cpu_seconds": round(time.process_time() - cpu_start, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "bytes_read": _delta(read_end, read_start),
+            "bytes_written": _delta(written_end, written_start),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        })
+        _records.append(record)
+        print(json.dumps(record, separators=(",", ":")))
+
+
+def instrumented(name=None):
+    """
+    Decorator form of timed_step. Rows in and out are taken from the DataFrames among the
+    positional arguments and in the return value.
+    """
+    def decorator(func):
+        step_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed_step(step_name, rows_in=count_rows(list(args))) as record:
+                result = func(*args, **kwargs)
+                record["rows_out"] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def step_records():
+    return list(_records)
+
+
+def summarize(records=None):
+    """One row per step with call counts and totals, sorted by step name so runs diff cleanly."""
+    frame = pd.DataFrame(records if records is not None else _records)
+    if frame.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    frame["mb_read"] = frame["bytes_read"] / 1e6
+    frame["mb_written"] = frame["bytes_written"] / 1e6
+    summary = frame.groupby("step").agg(
+        calls=("step", "size"),
+        errors=("status", lambda status: int((status != "ok").sum())),
+        wall_seconds=("wall_seconds", "sum"),
+        cpu_seconds=("cpu_seconds", "sum"),
+        peak_rss_mb=("peak_rss_mb", "max"),
+        # Steps that never report rows stay empty instead of showing 0
+        rows_in=("rows_in", lambda rows: rows.sum(min_count=1)),
+        rows_out=("rows_out", lambda rows: rows.sum(min_count=1)),
+        mb_read=("mb_read", "sum"),
+        mb_written=("mb_written", "sum")
+    ).reset_index()
+    summary = summary.astype({"rows_in": "Int64", "rows_out": "Int64"})
+    return summary[SUMMARY_COLUMNS].round(3)
+
+
+def print_summary(records=None):
+    summary = summarize(records)
+    print(f"Run summary for {_state['job']}:")
+    print(summary.to_string(index=False) if not summary.empty else "no steps recorded")
+    return summary
+
+
+def write_metrics(path, records=None):
+    """Write the step records as JSON lines to a local or s3:// path."""
+    records = records if records is not None else _records
+    pd.DataFrame(records).to_json(path, orient="records", lines=True)
@@ -0,0 +1,23 @@
+import sys
+
+
+def optional_arg(name, default=None, argv=None):
+    """
+    Value of an optional --NAME job argument, or default when it is not passed. awsglue is
+    only imported when the argument is present, so the jobs can also be imported outside Glue;
+    without awsglue (e.g. under local_runner.py) '--NAME value' and '--NAME=value' are parsed directly.
+    """
+    argv = sys.argv if argv is None else argv
+    flag = f"--{name}"
+    if not any(arg == flag or arg.startswith(f"{flag}=") for arg in argv):
+        return default
+    try:
+        from awsglue.utils import getResolvedOptions
+    except ImportError:
+        for i, arg in enumerate(argv):
+            if arg.startswith(f"{flag}="):
+                return arg.split("=", 1)[1]
+            if arg == flag and i + 1 < len(argv):
+                return argv[i + 1]
+        return default
+    return getResolvedOptions(argv, [name])[name]
@@ -0,0 +1,49 @@
+from psycopg2.extras import execute_values
+
+RDS_SCHEMA = "loans"
+
+
+def upsert_datasets(cursor, datasets, schema=RDS_SCHEMA):
+    """
+    Insert or refresh (dataset_name, s3_path) rows in one statement and return
+    {dataset_name: dataset_id}, including the ids of datasets that already existed.
+    """
+    if not datasets:
+        return {}
+    rows = execute_values(
+        cursor,
+        f"""
+        INSERT INTO {schema}.datasets (dataset_name, s3_path)
+        VALUES %s
+        ON CONFLICT (dataset_name) DO UPDATE SET s3_path = EXCLUDED.s3_path
+        RETURNING dataset_name, dataset_id;
+        """,
+        list(datasets),
+        page_size=len(datasets),
+        fetch=True
+    )
+    return dict(rows)
+
+
+def upsert_columns(cursor, column_rows, schema=RDS_SCHEMA):
+    """
+    Upsert (dataset_id, column_name, data_type, nullable, uniqueness) rows in one statement.
+    Existing validation rules are left untouched.
+    """
+    if not column_rows:
+        return
+    execute_values(
+        cursor,
+        f"""
+        INSERT INTO {schema}.columns
+        (dataset_id, column_name, data_type, nullable, uniqueness, validation_rules)
+        VALUES %s
+        ON CONFLICT (dataset_id, column_name) DO UPDATE SET
+            data_type = EXCLUDED.data_type,
+            nullable = EXCLUDED.nullable,
+            uniqueness = EXCLUDED.uniqueness;
+        """,
+        column_rows,
+        template="(%s, %s, %s, %s, %s, NULL)",
+        page_size=len(column_rows)
+    )
@@ -0,0 +1,113 @@
+import os
+import json
+import boto3
+
+S3_BUCKET = "source-system-754"
+QUARANTINE_PREFIX = "quarantine/"
+
+# "error" rules fail their dataset, "warning" rules are only reported. A rule counts as failed
+# once more than max_unexpected_percent of the rows break it.
+DEFAULT_THRESHOLD = {"severity": "error", "max_unexpected_percent": 0.0}
+
+# Thresholds by rule, optionally narrowed to "<dataset>.<rule>" or "<dataset>.<column>.<rule>";
+# the most specific entry wins. The generated regex only allows word characters and spaces,
+# which raw text columns routinely break, so it is a warning by default.
+RULE_THRESHOLDS = {
+    "expect_column_values_to_not_be_null": {"severity": "error"},
+    "expect_column_values_to_be_unique": {"severity": "error"},
+    "expect_column_values_to_be_between": {"severity": "error"},
+    "expect_column_values_to_match_regex": {"severity": "warning"},
+}
+
+
+def load_thresholds(overrides=None):
+    """RULE_THRESHOLDS updated with a JSON object of the same shape, e.g. from a job argument."""
+    thresholds = {key: dict(value) for key, value in RULE_THRESHOLDS.items()}
+    for key, value in json.loads(overrides or "{}").items():
+        thresholds.setdefault(key, {}).update(value)
+    return thresholds
+
+
+def rule_threshold(thresholds, dataset_name, column, expectation_type):
+    for key in (f"{dataset_name}.{column}.{expectation_type}", f"{dataset_name}.{expectation_type}", expectation_type):
+        if key in thresholds:
+            return {**DEFAULT_THRESHOLD, **thresholds[key]}
+    return DEFAULT_THRESHOLD
+
+
+def rule_outcomes(report):
+    """(column, expectation_type, unexpected_count, element_count, error) per rule of a native or GX report."""
+    for result in report["results"]:
+        if "expectation_config" in result:
+            config, details = result["expectation_config"], result.get("result") or {}
+            exception = (result.get("exception_info") or {}).get("raised_exception")
+            element_count = details.get("element_count", 0)
+            unexpected_count = details.get("unexpected_count", 0 if result["success"] else element_count)
+            yield (config["kwargs"].get("column"), config["expectation_type"], unexpected_count, element_count,
+                   "raised exception" if exception else None)
+        else:
+            yield (result["column"], result["expectation_type"], result["unexpected_count"], result["element_count"],
+                   result.get("error"))
+
+
+def dataset_verdict(dataset_name, report, thresholds):
+    """Pass/fail of one dataset with the rules ('column:rule') that failed it or only warned."""
+    failed_rules, warnings = [], []
+    for column, expectation_type, unexpected_count, element_count, error in rule_outcomes(report):
+        threshold = rule_threshold(thresholds, dataset_name, column, expectation_type)
+        unexpected_percent = 100.0 * unexpected_count / element_count if element_count else 0.0
+        if error is None and (unexpected_count == 0 or unexpected_percent <= threshold["max_unexpected_percent"]):
+            continue
+        (failed_rules if threshold["severity"] == "error" else warnings).append(f"{column}:{expectation_type}")
+    return {"passed": not failed_rules, "failed_rules": failed_rules, "warnings": warnings}
+
+
+def gate_verdict(verdicts, unvalidated, run_time, quarantined=()):
+    """
+    Verdict of a run for the state machine. The status is FAILED when every dataset validated
+    in this run failed, PARTIAL when some of the changed datasets can go on to cleaning, and
+    PASSED when none failed. Datasets that were not validated (e.g. without rules) are not held
+    back. Quarantined datasets, whose unchanged input failed an earlier run, are only listed:
+    a run with nothing new to validate passes, and cleaning skips them.
+    """
+    passed = sorted(name for name, verdict in verdicts.items() if verdict["passed"])
+    failed = sorted(name for name, verdict in verdicts.items() if not verdict["passed"])
+    if not failed:
+        status = "PASSED"
+    elif passed or unvalidated:
+        status = "PARTIAL"
+    else:
+        status = "FAILED"
+    return {
+        "run_time": run_time.isoformat(),
+        "status": status,
+        "passed": passed,
+        "failed": failed,
+        "not_validated": sorted(unvalidated),
+        "quarantined": sorted(quarantined),
+        "datasets": verdicts
+    }
+
+
+def quarantine_dataset(dataset_name, source_key, verdict, run_time, bucket=S3_BUCKET):
+    """
+    Copy the inputs of a failing dataset (its CSV, or every object of a partitioned one) with
+    its verdict to quarantine/<dataset>/<run>/. The inputs stay in place; the dataset is held
+    back until its content changes.
+    """
+    s3 = boto3.client("s3")
+    prefix = f"{QUARANTINE_PREFIX}{dataset_name}/{run_time.strftime('%Y%m%d_%H%M%S')}/"
+    stem = os.path.splitext(source_key)[0]
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=stem):
+        for obj in page.get("Contents", []):
+            if obj["Key"] == source_key or obj["Key"].startswith(f"{stem}/"):
+                # Managed copy, so inputs over 5 GB are copied in parts
+                s3.copy({"Bucket": bucket, "Key": obj["Key"]}, bucket,
+                        prefix + obj["Key"][len(os.path.dirname(source_key)) + 1:])
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}verdict.json",
+        Body=json.dumps(verdict, separators=(",", ":")),
+        ContentType="application/json"
+    )
+    print(f"Dataset '{dataset_name}' quarantined to s3://{bucket}/{prefix}")
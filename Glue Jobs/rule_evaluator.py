@@ -0,0 +1,273 @@
+import re
+import json
+import heapq
+import numpy as np
+import pandas as pd
+
+# Row indexes reported per failing rule
+SAMPLE_SIZE = 20
+
+
+class ColumnView:
+    """
+    Derived forms of one column, computed on first use and shared by all rules of the column:
+    the null mask, factorized codes and uniques, and the values as numbers. With codes_for_nulls,
+    the null mask is taken from the codes, which is cheaper when the column is factorized anyway.
+    """
+    def __init__(self, series, codes_for_nulls=False):
+        self.series = series
+        self.codes_for_nulls = codes_for_nulls
+        self._isna = None
+        self._factorized = None
+        self._numeric = None
+
+    @property
+    def isna(self):
+        if self._isna is None:
+            if self.codes_for_nulls:
+                # Factorizing marks nulls with code -1
+                self._isna = self.factorized[0] == -1
+            else:
+                self._isna = self.series.isna().to_numpy()
+        return self._isna
+
+    @property
+    def factorized(self):
+        if self._factorized is None:
+            self._factorized = pd.factorize(self.series)
+        return self._factorized
+
+    @property
+    def numeric(self):
+        if self._numeric is None:
+            self._numeric = pd.to_numeric(self.series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        return self._numeric
+
+
+def not_null_check(rule):
+    return lambda view: view.isna
+
+
+def unique_check(rule):
+    def check(view):
+        # Every occurrence of a repeated value fails; nulls are ignored, as in Great Expectations
+        codes, uniques = view.factorized
+        # The trailing zero is picked up by code -1, which also covers all-null columns
+        counts = np.append(np.bincount(codes[codes >= 0], minlength=len(uniques)), 0)
+        return counts[codes] > 1
+    return check
+
+
+def between_check(rule):
+    minimum, maximum = rule.get("min"), rule.get("max")
+
+    def check(view):
+        values = view.numeric
+        # Values that are present but not numbers are out of range
+        failed = np.isnan(values) & ~view.isna
+        with np.errstate(invalid="ignore"):
+            if minimum is not None:
+                failed |= values < minimum
+            if maximum is not None:
+                failed |= values > maximum
+        return failed
+    return check
+
+
+def regex_check(rule):
+    pattern = re.compile(rule["regex"])
+
+    def check(view):
+        # The pattern runs once per distinct value; re.search matches GX's str.contains
+        codes, uniques = view.factorized
+        mismatched = np.array([pattern.search(str(value)) is None for value in uniques], dtype=bool)
+        return (codes >= 0) & np.append(mismatched, False)[codes]
+    return check
+
+
+# Rules that work on the factorized column
+FACTORIZED_RULES = {"expect_column_values_to_be_unique", "expect_column_values_to_match_regex"}
+
+RULE_CHECKS = {
+    "expect_column_values_to_not_be_null": not_null_check,
+    "expect_column_values_to_be_unique": unique_check,
+    "expect_column_values_to_be_between": between_check,
+    "expect_column_values_to_match_regex": regex_check,
+}
+
+
+class RuleTally:
+    """Failure count and first failing rows of one rule, folded chunk by chunk."""
+    def __init__(self, compiled_rule, sample_size):
+        self.compiled_rule = compiled_rule
+        self.sample_size = sample_size
+        self.unexpected_count = 0
+        self.sample = []
+
+    def add(self, view, offset):
+        failed_positions = np.flatnonzero(self.compiled_rule.check(view))
+        self.unexpected_count += len(failed_positions)
+        room = self.sample_size - len(self.sample)
+        if room > 0:
+            self.sample.extend((failed_positions[:room] + offset).tolist())
+
+    def finish(self):
+        return self.unexpected_count, self.sample
+
+
+class UniqueTally(RuleTally):
+    """
+    Uniqueness across chunks, with every non-null value seen so far kept in a dict with its count
+    and first row. A first occurrence is only known to fail once a repeat arrives in a later
+    chunk, so first occurrences are added to the sample when the last chunk has been seen.
+    """
+    def __init__(self, compiled_rule, sample_size):
+        super().__init__(compiled_rule, sample_size)
+        self.seen = {}
+        self.repeats = []
+
+    def add(self, view, offset):
+        codes, uniques = view.factorized
+        valid_positions = np.flatnonzero(codes >= 0)
+        valid_codes = codes[valid_positions]
+        counts = np.bincount(valid_codes, minlength=len(uniques))
+        first_positions = valid_positions[np.unique(valid_codes, return_index=True)[1]]
+        seen_before = np.zeros(len(uniques), dtype=bool)
+        for code, (value, count, first) in enumerate(zip(uniques.tolist(), counts.tolist(), first_positions.tolist())):
+            entry = self.seen.get(value)
+            if entry is None:
+                self.seen[value] = [count, first + offset]
+            else:
+                entry[0] += count
+                seen_before[code] = True
+        room = self.sample_size - len(self.repeats)
+        if room > 0:
+            # Rows whose value already occurred, earlier in this chunk or in an earlier one
+            repeated = np.ones(len(valid_positions), dtype=bool)
+            repeated[np.searchsorted(valid_positions, first_positions)] = seen_before
+            self.repeats.extend((valid_positions[repeated][:room] + offset).tolist())
+
+    def finish(self):
+        duplicated = [entry for entry in self.seen.values() if entry[0] > 1]
+        unexpected_count = sum(count for count, _ in duplicated)
+        first_rows = heapq.nsmallest(self.sample_size, (first for _, first in duplicated))
+        return unexpected_count, sorted(set(first_rows) | set(self.repeats))[:self.sample_size]
+
+
+# Tallies of rules whose failures depend on other chunks
+RULE_TALLIES = {"expect_column_values_to_be_unique": UniqueTally}
+
+
+class CompiledRule:
+    def __init__(self, column, rule, check):
+        self.column = column
+        self.rule = rule
+        self.check = check
+
+    @property
+    def expectation_type(self):
+        return self.rule["rule"]
+
+    def tally(self, sample_size):
+        return RULE_TALLIES.get(self.expectation_type, RuleTally)(self, sample_size)
+
+
+def compile_rules(rules_by_column):
+    """
+    Turn the validation_rules stored in loans.columns ({column: [rule, ...]}) into checks that
+    return a boolean mask of failing rows. Unsupported rules are reported and skipped.
+    psycopg2 only parses json/jsonb columns, so rules stored as text arrive as JSON strings.
+    """
+    compiled = []
+    for column, rules in rules_by_column.items():
+        if isinstance(rules, str):
+            rules = json.loads(rules)
+        for rule in rules or []:
+            factory = RULE_CHECKS.get(rule.get("rule"))
+            if factory is None:
+                print(f"Unsupported rule for column '{column}': {rule.get('rule')}. Skipping this rule.")
+                continue
+            compiled.append(CompiledRule(column, rule, factory(rule)))
+    return compiled
+
+
+def rule_result(compiled_rule, element_count, unexpected_count, sample, error=None):
+    result = {
+        "expectation_type": compiled_rule.expectation_type,
+        "column": compiled_rule.column,
+        "success": unexpected_count == 0 and error is None,
+        "element_count": element_count,
+        "unexpected_count": unexpected_count,
+        "unexpected_index_list": sample
+    }
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def summarize_results(results):
+    """Dataset-level report in the shape of a GX validation result."""
+    successful = sum(result["success"] for result in results)
+    return {
+        "success": successful == len(results),
+        "statistics": {
+            "evaluated_expectations": len(results),
+            "successful_expectations": successful,
+            "unsuccessful_expectations": len(results) - successful
+        },
+        "results": results
+    }
+
+
+def column_views(df, compiled_rules):
+    factorized_columns = {rule.column for rule in compiled_rules if rule.expectation_type in FACTORIZED_RULES}
+    return {
+        column: ColumnView(df[column], codes_for_nulls=column in factorized_columns)
+        for column in {rule.column for rule in compiled_rules} if column in df.columns
+    }
+
+
+def evaluate_rules(df, compiled_rules, sample_size=SAMPLE_SIZE):
+    """
+    Run every compiled rule against a frame in one pass over its columns and return the
+    report with, per rule, the failure count and up to sample_size failing row indexes.
+    """
+    views = column_views(df, compiled_rules)
+    results = []
+    for compiled_rule in compiled_rules:
+        if compiled_rule.column not in views:
+            results.append(rule_result(compiled_rule, len(df), len(df), [], error="column missing"))
+            continue
+        failed = compiled_rule.check(views[compiled_rule.column])
+        failed_positions = np.flatnonzero(failed)
+        sample = df.index[failed_positions[:sample_size]].tolist()
+        results.append(rule_result(compiled_rule, len(df), int(len(failed_positions)), sample))
+    return summarize_results(results)
+
+
+def evaluate_chunks(chunks, compiled_rules, sample_size=SAMPLE_SIZE):
+    """
+    evaluate_rules for a dataset read in chunks, e.g. from staging.iter_staged. Each rule's
+    partial result is folded in chunk by chunk and rows are numbered across chunks, so the
+    report is the same as evaluate_rules gives for the whole frame with a RangeIndex.
+    """
+    tallies = [compiled_rule.tally(sample_size) for compiled_rule in compiled_rules]
+    missing_columns = set()
+    rows = 0
+    for chunk in chunks:
+        views = column_views(chunk, compiled_rules)
+        for tally in tallies:
+            view = views.get(tally.compiled_rule.column)
+            if view is None:
+                missing_columns.add(tally.compiled_rule.column)
+            else:
+                tally.add(view, rows)
+        rows += len(chunk)
+
+    results = []
+    for tally in tallies:
+        if tally.compiled_rule.column in missing_columns:
+            results.append(rule_result(tally.compiled_rule, rows, rows, [], error="column missing"))
+        else:
+            results.append(rule_result(tally.compiled_rule, rows, *tally.finish()))
+    return summarize_results(results)
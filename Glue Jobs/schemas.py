@@ -0,0 +1,100 @@
+import pandas as pd
+
+# Declarative column types per staging layer and dataset. Low-cardinality strings become
+# categoricals and numeric columns use the nullable extension types, so missing values no
+# longer force object or float64 columns. Columns not listed keep the inferred type.
+DATASET_SCHEMAS = {
+    "raw": {
+        "customers": {
+            "home_ownership": "category",
+            "verification_status": "category",
+            "addr_state": "category",
+            "annual_inc": "Float64",
+        },
+        "loan_data": {
+            "loan_status": "category",
+            "purpose": "category",
+            "loan_amount": "Float64",
+            "issue_year": "Int64",
+        },
+        "loan_with_region": {
+            "region": "category",
+            "loan_amount": "Float64",
+        },
+        "state_with_region": {
+            "state": "category",
+            "subregion": "category",
+            "region": "category",
+        },
+        "loan_purposes": {
+            "purpose": "category",
+        },
+        "loan_count_yearwise": {
+            "issue_year": "Int64",
+            "loan_count": "Int64",
+        },
+    },
+    "clean": {
+        "customer_data": {
+            "home_ownership": "category",
+            "verification_status": "category",
+            "state": "category",
+            "annual_income": "Float64",
+        },
+        "loan_data": {
+            "loan_status": "category",
+            "purpose": "category",
+            "loan_amount": "Float64",
+            "interest_rate": "Float64",
+            "loan_term": "Float64",
+            "issue_year": "Int64",
+        },
+        "loan_with_region": {
+            "region": "category",
+            "loan_amount": "Float64",
+        },
+        "state_with_region": {
+            "state": "category",
+            "sub_region": "category",
+            "region": "category",
+        },
+        "loan_purposes": {
+            "purpose": "category",
+        },
+        "loan_count_yearwise": {
+            "issue_year": "Int64",
+            "loan_count": "Int64",
+        },
+    },
+}
+
+
+def apply_schema(df, dataset_name, layer="raw"):
+    """Cast the columns of a frame to the declared types, coercing unparseable numbers to NA."""
+    schema = DATASET_SCHEMAS.get(layer, {}).get(dataset_name, {})
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype == "category" and isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Parquet files written in chunks keep categories in order of appearance; astype sorts them
+            categories = df[col].cat.categories
+            if not categories.is_monotonic_increasing:
+                df[col] = df[col].cat.reorder_categories(categories.sort_values())
+            continue
+        if str(df[col].dtype) == dtype:
+            continue
+        if dtype in ("Int64", "Float64"):
+            values = pd.to_numeric(df[col], errors="coerce")
+            try:
+                df[col] = values.astype(dtype)
+            except TypeError:
+                # Fractional values cannot become Int64, so keep them as nullable floats
+                print(f"Column '{col}' of '{dataset_name}' is not integral, using Float64.")
+                df[col] = values.astype("Float64")
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def frame_memory(df):
+    return int(df.memory_usage(deep=True).sum())
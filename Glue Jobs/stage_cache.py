@@ -0,0 +1,200 @@
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+import boto3
+import pandas as pd
+from botocore.exceptions import ClientError
+from job_args import optional_arg
+from instrumentation import timed_step
+
+# Where stage outputs are cached: an s3:// prefix or a local directory; "off" disables the cache
+DEFAULT_LOCATION = "s3://project-utility-754/stage-cache/"
+DEFAULT_MAX_MB = 2048
+DEFAULT_MAX_ENTRIES = 1000
+INDEX_NAME = "index.json"
+
+_code_versions = {}
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def code_version(*sources):
+    """Hash of the source files (paths or modules) that a stage's output depends on."""
+    digest = hashlib.sha256()
+    for source in sources:
+        path = getattr(source, "__file__", source)
+        if path not in _code_versions:
+            with open(path, "rb") as f:
+                _code_versions[path] = hashlib.sha256(f.read()).hexdigest()
+        digest.update(_code_versions[path].encode())
+    return digest.hexdigest()
+
+
+def input_hash(content_hash, *settings):
+    """
+    Hash of a stage's inputs: the content hash of its dataset and any JSON-serializable settings
+    the output depends on. None when the dataset has no content hash, which disables caching.
+    """
+    if content_hash is None:
+        return None
+    return hashlib.sha256(json.dumps([content_hash, *settings], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class S3Store:
+    def __init__(self, bucket, prefix):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3 = boto3.client("s3")
+
+    def read(self, name):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=self.prefix + name)["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            return None
+
+    def write(self, name, data):
+        self.s3.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data)
+
+    def delete(self, name):
+        self.s3.delete_object(Bucket=self.bucket, Key=self.prefix + name)
+
+
+class LocalStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def read(self, name):
+        try:
+            with open(os.path.join(self.root, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, name, data):
+        # Written next to the target and renamed, so readers never see a partial file
+        path = os.path.join(self.root, name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def delete(self, name):
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+
+class StageCache:
+    """
+    Content-addressed cache of stage outputs, keyed by (stage, input hash, code version).
+    An index records the size and last use of every entry; once the cache holds more than
+    max_bytes or max_entries, the least recently used entries are evicted.
+    """
+    def __init__(self, store, max_bytes=DEFAULT_MAX_MB * 1024 ** 2, max_entries=DEFAULT_MAX_ENTRIES):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_key(stage, inputs, version):
+        return hashlib.sha256(f"{stage}\0{inputs}\0{version}".encode()).hexdigest()
+
+    def _load_index(self):
+        data = self.store.read(INDEX_NAME)
+        return json.loads(data) if data else {}
+
+    def _save_index(self, index):
+        self.store.write(INDEX_NAME, json.dumps(index, separators=(",", ":")).encode())
+
+    def get(self, stage, inputs, version):
+        """Cached bytes of a stage output, or None."""
+        key = self.entry_key(stage, inputs, version)
+        with self._lock:
+            if key not in self._load_index():
+                return None
+        data = self.store.read(key)
+        with self._lock:
+            # The index is read again, so entries written meanwhile by other threads are kept
+            index = self._load_index()
+            if data is None:
+                index.pop(key, None)
+            elif key in index:
+                index[key]["last_used"] = time.time()
+            self._save_index(index)
+        return data
+
+    def put(self, stage, inputs, version, data):
+        if len(data) > self.max_bytes:
+            print(f"Output of '{stage}' ({len(data)} bytes) is larger than the cache, not caching it.")
+            return
+        key = self.entry_key(stage, inputs, version)
+        self.store.write(key, data)
+        with self._lock:
+            index = self._load_index()
+            now = time.time()
+            index[key] = {"stage": stage, "size": len(data), "created": now, "last_used": now}
+            self._evict(index)
+            self._save_index(index)
+
+    def _evict(self, index):
+        total = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_used"]):
+            if total <= self.max_bytes and len(index) <= self.max_entries:
+                break
+            total -= index[key]["size"]
+            print(f"Evicting cached output of '{index[key]['stage']}'.")
+            self.store.delete(key)
+            del index[key]
+
+
+def get_stage_cache():
+    """The cache configured by the optional --STAGE_CACHE and --STAGE_CACHE_MAX_MB job arguments, or None."""
+    location = optional_arg("STAGE_CACHE", DEFAULT_LOCATION)
+    if location == "off":
+        return None
+    max_bytes = int(float(optional_arg("STAGE_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 ** 2)
+    with _caches_lock:
+        if (location, max_bytes) not in _caches:
+            if location.startswith("s3://"):
+                bucket, _, prefix = location[len("s3://"):].partition("/")
+                store = S3Store(bucket, prefix.rstrip("/") + "/" if prefix else "")
+            else:
+                store = LocalStore(location)
+            _caches[(location, max_bytes)] = StageCache(store, max_bytes)
+        return _caches[(location, max_bytes)]
+
+
+def cached_json(cache, stage, inputs, version, compute, default=None):
+    """compute() unless its JSON result is cached for these inputs and code version."""
+    if cache is None or inputs is None:
+        return compute()
+    data = cache.get(stage, inputs, version)
+    if data is not None:
+        print(f"Reusing the cached output of '{stage}'.")
+        return json.loads(data)
+    result = compute()
+    cache.put(stage, inputs, version, json.dumps(result, default=default, separators=(",", ":")).encode())
+    return result
+
+
+def cached_frame(cache, stage, inputs, version, compute):
+    """compute() unless its DataFrame result is cached, as Parquet, for these inputs and code version."""
+    if cache is None or inputs is None:
+        return compute()
+    data = cache.get(stage, inputs, version)
+    if data is not None:
+        print(f"Reusing the cached output of '{stage}'.")
+        with timed_step(f"cache_read:{stage}"):
+            return pd.read_parquet(io.BytesIO(data))
+    result = compute()
+    buffer = io.BytesIO()
+    result.to_parquet(buffer, index=False)
+    cache.put(stage, inputs, version, buffer.getvalue())
+    return result
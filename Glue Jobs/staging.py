@@ -0,0 +1,505 @@
+import os
+import json
+import hashlib
+import tempfile
+import boto3
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+from pandas.core.dtypes.cast import find_common_type
+from schemas import apply_schema, frame_memory
+from instrumentation import timed_step
+
+S3_BUCKET = "source-system-754"
+STAGING_PREFIX = "staging"
+MANIFEST_NAME = "_manifest.json"
+
+RAW_DATASETS = {
+    "state_with_region": "active-processing/state_region.csv",
+    "loan_count_yearwise": "active-processing/loan_count_yearwise.csv",
+    "loan_purposes": "active-processing/loan_purposes.csv",
+    "loan_with_region": "active-processing/loan_with_region.csv",
+    "customers": "active-processing/customers.csv",
+    "loan_data": "active-processing/loan_data.csv"
+}
+
+# Manifests are small, so each job keeps the ones it has read in memory
+_manifests = {}
+# Staged DataFrames by (bucket, key) when several jobs share one process, see keep_staged_in_memory
+_memory_frames = None
+
+
+def staged_key(layer, dataset_name):
+    return f"{STAGING_PREFIX}/{layer}/{dataset_name}.parquet"
+
+
+def staged_part_key(layer, dataset_name, part, partition=None):
+    if partition is not None:
+        return f"{STAGING_PREFIX}/{layer}/{dataset_name}/{partition}/part-{part:05d}.parquet"
+    return f"{STAGING_PREFIX}/{layer}/{dataset_name}/part-{part:05d}.parquet"
+
+
+def staged_partition_key(layer, dataset_name, partition):
+    return f"{STAGING_PREFIX}/{layer}/{dataset_name}/{partition}.parquet"
+
+
+def partition_prefix(source_key):
+    """'active-processing/loan_data.csv' is partitioned under 'active-processing/loan_data/'."""
+    return f"{os.path.splitext(source_key)[0]}/"
+
+
+def partitioned_key(key, partition):
+    """Place one partition of an output in the same layout: 'post-processing/loan_data/issue_year=2015.csv'."""
+    stem, extension = os.path.splitext(key)
+    return f"{stem}/{partition}{extension}"
+
+
+def discover_partitions(source_key, bucket=S3_BUCKET):
+    """
+    List the partitions of a dataset stored as '<prefix>/<partition>/*.csv', for example
+    'active-processing/loan_data/issue_year=2015/part-0.csv'. Returns {partition: [objects]}
+    with the key, ETag and size of every CSV object, or {} if the dataset is a single object.
+    """
+    prefix = partition_prefix(source_key)
+    partitions = {}
+    paginator = boto3.client("s3").get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            relative = obj["Key"][len(prefix):]
+            if not relative.endswith(".csv") or "/" not in relative:
+                continue
+            partition = relative.rsplit("/", 1)[0]
+            partitions.setdefault(partition, []).append({
+                "key": obj["Key"],
+                "etag": obj["ETag"].strip('"'),
+                "size": int(obj["Size"])
+            })
+    for objects in partitions.values():
+        objects.sort(key=lambda obj: obj["key"])
+    return partitions
+
+
+def combine_hashes(hashes):
+    """Order-independent fingerprint of {name: content_hash}, e.g. of a dataset's partitions."""
+    digest = hashlib.sha256()
+    for name in sorted(hashes):
+        digest.update(f"{name}={hashes[name]};".encode())
+    return digest.hexdigest()
+
+
+def entry_keys(entry):
+    """Parquet objects holding a staged dataset or partition."""
+    return entry.get("parts") or [entry["parquet_key"]]
+
+
+def staged_partitions(dataset_name, layer="raw", bucket=S3_BUCKET):
+    """Names of the staged partitions of a dataset; empty for single-object datasets."""
+    entry = load_manifest(layer, bucket).get(dataset_name) or {}
+    return sorted(entry.get("partitions", {}))
+
+
+def staged_hash(dataset_name, layer="raw", bucket=S3_BUCKET):
+    """Content hash of a staged dataset, or None if it has not been staged."""
+    return load_manifest(layer, bucket).get(dataset_name, {}).get("content_hash")
+
+
+def _selected_keys(entry, partitions=None):
+    if "partitions" not in entry:
+        return entry_keys(entry)
+    names = sorted(entry["partitions"]) if partitions is None else partitions
+    missing = [name for name in names if name not in entry["partitions"]]
+    if missing:
+        raise KeyError(f"Partitions not staged: {', '.join(missing)}")
+    return [key for name in names for key in entry_keys(entry["partitions"][name])]
+
+
+def keep_staged_in_memory(enabled=True):
+    """
+    Keep staged outputs as DataFrames in this process instead of writing Parquet objects, so
+    jobs run one after another in the same process hand their data over in memory. Manifests
+    are still written to S3, and objects that are not held in memory are read from S3.
+    """
+    global _memory_frames
+    _memory_frames = {} if enabled else None
+
+
+def _write_parquet(df, bucket, key):
+    if _memory_frames is not None:
+        _memory_frames[(bucket, key)] = df.reset_index(drop=True).copy()
+    else:
+        df.to_parquet(f"s3://{bucket}/{key}", index=False)
+
+
+def _memory_frame(bucket, key, columns=None):
+    """A copy of a staged object held in memory, or None; callers may modify what they read."""
+    if _memory_frames is None or (bucket, key) not in _memory_frames:
+        return None
+    df = _memory_frames[(bucket, key)]
+    return (df if columns is None else df[list(columns)]).copy()
+
+
+def _read_parquet(bucket, key, columns=None):
+    df = _memory_frame(bucket, key, columns)
+    return df if df is not None else pd.read_parquet(f"s3://{bucket}/{key}", columns=columns)
+
+
+def manifest_key(layer):
+    return f"{STAGING_PREFIX}/{layer}/{MANIFEST_NAME}"
+
+
+def load_manifest(layer="raw", bucket=S3_BUCKET, refresh=False):
+    """Load the manifest describing every staged dataset of a layer."""
+    if refresh or (bucket, layer) not in _manifests:
+        s3 = boto3.client("s3")
+        try:
+            body = s3.get_object(Bucket=bucket, Key=manifest_key(layer))["Body"].read()
+            manifest = json.loads(body)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            manifest = {}
+        _manifests[(bucket, layer)] = manifest
+    return _manifests[(bucket, layer)]
+
+
+def save_manifest(manifest, layer="raw", bucket=S3_BUCKET):
+    s3 = boto3.client("s3")
+    s3.put_object(
+        Bucket=bucket,
+        Key=manifest_key(layer),
+        Body=json.dumps(manifest, separators=(",", ":")),
+        ContentType="application/json"
+    )
+    _manifests[(bucket, layer)] = manifest
+
+
+def download_with_hash(bucket, key, destination):
+    """Stream an S3 object to a local file and return its SHA-256 digest."""
+    s3 = boto3.client("s3")
+    digest = hashlib.sha256()
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    with open(destination, "wb") as f:
+        for chunk in body.iter_chunks(chunk_size=8 * 1024 * 1024):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def describe_frame(df):
+    return {
+        "rows": int(len(df)),
+        "columns": {col: str(dtype) for col, dtype in df.dtypes.items()}
+    }
+
+
+def merge_column_dtypes(dtype_maps):
+    """One {column: dtype} map fitting all of dtype_maps, e.g. int64 and float64 give float64."""
+    dtypes = {}
+    for dtype_map in dtype_maps:
+        for col, dtype in dtype_map.items():
+            dtypes.setdefault(col, []).append(pd.api.types.pandas_dtype(dtype))
+    return {col: str(find_common_type(found)) for col, found in dtypes.items()}
+
+
+def log_memory(label, inferred_bytes, typed_bytes):
+    print(
+        f"{label} in memory: {inferred_bytes / 1e6:.1f} MB inferred, "
+        f"{typed_bytes / 1e6:.1f} MB typed ({inferred_bytes / max(typed_bytes, 1):.1f}x smaller)"
+    )
+
+
+def _merge_arrow_types(left, right):
+    """Arrow type holding the values of two chunks, as pandas would infer it for both at once."""
+    if left == right:
+        return left
+    if pa.types.is_dictionary(left) and pa.types.is_dictionary(right):
+        # Chunks with more categories use wider indices
+        return pa.dictionary(pa.int32(), _merge_arrow_types(left.value_type, right.value_type))
+    # e.g. int64 in a chunk without nulls and double in one with nulls
+    merged = pa.unify_schemas([pa.schema([("value", left)]), pa.schema([("value", right)])], promote_options="permissive")
+    return merged.field("value").type
+
+
+def _typed_chunks(paths, dataset_name, layer, chunk_rows):
+    """(CSV chunk as parsed, chunk with the declared types) for every chunk of the files."""
+    for path in paths:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            inferred_bytes = frame_memory(chunk)
+            yield inferred_bytes, apply_schema(chunk, dataset_name, layer)
+
+
+def _chunked_schema(paths, dataset_name, layer, chunk_rows):
+    """
+    Arrow schema of the whole files, merged from the types of their chunks, and the columns
+    holding nulls. A column that is entirely null in a chunk says nothing about its type there,
+    so that chunk is left out.
+    """
+    types, first_types, metadata, nullable = {}, {}, None, set()
+    for _, chunk in _typed_chunks(paths, dataset_name, layer, chunk_rows):
+        schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+        metadata = metadata or schema.metadata
+        nulls = chunk.isna()
+        nullable.update(nulls.columns[nulls.any()])
+        for field in schema:
+            first_types.setdefault(field.name, field.type)
+            if not nulls[field.name].all():
+                types[field.name] = _merge_arrow_types(types.get(field.name, field.type), field.type)
+    schema = pa.schema([(name, types.get(name, first_type)) for name, first_type in first_types.items()], metadata=metadata)
+    return schema, nullable
+
+
+def _schema_dtypes(schema, nullable):
+    """Column types as pandas gives them for the whole files: with nulls, ints become float64 and bools object."""
+    dtypes = {}
+    for col, dtype in schema.empty_table().to_pandas().dtypes.items():
+        if col in nullable and dtype.kind in "iu":
+            dtype = np.dtype("float64")
+        elif col in nullable and dtype.kind == "b":
+            dtype = np.dtype(object)
+        dtypes[col] = str(dtype)
+    return dtypes
+
+
+def _fit_chunk(chunk, schema):
+    """Give a chunk every column of the schema, with empty categoricals typed like the schema's dictionary."""
+    if list(chunk.columns) != schema.names:
+        chunk = chunk.reindex(columns=schema.names)
+    for field in schema:
+        column = chunk[field.name]
+        if pa.types.is_dictionary(field.type) and isinstance(column.dtype, pd.CategoricalDtype) \
+                and not len(column.cat.categories):
+            chunk[field.name] = column.cat.set_categories(pd.Index([], dtype=field.type.value_type.to_pandas_dtype()))
+    return chunk
+
+
+def convert_csv_chunked(paths, dataset_name, label, parquet_key, tmp_dir, chunk_rows, layer="raw", bucket=S3_BUCKET):
+    """
+    Convert local CSV files to one Parquet object chunk by chunk, so memory follows chunk_rows
+    instead of the file size. The files are parsed twice: once to settle each column's type
+    across chunks, then to write every chunk, with the declared types, as row groups.
+    """
+    schema, nullable = _chunked_schema(paths, dataset_name, layer, chunk_rows)
+    local_path = os.path.join(tmp_dir, "staged.parquet")
+    rows = inferred_bytes = typed_bytes = 0
+    with pq.ParquetWriter(local_path, schema) as writer:
+        for chunk_bytes, chunk in _typed_chunks(paths, dataset_name, layer, chunk_rows):
+            chunk = _fit_chunk(chunk, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+            inferred_bytes += chunk_bytes
+            typed_bytes += frame_memory(chunk)
+    log_memory(label, inferred_bytes, typed_bytes)
+    if _memory_frames is not None:
+        _memory_frames[(bucket, parquet_key)] = pd.read_parquet(local_path)
+    else:
+        # upload_file streams the local Parquet file to S3 as a multipart upload
+        boto3.client("s3").upload_file(local_path, bucket, parquet_key)
+    return {
+        "memory_bytes": {"inferred": inferred_bytes, "typed": typed_bytes},
+        "rows": rows,
+        "columns": _schema_dtypes(schema, nullable)
+    }
+
+
+def convert_csv(paths, dataset_name, label, parquet_key, tmp_dir, chunk_rows=0, layer="raw", bucket=S3_BUCKET):
+    """Convert local CSV files to one staged Parquet object and return the manifest fields describing it."""
+    if chunk_rows > 0:
+        return convert_csv_chunked(paths, dataset_name, label, parquet_key, tmp_dir, chunk_rows, layer, bucket)
+    data = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True)
+    inferred_bytes = frame_memory(data)
+    data = apply_schema(data, dataset_name, layer)
+    typed_bytes = frame_memory(data)
+    log_memory(label, inferred_bytes, typed_bytes)
+    _write_parquet(data, bucket, parquet_key)
+    return {"memory_bytes": {"inferred": inferred_bytes, "typed": typed_bytes}, **describe_frame(data)}
+
+
+def stage_partition(dataset_name, partition, objects, previous, layer="raw", bucket=S3_BUCKET, chunk_rows=0):
+    """Convert the CSV objects of one partition to a single Parquet object unless they are unchanged."""
+    sources = [{"key": obj["key"], "etag": obj["etag"], "size": obj["size"]} for obj in objects]
+    if previous and previous["sources"] == sources:
+        return previous, False
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        object_hashes = {}
+        local_paths = []
+        for i, obj in enumerate(objects):
+            local_path = os.path.join(tmp_dir, f"{i}.csv")
+            object_hashes[obj["key"]] = download_with_hash(bucket, obj["key"], local_path)
+            local_paths.append(local_path)
+        content_hash = combine_hashes(object_hashes)
+        if previous and previous["content_hash"] == content_hash:
+            return {**previous, "sources": sources}, False
+        parquet_key = staged_partition_key(layer, dataset_name, partition)
+        converted = convert_csv(
+            local_paths, dataset_name, f"'{dataset_name}/{partition}'", parquet_key, tmp_dir, chunk_rows, layer, bucket
+        )
+    return {"sources": sources, "parquet_key": parquet_key, "content_hash": content_hash, **converted}, True
+
+
+def stage_partitioned_dataset(dataset_name, source_key, partitions, manifest, layer="raw", bucket=S3_BUCKET,
+                              chunk_rows=0):
+    """
+    Stage each partition of a dataset independently, converting only new or changed ones.
+    The dataset-level content hash combines the partition hashes, so it changes with any partition.
+    """
+    entry = manifest.get(dataset_name) or {}
+    previous = entry.get("partitions", {})
+    staged = {}
+    converted = []
+    for partition, objects in sorted(partitions.items()):
+        staged[partition], changed = stage_partition(
+            dataset_name, partition, objects, previous.get(partition), layer, bucket, chunk_rows
+        )
+        if changed:
+            converted.append(partition)
+    removed = sorted(set(previous) - set(staged))
+
+    entry = {
+        "source_prefix": partition_prefix(source_key),
+        "partitions": staged,
+        "content_hash": combine_hashes({name: part["content_hash"] for name, part in staged.items()}),
+        "rows": sum(part["rows"] for part in staged.values()),
+        "columns": next(iter(staged.values()))["columns"]
+    }
+    manifest[dataset_name] = entry
+    print(
+        f"Staged '{dataset_name}': {len(converted)} of {len(staged)} partitions converted"
+        f"{', removed ' + ', '.join(removed) if removed else ''} ({entry['rows']} rows)."
+    )
+    return entry
+
+
+def stage_dataset(dataset_name, source_key, manifest, layer="raw", bucket=S3_BUCKET, chunk_rows=0):
+    """
+    Convert one CSV object to Parquet unless the manifest shows it is unchanged, in chunks of
+    chunk_rows rows if it is set. Datasets stored as partitions under the source key's prefix
+    are staged partition by partition.
+    """
+    partitions = discover_partitions(source_key, bucket)
+    if partitions:
+        return stage_partitioned_dataset(dataset_name, source_key, partitions, manifest, layer, bucket, chunk_rows)
+
+    s3 = boto3.client("s3")
+    head = s3.head_object(Bucket=bucket, Key=source_key)
+    etag = head["ETag"].strip('"')
+    size = int(head["ContentLength"])
+
+    entry = manifest.get(dataset_name)
+    if entry and entry["source_key"] == source_key and entry["etag"] == etag and entry["size"] == size:
+        print(f"Dataset '{dataset_name}' unchanged since last staging, skipping.")
+        return entry
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, os.path.basename(source_key))
+        content_hash = download_with_hash(bucket, source_key, local_path)
+        if entry and entry["source_key"] == source_key and entry["content_hash"] == content_hash:
+            entry.update({"etag": etag, "size": size})
+            print(f"Dataset '{dataset_name}' content unchanged, skipping.")
+            return entry
+        parquet_key = staged_key(layer, dataset_name)
+        converted = convert_csv([local_path], dataset_name, f"'{dataset_name}'", parquet_key, tmp_dir, chunk_rows, layer, bucket)
+
+    entry = {
+        "source_key": source_key,
+        "parquet_key": parquet_key,
+        "etag": etag,
+        "size": size,
+        "content_hash": content_hash,
+        **converted
+    }
+    manifest[dataset_name] = entry
+    print(f"Staged '{dataset_name}' to s3://{bucket}/{parquet_key} ({entry['rows']} rows).")
+    return entry
+
+
+def stage_datasets(datasets=None, layer="raw", bucket=S3_BUCKET, chunk_rows=0):
+    """Stage every dataset once and persist the resulting manifest."""
+    datasets = datasets or RAW_DATASETS
+    manifest = dict(load_manifest(layer, bucket, refresh=True))
+    for dataset_name, source_key in datasets.items():
+        with timed_step(f"stage:{dataset_name}") as step:
+            step["rows_out"] = stage_dataset(dataset_name, source_key, manifest, layer, bucket, chunk_rows)["rows"]
+    save_manifest(manifest, layer, bucket)
+    return manifest
+
+
+def frame_hash(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def register_staged(dataset_name, entry, layer="clean", bucket=S3_BUCKET):
+    manifest = dict(load_manifest(layer, bucket, refresh=True))
+    manifest[dataset_name] = entry
+    save_manifest(manifest, layer, bucket)
+
+
+def write_staged(df, dataset_name, layer="clean", bucket=S3_BUCKET):
+    """Write a job output to the staging area so later jobs can read it as Parquet."""
+    parquet_key = staged_key(layer, dataset_name)
+    df = apply_schema(df, dataset_name, layer)
+    _write_parquet(df, bucket, parquet_key)
+    register_staged(dataset_name, {
+        "parquet_key": parquet_key,
+        "content_hash": frame_hash(df),
+        **describe_frame(df)
+    }, layer, bucket)
+
+
+def write_staged_part(df, dataset_name, part, layer="clean", bucket=S3_BUCKET, partition=None):
+    """Write one chunk of a streamed output; register the parts once all are written."""
+    part_key = staged_part_key(layer, dataset_name, part, partition)
+    df = apply_schema(df, dataset_name, layer)
+    _write_parquet(df, bucket, part_key)
+    return part_key
+
+
+def read_staged(dataset_name, columns=None, layer="raw", fallback_key=None, bucket=S3_BUCKET, partitions=None):
+    """
+    Read a staged dataset, loading only the requested columns and, for partitioned datasets,
+    only the requested partitions (all of them by default, none for an empty list).
+    Falls back to parsing the source CSV if the dataset has not been staged yet.
+    """
+    entry = load_manifest(layer, bucket).get(dataset_name)
+    if entry is not None:
+        keys = _selected_keys(entry, partitions)
+        if not keys:
+            # An empty selection of partitions still has the dataset's columns and types
+            dtypes = {col: dtype for col, dtype in entry["columns"].items() if columns is None or col in columns}
+            data = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+        elif len(keys) == 1:
+            data = _read_parquet(bucket, keys[0], columns)
+        else:
+            data = pd.concat([_read_parquet(bucket, key, columns) for key in keys], ignore_index=True)
+    elif fallback_key is None:
+        raise KeyError(f"Dataset '{dataset_name}' has not been staged in layer '{layer}'.")
+    else:
+        print(f"Dataset '{dataset_name}' is not staged, reading s3://{bucket}/{fallback_key}")
+        data = pd.read_csv(f"s3://{bucket}/{fallback_key}", usecols=columns)
+    # Parts may disagree on categories, and CSV fallbacks are untyped
+    return apply_schema(data, dataset_name, layer)
+
+
+def iter_staged(dataset_name, chunk_size, columns=None, layer="raw", fallback_key=None, bucket=S3_BUCKET,
+                partitions=None):
+    """Yield a staged dataset (or some of its partitions) in DataFrames of at most chunk_size rows."""
+    entry = load_manifest(layer, bucket).get(dataset_name)
+    if entry is None:
+        if fallback_key is None:
+            raise KeyError(f"Dataset '{dataset_name}' has not been staged in layer '{layer}'.")
+        print(f"Dataset '{dataset_name}' is not staged, streaming s3://{bucket}/{fallback_key}")
+        for chunk in pd.read_csv(f"s3://{bucket}/{fallback_key}", usecols=columns, chunksize=chunk_size):
+            yield apply_schema(chunk, dataset_name, layer)
+        return
+    for key in _selected_keys(entry, partitions):
+        frame = _memory_frame(bucket, key, columns)
+        if frame is not None:
+            for start in range(0, len(frame), chunk_size):
+                yield apply_schema(frame.iloc[start:start + chunk_size].reset_index(drop=True), dataset_name, layer)
+            continue
+        with fsspec.open(f"s3://{bucket}/{key}", "rb") as f:
+            for batch in pq.ParquetFile(f).iter_batches(batch_size=chunk_size, columns=columns):
+                yield apply_schema(batch.to_pandas(), dataset_name, layer)
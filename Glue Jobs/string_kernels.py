@@ -0,0 +1,86 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Placeholders the sources use for missing values
+NA_VALUES = ("n/a", "")
+
+# Patterns are compiled once per process instead of on every call
+NON_ASCII_PATTERN = re.compile(r"[^\x00-\x7F]+")
+ID_SPECIAL_PATTERN = re.compile(r"[^a-zA-Z0-9-_]")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def clean_customer_id(customer_id):
+    """Clean customer ID by removing non-ASCII and special characters."""
+    customer_id = customer_id.encode("utf-8").decode("utf-8", errors="ignore")
+    customer_id = NON_ASCII_PATTERN.sub("", customer_id)
+    return ID_SPECIAL_PATTERN.sub("", customer_id)
+
+
+def normalize_names(columns):
+    """'Annual Inc ' -> 'annual_inc' for every column name."""
+    return [str(name).strip().lower().replace(" ", "_") for name in columns]
+
+
+def clean_values(values, na_values=NA_VALUES, strip=False, number=False):
+    """
+    Clean an array of distinct values: strip trims whitespace and values in na_values become NA,
+    or, with number, the first run of digits is kept as a float (NaN when there is none).
+    """
+    if number:
+        cleaned = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            if isinstance(value, str):
+                match = NUMBER_PATTERN.search(value)
+                if match is not None:
+                    cleaned[i] = float(match.group())
+        return cleaned
+    na_values = set(na_values)
+    cleaned = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            if strip:
+                value = value.strip()
+            if value in na_values:
+                value = pd.NA
+        cleaned[i] = value
+    return cleaned
+
+
+def clean_text(series, na_values=NA_VALUES, strip=False, number=False):
+    """
+    Fused cleaning of one object or categorical column: NA placeholders, optional trimming and,
+    with number, extraction of the first run of digits as Float64 (like
+    str.extract(r"(\\d+)").astype("Float64")). The column is factorized once, every distinct
+    value is cleaned once, and the results are mapped back through the codes. Categorical
+    columns stay categorical unless a number is extracted.
+    """
+    categorical = isinstance(series.dtype, pd.CategoricalDtype)
+    if categorical:
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    cleaned = clean_values(np.asarray(uniques, dtype=object), na_values, strip, number)
+    if number:
+        values = np.append(cleaned, np.nan)[codes]
+        return pd.Series(pd.array(values, dtype="Float64"), index=series.index, name=series.name)
+    if categorical:
+        # Cleaned categories can coincide or become NA, so the codes are remapped to the new categories
+        new_codes, categories = pd.factorize(pd.Series(cleaned, dtype=object))
+        values = pd.Categorical.from_codes(np.append(new_codes, -1)[codes], categories=categories)
+        return pd.Series(values, index=series.index, name=series.name)
+    # Code -1 marks missing values, which are kept as they were
+    values = np.append(cleaned, np.nan)[codes]
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+
+def clean_text_columns(df, number_columns=(), na_values=NA_VALUES, strip=False):
+    """
+    Apply clean_text to every object and categorical column of df, in place, in one pass per
+    column. Numeric columns cannot hold the placeholders and are left alone; the columns named
+    in number_columns are converted to Float64 numbers.
+    """
+    for column in df.select_dtypes(include=["object", "category"]).columns:
+        df[column] = clean_text(df[column], na_values, strip, number=column in number_columns)
+    return df
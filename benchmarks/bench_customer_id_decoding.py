@@ -0,0 +1,60 @@
+"""
+Times the batch customer_id decoder of DataCleaningJob against the scalar chain it replaces
+(convert_to_bytes -> decode_ibm866 -> clean_customer_id, then removing '-' and '_') on
+synthetic IDs, after checking that both give the same output. The parity of the two on
+unusual literals is covered by tests/test_customer_id_decoding.py.
+
+Usage:
+    python benchmarks/bench_customer_id_decoding.py --rows 1e6 --repeat 3
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Glue Jobs"))
+from synthetic_data import customer_literals  # noqa: E402
+from DataCleaningJob import decode_customer_id, decode_customer_ids, decoded_customer_ids  # noqa: E402
+
+
+def scalar_decode_all(literals):
+    return [decode_customer_id(literal) for literal in literals]
+
+
+def batch_decode_all(literals):
+    decoded_customer_ids.clear()
+    return list(decode_customer_ids(pd.Series(literals, dtype=object)))
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=float, default=1e6, help="number of synthetic customer IDs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    literals = list(customer_literals(np.arange(int(args.rows)), args.seed))
+    scalar_seconds, expected = best_time(lambda: scalar_decode_all(literals), args.repeat)
+    batch_seconds, actual = best_time(lambda: batch_decode_all(literals), args.repeat)
+    if expected != actual:
+        sys.exit("synthetic customer IDs: outputs differ")
+    print(f"{'decoder':28} {'scalar':>9} {'batch':>9} {'speedup':>8}")
+    print(f"{f'customer_id x{len(literals)}':28} {scalar_seconds:8.3f}s {batch_seconds:8.3f}s "
+          f"{scalar_seconds / batch_seconds:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
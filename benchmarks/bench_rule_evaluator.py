@@ -0,0 +1,93 @@
+"""
+Times the native rule evaluator of DataQualityChecksJob (rule_evaluator.py) on synthetic raw
+loan_data, with the rules DataProfilingJob generates for it. Every rule's failure count is
+checked against plain pandas before the run is timed, and the columns that take longest are
+listed.
+
+Usage:
+    python benchmarks/bench_rule_evaluator.py --rows 1e6 --repeat 3
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Glue Jobs"))
+from synthetic_data import make_loans  # noqa: E402
+from schemas import apply_schema  # noqa: E402
+from column_stats import compute_column_stats  # noqa: E402
+from rule_evaluator import compile_rules, column_views, evaluate_rules  # noqa: E402
+
+
+def profiled_rules(col_stats):
+    """The rules DataProfilingJob.generate_validation_rules gives a column without metadata."""
+    rules = []
+    if not col_stats.nullable:
+        rules.append({"rule": "expect_column_values_to_not_be_null"})
+    if col_stats.is_unique:
+        rules.append({"rule": "expect_column_values_to_be_unique"})
+    if col_stats.is_numeric:
+        rules.append({"rule": "expect_column_values_to_be_between", "min": col_stats.minimum, "max": col_stats.maximum})
+    if col_stats.is_string:
+        rules.append({"rule": "expect_column_values_to_match_regex", "regex": "^[A-Za-z0-9_\\s]*$"})
+    return rules
+
+
+def pandas_failures(series, rule):
+    if rule["rule"] == "expect_column_values_to_not_be_null":
+        return series.isna().sum()
+    if rule["rule"] == "expect_column_values_to_be_unique":
+        return series.dropna().duplicated(keep=False).sum()
+    if rule["rule"] == "expect_column_values_to_be_between":
+        values = series.dropna().astype(float)
+        return ((values < rule["min"]) | (values > rule["max"])).sum()
+    pattern = re.compile(rule["regex"])
+    return sum(pattern.search(str(value)) is None for value in series.dropna())
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=float, default=1e6, help="number of synthetic loans")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = int(args.rows)
+    df = apply_schema(make_loans(0, rows, max(rows // 4, 1), args.seed, 0), "loan_data", "raw")
+    rules = {col: profiled_rules(stats) for col, stats in compute_column_stats(df).items()}
+    compiled = compile_rules(rules)
+
+    seconds, report = best_time(lambda: evaluate_rules(df, compiled), args.repeat)
+    for compiled_rule, result in zip(compiled, report["results"]):
+        if result["unexpected_count"] != pandas_failures(df[compiled_rule.column], compiled_rule.rule):
+            sys.exit(f"{compiled_rule.column} {compiled_rule.expectation_type}: failure counts differ")
+
+    # Per column: the shared view is built by the first rule that needs it
+    column_seconds = {}
+    for col, view in column_views(df, compiled).items():
+        start = time.perf_counter()
+        for compiled_rule in compiled:
+            if compiled_rule.column == col:
+                np.flatnonzero(compiled_rule.check(view))
+        column_seconds[col] = time.perf_counter() - start
+
+    print(f"{len(compiled)} rules on {rows} rows: {seconds:.3f}s")
+    for col, elapsed in sorted(column_seconds.items(), key=lambda item: -item[1])[:5]:
+        print(f"  {col:20} {elapsed:7.3f}s  {df[col].nunique()} distinct")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmarks of the string-cleaning kernels in string_kernels.py against the pandas code
+they replace, on synthetic loan and customer columns. Every kernel's output is checked
+against the previous implementation before it is timed.
+
+Usage:
+    python benchmarks/bench_string_kernels.py --rows 1e6 --repeat 3
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Glue Jobs"))
+from synthetic_data import make_loans, make_customers, customer_ids  # noqa: E402
+from schemas import apply_schema  # noqa: E402
+from string_kernels import clean_customer_id, normalize_names, clean_text, clean_text_columns  # noqa: E402
+
+
+def previous_clean_customer_id(customer_id):
+    """The previous implementation: re.sub looks the patterns up on every call."""
+    customer_id = customer_id.encode("utf-8").decode("utf-8", errors="ignore")
+    customer_id = re.sub(r"[^\x00-\x7F]+", "", customer_id)
+    return re.sub(r"[^a-zA-Z0-9-_]", "", customer_id)
+
+
+def previous_replace_na(df):
+    """The previous implementation: DataFrame.replace over every column."""
+    categorical = df.select_dtypes("category").columns
+    for col in categorical:
+        df[col] = df[col].cat.remove_categories(df[col].cat.categories.intersection(["n/a", ""]))
+    others = df.columns.difference(categorical, sort=False)
+    df[others] = df[others].replace(["n/a", ""], pd.NA)
+    return df
+
+
+def previous_extract_number(series):
+    return series.str.extract(r"(\d+)", expand=False).astype("Float64")
+
+
+def previous_normalize_names(columns):
+    return list(columns.str.strip().str.lower().str.replace(" ", "_"))
+
+
+def best_time(function, repeat, setup=None):
+    """Fastest of repeat calls; setup builds fresh arguments outside the timing."""
+    best = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(name, previous, kernel, repeat, setup=None, check=None):
+    previous_seconds, expected = best_time(previous, repeat, setup)
+    kernel_seconds, actual = best_time(kernel, repeat, setup)
+    (check or (lambda a, b: a == b or sys.exit(f"{name}: outputs differ")))(expected, actual)
+    print(f"{name:28} {previous_seconds:8.3f}s {kernel_seconds:8.3f}s {previous_seconds / kernel_seconds:7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=float, default=1e6, help="number of loans; customers are a quarter of it")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rows = int(args.rows)
+
+    loans = apply_schema(make_loans(0, rows, max(rows // 4, 1), args.seed, 0), "loan_data", "raw")
+    customers = apply_schema(make_customers(0, max(rows // 4, 1), args.seed, 0), "customers", "raw")
+    ids = list(customer_ids(range(min(rows, 100_000)))) + ["C-0В0_1é"] * 10
+    print(f"{'kernel':28} {'previous':>9} {'kernel':>9} {'speedup':>8}")
+
+    bench(
+        f"clean_customer_id x{len(ids)}",
+        lambda: [previous_clean_customer_id(value) for value in ids],
+        lambda: [clean_customer_id(value) for value in ids],
+        args.repeat
+    )
+    bench(
+        "normalize_names",
+        lambda: previous_normalize_names(loans.columns.append(customers.columns)),
+        lambda: normalize_names(loans.columns.append(customers.columns)),
+        args.repeat
+    )
+    frame_check = lambda expected, actual: pd.testing.assert_frame_equal(expected, actual)  # noqa: E731
+    for dataset_name, frame in [("loan_data", loans), ("customers", customers)]:
+        bench(
+            f"clean_text_columns {dataset_name}",
+            previous_replace_na, clean_text_columns, args.repeat,
+            setup=lambda: (frame.copy(),), check=frame_check
+        )
+    bench(
+        "clean_text number (term)",
+        lambda: previous_extract_number(loans["term"]),
+        lambda: clean_text(loans["term"], number=True),
+        args.repeat,
+        check=lambda expected, actual: pd.testing.assert_series_equal(expected, actual)
+    )
+    # The cleaning job used to replace placeholders in every column and then extract the term's digits
+    bench(
+        "fused NA + number loan_data",
+        lambda df: previous_replace_na(df).assign(term=lambda d: previous_extract_number(d["term"])),
+        lambda df: clean_text_columns(df, number_columns=["term"]),
+        args.repeat,
+        setup=lambda: (loans.copy(),), check=frame_check
+    )
+
+
+if __name__ == "__main__":
+    main()
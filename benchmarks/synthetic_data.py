@@ -0,0 +1,202 @@
+"""
+Generate synthetic raw inputs in the layout of s3://source-system-754/active-processing/.
+
+loan_data, customers and loan_with_region are written in chunks, so scales from 1e4 to 1e8
+loans fit in constant memory. customer_ids are IBM866 byte literals (b'...') that decode to
+the same IDs in customers and loan_data after decode_and_clean_customer_ids. The lookup
+tables are copied from data/. The same rows, seed and chunk size always produce the same files.
+
+Usage:
+    python benchmarks/synthetic_data.py --rows 1e6 --out /tmp/loans-1e6
+    python benchmarks/synthetic_data.py --rows 1e6 --out /tmp/loans-1e6 --partition-by-year
+"""
+import os
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+CHUNK_ROWS = 1_000_000
+CUSTOMERS_PER_LOAN = 0.25
+ISSUE_YEARS = np.arange(2012, 2020)
+# issue_d labels such as 'Jan-2015', indexed by (year - 2012) * 12 + month
+ISSUE_MONTHS = pd.date_range(f"{ISSUE_YEARS[0]}-01", f"{ISSUE_YEARS[-1]}-12", freq="MS").strftime("%b-%Y").to_numpy()
+
+RAW_FILES = {
+    "customers": "customers.csv",
+    "loan_data": "loan_data.csv",
+    "loan_with_region": "loan_with_region.csv",
+}
+LOOKUP_FILES = {
+    "state_with_region": "state_region.csv",
+    "loan_purposes": "loan_purposes.csv",
+    "loan_count_yearwise": "loan_count_yearwise.csv",
+}
+
+STATUSES = np.array([
+    "Fully Paid", "Current", "Charged Off", "Default",
+    "Late (16-30 days)", "Late (31-120 days)", "In Grace Period"
+])
+STATUS_WEIGHTS = np.array([0.45, 0.3, 0.12, 0.03, 0.04, 0.03, 0.03])
+HOME_OWNERSHIP = np.array(["RENT", "OWN", "MORTGAGE", "OTHER"])
+VERIFICATION = np.array(["Verified", "Source Verified", "Not Verified"])
+EMP_LENGTH = np.array(["< 1 year", "1 year", "2 years", "5 years", "10+ years", "n/a"])
+EMP_TITLES = np.array(["Teacher", "Manager", "Nurse", "Engineer", "Driver", ""])
+GRADES = np.array(list("ABCDEFG"))
+
+# Escapes and separators that decode_and_clean_customer_ids strips: Cyrillic letters and
+# box-drawing characters in IBM866, control bytes, '-' and '_'
+NOISE_TOKENS = np.array(["\\x8f", "\\xa0", "\\xe4", "\\xb3", "\\x00", "\\t", "-", "_", ""])
+
+
+def _rng(seed, name, chunk):
+    return np.random.default_rng([seed, sum(map(ord, name)), chunk])
+
+
+def _lookup_values(file_name, column):
+    return pd.read_csv(os.path.join(DATA_DIR, file_name))[column].dropna().unique()
+
+
+def customer_ids(indexes):
+    """Clean customer IDs: 'C' followed by the zero-padded customer index."""
+    return np.char.add("C", np.char.zfill(np.asarray(indexes).astype(str), 9))
+
+
+def customer_literals(indexes, seed):
+    """
+    Render customers as the b'...' literals found in the raw files: the clean ID with noise
+    after every character that the decoder removes again. The noise only depends on the
+    customer index and seed, so customers.csv and loan_data.csv agree without keeping a
+    lookup of every customer in memory.
+    """
+    indexes = np.asarray(indexes, dtype=np.int64)
+    chars = customer_ids(indexes).astype("U10").view("U1").reshape(len(indexes), -1)
+    literal = np.full(len(indexes), "b'", dtype=object)
+    for position in range(chars.shape[1]):
+        noise = (indexes * 2_654_435_761 + position * 40_503 + seed) % 1_000_003 % len(NOISE_TOKENS)
+        literal = literal + chars[:, position].astype(object) + NOISE_TOKENS[noise].astype(object)
+    return literal + "'"
+
+
+def make_customers(start, stop, seed, chunk):
+    rng = _rng(seed, "customers", chunk)
+    rows = stop - start
+    ids = customer_literals(np.arange(start, stop), seed)
+    # A few customers have no usable ID and are dropped by the cleaning job
+    ids[rng.random(rows) < 0.001] = None
+    states = _lookup_values(LOOKUP_FILES["state_with_region"], "state")
+    annual_inc = rng.lognormal(11, 0.5, rows).round(2)
+    return pd.DataFrame({
+        "customer_id": ids,
+        "emp_title": rng.choice(EMP_TITLES, rows),
+        "emp_length": rng.choice(EMP_LENGTH, rows),
+        "home_ownership": rng.choice(HOME_OWNERSHIP, rows),
+        "annual_inc": np.where(rng.random(rows) < 0.01, np.nan, annual_inc),
+        "annual_inc_joint": np.where(rng.random(rows) < 0.9, np.nan, annual_inc * 1.6),
+        "verification_status": rng.choice(VERIFICATION, rows),
+        "zip_code": pd.Series(rng.integers(100, 999, rows)).map("{}xx".format),
+        "addr_state": rng.choice(states, rows),
+        "avg_cur_bal": rng.integers(0, 50_000, rows),
+        "tot_cur_bal": rng.integers(0, 500_000, rows),
+    })
+
+
+def make_loans(start, stop, n_customers, seed, chunk):
+    rng = _rng(seed, "loan_data", chunk)
+    rows = stop - start
+    purposes = _lookup_values(LOOKUP_FILES["loan_purposes"], "purpose")
+    states = _lookup_values(LOOKUP_FILES["state_with_region"], "state")
+    issue_year = rng.choice(ISSUE_YEARS, rows)
+    month = rng.integers(0, 12, rows)
+    loan_amount = rng.integers(10, 400, rows) * 100.0
+    int_rate = rng.uniform(0.05, 0.3, rows).round(4)
+    term = rng.choice(np.array([" 36 months", " 60 months"]), rows)
+    return pd.DataFrame({
+        "loan_id": np.arange(start, stop),
+        "customer_id": customer_literals(rng.integers(0, n_customers, rows), seed),
+        "loan_status": rng.choice(STATUSES, rows, p=STATUS_WEIGHTS),
+        "loan_amount": loan_amount,
+        "state": rng.choice(states, rows),
+        "funded_amount": loan_amount,
+        "term": term,
+        "int_rate": np.where(rng.random(rows) < 0.005, np.nan, int_rate),
+        "installment": (loan_amount * (int_rate / 12 + 1 / 48)).round(2),
+        "grade": rng.choice(GRADES, rows),
+        "issue_d": ISSUE_MONTHS[(issue_year - ISSUE_YEARS[0]) * 12 + month],
+        "issue_year": issue_year,
+        "pymnt_plan": "n",
+        "type": "INDIVIDUAL",
+        "purpose": rng.choice(purposes, rows),
+        "description": np.where(rng.random(rows) < 0.5, "n/a", "Loan request"),
+        "notes": "",
+    })
+
+
+def make_loan_with_region(start, stop, seed, chunk):
+    rng = _rng(seed, "loan_with_region", chunk)
+    rows = stop - start
+    regions = _lookup_values(LOOKUP_FILES["state_with_region"], "region")
+    return pd.DataFrame({
+        "loan_id": np.arange(start, stop),
+        "loan_amount": rng.integers(10, 400, rows) * 100.0,
+        "region": rng.choice(regions, rows),
+    })
+
+
+def _append(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def write_dataset(out_dir, rows, seed=0, chunk_rows=CHUNK_ROWS, partition_by_year=False):
+    """
+    Write every raw input under out_dir and return {relative path: size in bytes}.
+    With partition_by_year, loan_data is written as loan_data/issue_year=YYYY/part-0.csv.
+    """
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    rows = int(rows)
+    n_customers = max(int(rows * CUSTOMERS_PER_LOAN), 1)
+
+    for chunk, start in enumerate(range(0, n_customers, chunk_rows)):
+        stop = min(start + chunk_rows, n_customers)
+        _append(make_customers(start, stop, seed, chunk), os.path.join(out_dir, RAW_FILES["customers"]))
+
+    for chunk, start in enumerate(range(0, rows, chunk_rows)):
+        stop = min(start + chunk_rows, rows)
+        loans = make_loans(start, stop, n_customers, seed, chunk)
+        if partition_by_year:
+            for year, part in loans.groupby("issue_year"):
+                _append(part, os.path.join(out_dir, "loan_data", f"issue_year={year}", "part-0.csv"))
+        else:
+            _append(loans, os.path.join(out_dir, RAW_FILES["loan_data"]))
+        _append(make_loan_with_region(start, stop, seed, chunk), os.path.join(out_dir, RAW_FILES["loan_with_region"]))
+
+    for file_name in LOOKUP_FILES.values():
+        shutil.copy(os.path.join(DATA_DIR, file_name), os.path.join(out_dir, file_name))
+
+    files = {}
+    for root, _, names in os.walk(out_dir):
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), out_dir)
+            files[path] = os.path.getsize(os.path.join(out_dir, path))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=float, default=1e5, help="number of loans, e.g. 1e4 to 1e8")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--partition-by-year", action="store_true")
+    args = parser.parse_args()
+    files = write_dataset(args.out, args.rows, args.seed, args.chunk_rows, args.partition_by_year)
+    for path, size in sorted(files.items()):
+        print(f"{size / 1e6:10.1f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Run stateMachineDefinition.json locally: every Glue task runs its script from "Glue Jobs/" in
+this process, S3 and Secrets Manager are served by moto and the jobs write to a local PostgreSQL.
+
+Staged datasets are handed from job to job as in-memory DataFrames instead of Parquet objects
+(staging.keep_staged_in_memory); pass --through-s3 to write them to the S3 stand-in like Glue does.
+The interpreter supports Task, Pass, Choice, Succeed and Fail states, Catch, ResultSelector and
+ResultPath. Glue tasks run the job scripts; aws-sdk tasks (e.g. s3:getObject) call boto3.
+
+Usage:
+    LOCAL_DATABASE_URL=postgresql+psycopg2://postgres@localhost:5432/postgres \
+        python local_runner.py --inputs data/ --skip DataProfilingJob
+    python local_runner.py --inputs /tmp/loans-1e5 --argument DataCleaningJob:--CHUNK_SIZE=50000 \
+        --profile /tmp/pipeline.prof
+
+--inputs uploads a directory (e.g. one written by benchmarks/synthetic_data.py) to
+active-processing/. The database named `fintech` is created on the server if it does not exist.
+"""
+import os
+import sys
+import re
+import json
+import time
+import runpy
+import logging
+import cProfile
+import argparse
+import boto3
+import psycopg2
+from sqlalchemy.engine import make_url
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DIR = os.path.join(ROOT_DIR, "Glue Jobs")
+DEFINITION_PATH = os.path.join(ROOT_DIR, "stateMachineDefinition.json")
+sys.path.insert(0, JOBS_DIR)
+
+S3_BUCKET = "source-system-754"
+GX_BUCKET = "project-utility-754"
+SECRET_NAME = "db-secret"
+RDS_DB = "fintech"
+RDS_SCHEMA = "loans"
+
+# Glue job names that differ from the script file names
+JOB_SCRIPTS = {
+    "LoadMetadata": "LoadMetadataJob.py",
+    "DataTransformationJob": "DataTransformationsJob.py",
+}
+
+METADATA_DDL = f"""
+CREATE SCHEMA IF NOT EXISTS {RDS_SCHEMA};
+CREATE TABLE IF NOT EXISTS {RDS_SCHEMA}.datasets (
+    dataset_id SERIAL PRIMARY KEY,
+    dataset_name TEXT UNIQUE NOT NULL,
+    s3_path TEXT
+);
+CREATE TABLE IF NOT EXISTS {RDS_SCHEMA}.columns (
+    dataset_id INTEGER REFERENCES {RDS_SCHEMA}.datasets (dataset_id),
+    column_name TEXT,
+    data_type TEXT,
+    nullable BOOLEAN,
+    uniqueness BOOLEAN,
+    validation_rules JSONB,
+    PRIMARY KEY (dataset_id, column_name)
+);
+"""
+
+
+class TaskFailed(Exception):
+    def __init__(self, error, cause):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+def start_local_aws():
+    """Serve S3 and Secrets Manager from moto unless AWS_ENDPOINT_URL already points elsewhere."""
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if os.getenv("AWS_ENDPOINT_URL"):
+        return None
+    from moto.server import ThreadedMotoServer
+    # moto logs every request it serves
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ["AWS_ENDPOINT_URL"] = f"http://{host}:{port}"
+    return server
+
+
+def create_secret(url):
+    """Store the connection details of url where the jobs look up the RDS credentials."""
+    secret = json.dumps({
+        "host": url.host or "localhost",
+        "port": url.port or 5432,
+        "username": url.username,
+        "password": url.password or ""
+    })
+    client = boto3.client("secretsmanager")
+    try:
+        client.create_secret(Name=SECRET_NAME, SecretString=secret)
+    except client.exceptions.ResourceExistsException:
+        client.put_secret_value(SecretId=SECRET_NAME, SecretString=secret)
+
+
+def connect(url, database):
+    return psycopg2.connect(
+        host=url.host, port=url.port or 5432, user=url.username, password=url.password, dbname=database
+    )
+
+
+def prepare_database(url, reset=False):
+    """Create the fintech database and the metadata tables; reset drops the loans schema first."""
+    conn = connect(url, url.database or "postgres")
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (RDS_DB,))
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE DATABASE {RDS_DB};")
+    conn.close()
+    conn = connect(url, RDS_DB)
+    with conn, conn.cursor() as cursor:
+        if reset:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {RDS_SCHEMA} CASCADE;")
+        cursor.execute(METADATA_DDL)
+    conn.close()
+
+
+def prepare_buckets(inputs_dir=None, reset=False):
+    """Create both buckets, optionally empty them, and upload inputs_dir to active-processing/."""
+    s3 = boto3.resource("s3")
+    for bucket_name in (S3_BUCKET, GX_BUCKET):
+        bucket = s3.Bucket(bucket_name)
+        if bucket.creation_date is None:
+            bucket.create()
+        elif reset:
+            bucket.objects.all().delete()
+    if inputs_dir is None:
+        return
+    for root, _, names in os.walk(inputs_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            key = "active-processing/" + os.path.relpath(path, inputs_dir).replace(os.sep, "/")
+            s3.Bucket(S3_BUCKET).upload_file(path, key)
+
+
+def get_path(data, path):
+    """Value at a reference path such as '$.gate.verdict'; KeyError if it does not exist."""
+    if path == "$":
+        return data
+    for field in path[2:].split("."):
+        data = data[field]
+    return data
+
+
+def set_path(data, path, value):
+    """Apply a ResultPath: '$' replaces the input, null discards the result."""
+    if path is None:
+        return data
+    if path == "$":
+        return value
+    data = dict(data)
+    fields = path[2:].split(".")
+    target = data
+    for field in fields[:-1]:
+        target[field] = dict(target.get(field, {}))
+        target = target[field]
+    target[fields[-1]] = value
+    return data
+
+
+# Intrinsic functions available in Parameters and ResultSelector
+INTRINSICS = {
+    "States.StringToJson": json.loads,
+    "States.JsonToString": lambda value: json.dumps(value, separators=(",", ":")),
+}
+
+
+def resolve_template(template, data):
+    """Resolve Parameters or a ResultSelector: 'name.$' fields take a path or an intrinsic of a path."""
+    resolved = {}
+    for key, value in template.items():
+        if key.endswith(".$"):
+            call = re.fullmatch(r"(States\.\w+)\((\$[^)]*)\)", value)
+            resolved[key[:-2]] = INTRINSICS[call[1]](get_path(data, call[2])) if call else get_path(data, value)
+        elif isinstance(value, dict):
+            resolved[key] = resolve_template(value, data)
+        else:
+            resolved[key] = value
+    return resolved
+
+
+COMPARISONS = {
+    "Equals": lambda value, expected: value == expected,
+    "LessThan": lambda value, expected: value < expected,
+    "GreaterThan": lambda value, expected: value > expected,
+    "LessThanEquals": lambda value, expected: value <= expected,
+    "GreaterThanEquals": lambda value, expected: value >= expected,
+}
+
+
+def evaluate_choice(rule, data):
+    """Evaluate one Choice rule (And, Or, Not, IsPresent and the String/Numeric/Boolean comparisons)."""
+    if "And" in rule:
+        return all(evaluate_choice(inner, data) for inner in rule["And"])
+    if "Or" in rule:
+        return any(evaluate_choice(inner, data) for inner in rule["Or"])
+    if "Not" in rule:
+        return not evaluate_choice(rule["Not"], data)
+    try:
+        value = get_path(data, rule["Variable"])
+    except (KeyError, TypeError):
+        return rule.get("IsPresent") is False
+    if "IsPresent" in rule:
+        return rule["IsPresent"]
+    for operator, expected in rule.items():
+        if operator in ("Variable", "Next"):
+            continue
+        for kind in ("String", "Numeric", "Boolean"):
+            if operator.startswith(kind) and operator[len(kind):] in COMPARISONS:
+                return COMPARISONS[operator[len(kind):]](value, expected)
+        raise ValueError(f"Unsupported Choice operator: {operator}")
+    raise ValueError(f"Choice rule without a comparison: {rule}")
+
+
+def job_arguments(state, overrides):
+    """Job arguments of a Glue task: its Parameters.Arguments updated with the command line ones."""
+    parameters = state.get("Parameters", {})
+    arguments = dict(parameters.get("Arguments", {}))
+    arguments.update(overrides.get(parameters["JobName"], {}))
+    return arguments
+
+
+def run_glue_job(job_name, arguments):
+    """
+    Run a Glue script as __main__ in this process with its job arguments in sys.argv.
+    Shared modules such as staging stay imported between jobs, so in-memory handoffs survive.
+    """
+    import instrumentation
+
+    script = os.path.join(JOBS_DIR, JOB_SCRIPTS.get(job_name, f"{job_name}.py"))
+    argv = sys.argv
+    sys.argv = [script, "--JOB_NAME", job_name] + [item for pair in arguments.items() for item in pair]
+    instrumentation.set_job(job_name)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise TaskFailed("States.TaskFailed", f"{job_name} exited with status {e.code}")
+    except Exception as e:
+        raise TaskFailed(type(e).__name__, f"{job_name}: {e}") from e
+    finally:
+        sys.argv = argv
+    return {"JobName": job_name, "JobRunState": "SUCCEEDED"}
+
+
+def run_sdk_task(resource, parameters):
+    """
+    aws-sdk service integration such as arn:aws:states:::aws-sdk:s3:getObject, called through boto3.
+    Errors are named like Step Functions names them, e.g. S3.NoSuchKeyException.
+    """
+    service, action = resource.split(":")[-2:]
+    client = boto3.client(service)
+    method = getattr(client, re.sub(r"(?<!^)(?=[A-Z])", "_", action).lower())
+    try:
+        response = method(**parameters)
+    except client.exceptions.ClientError as e:
+        code = e.response["Error"]["Code"]
+        error = code if code.endswith("Exception") else f"{code}Exception"
+        raise TaskFailed(f"{service.capitalize()}.{error}", str(e)) from e
+    response.pop("ResponseMetadata", None)
+    if hasattr(response.get("Body"), "read"):
+        # Step Functions returns object bodies as strings
+        response["Body"] = response["Body"].read().decode("utf-8")
+    return response
+
+
+def run_state_machine(definition, state_input=None, arguments=None, skip=()):
+    """
+    Interpret a Step Functions definition and return (status, output, history). Tasks whose
+    JobName is in skip succeed without running. Each history entry records the state, its
+    type, status and wall time and, for tasks, the instrumentation records of the job.
+    """
+    import instrumentation
+
+    arguments = arguments or {}
+    data = state_input if state_input is not None else {}
+    history = []
+    name = definition["StartAt"]
+    while True:
+        state = definition["States"][name]
+        kind = state["Type"]
+        entry = {"state": name, "type": kind, "status": "SUCCEEDED", "seconds": 0.0, "records": []}
+        history.append(entry)
+        print(f"Entering state '{name}' ({kind})")
+        start = time.perf_counter()
+        first_record = len(instrumentation.step_records())
+        try:
+            if kind == "Task" and state["Resource"].startswith("arn:aws:states:::aws-sdk:"):
+                result = run_sdk_task(state["Resource"], resolve_template(state.get("Parameters", {}), data))
+                if "ResultSelector" in state:
+                    result = resolve_template(state["ResultSelector"], result)
+                data = set_path(data, state.get("ResultPath", "$"), result)
+            elif kind == "Task":
+                job_name = state["Parameters"]["JobName"]
+                entry["job"] = job_name
+                if job_name in skip:
+                    entry["status"] = "SKIPPED"
+                    result = {"JobName": job_name, "JobRunState": "SKIPPED"}
+                else:
+                    result = run_glue_job(job_name, job_arguments(state, arguments))
+                data = set_path(data, state.get("ResultPath", "$"), result)
+            elif kind == "Pass":
+                data = set_path(data, state.get("ResultPath", "$"), state.get("Result", data))
+            elif kind == "Choice":
+                matched = next((rule for rule in state["Choices"] if evaluate_choice(rule, data)), None)
+                if matched is None and "Default" not in state:
+                    raise TaskFailed("States.NoChoiceMatched", f"No choice of '{name}' matched")
+                name = matched["Next"] if matched else state["Default"]
+                continue
+            elif kind == "Succeed":
+                return "SUCCEEDED", data, history
+            elif kind == "Fail":
+                entry["status"] = "FAILED"
+                print(f"Execution failed in '{name}': {state.get('Error')} - {state.get('Cause')}")
+                return "FAILED", data, history
+            else:
+                raise ValueError(f"Unsupported state type: {kind}")
+        except TaskFailed as e:
+            entry["status"] = "FAILED"
+            entry["error"] = str(e)
+            print(f"State '{name}' failed: {e}")
+            catcher = next(
+                (c for c in state.get("Catch", [])
+                 if "States.ALL" in c["ErrorEquals"] or e.error in c["ErrorEquals"]),
+                None
+            )
+            if catcher is None:
+                return "FAILED", data, history
+            data = set_path(data, catcher.get("ResultPath", "$"), {"Error": e.error, "Cause": e.cause})
+            name = catcher["Next"]
+            continue
+        finally:
+            entry["seconds"] = round(time.perf_counter() - start, 3)
+            entry["records"] = instrumentation.step_records()[first_record:]
+        if state.get("End"):
+            return "SUCCEEDED", data, history
+        name = state["Next"]
+
+
+def parse_arguments(values):
+    """['DataCleaningJob:--CHUNK_SIZE=50000'] -> {'DataCleaningJob': {'--CHUNK_SIZE': '50000'}}"""
+    arguments = {}
+    for value in values:
+        job_name, argument = value.split(":", 1)
+        flag, argument_value = argument.split("=", 1)
+        arguments.setdefault(job_name, {})[flag] = argument_value
+    return arguments
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--definition", default=DEFINITION_PATH)
+    parser.add_argument("--url", default=os.getenv("LOCAL_DATABASE_URL"), help="PostgreSQL server for the jobs")
+    parser.add_argument("--inputs", help="directory uploaded to s3://source-system-754/active-processing/")
+    parser.add_argument("--reset", action="store_true", help="empty the buckets and drop the loans schema first")
+    parser.add_argument("--skip", default="", help="comma-separated Glue job names to skip")
+    parser.add_argument("--argument", action="append", default=[], help="JobName:--NAME=value job argument")
+    parser.add_argument("--through-s3", action="store_true", help="write staged datasets to S3 instead of memory")
+    parser.add_argument("--profile", help="write cProfile statistics of the whole execution to this path")
+    args = parser.parse_args()
+    if not args.url:
+        sys.exit("Set LOCAL_DATABASE_URL or pass --url")
+    url = make_url(args.url)
+    with open(args.definition) as f:
+        definition = json.load(f)
+
+    import staging
+    staging.keep_staged_in_memory(not args.through_s3)
+    server = start_local_aws()
+    try:
+        create_secret(url)
+        prepare_database(url, reset=args.reset)
+        prepare_buckets(args.inputs, reset=args.reset)
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        status, _, history = run_state_machine(
+            definition, arguments=parse_arguments(args.argument), skip=set(filter(None, args.skip.split(",")))
+        )
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"Profile written to {args.profile}")
+    finally:
+        if server is not None:
+            server.stop()
+
+    for entry in history:
+        print(f"{entry['state']:24} {entry['type']:8} {entry['status']:10} {entry['seconds']:8.2f}s")
+    print(f"Execution {status}")
+    sys.exit(0 if status == "SUCCEEDED" else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The Glue scripts import their shared modules as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Glue Jobs"))
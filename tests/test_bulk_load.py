@@ -0,0 +1,76 @@
+"""COPY loads through bulk_load.CopyLoader; the database tests need LOCAL_DATABASE_URL."""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from bulk_load import CopyLoader, copy_dataframe, map_dtype_to_pg
+from staging import merge_column_dtypes
+
+DATABASE_URL = os.environ.get("LOCAL_DATABASE_URL")
+SCHEMA = "bulk_load_test"
+
+
+def test_merge_column_dtypes_widens_integers_with_nulls():
+    merged = merge_column_dtypes([
+        {"a": "int64", "b": "Int64", "c": "category", "d": "bool"},
+        {"a": "float64", "b": "Float64", "c": "object", "d": "bool"},
+    ])
+    assert merged == {"a": "float64", "b": "Float64", "c": "object", "d": "bool"}
+    assert [map_dtype_to_pg(dtype) for dtype in merged.values()] == ["DOUBLE PRECISION", "DOUBLE PRECISION", "TEXT", "BOOLEAN"]
+
+
+@pytest.fixture
+def engine():
+    if not DATABASE_URL:
+        pytest.skip("LOCAL_DATABASE_URL is not set")
+    import sqlalchemy
+    engine = sqlalchemy.create_engine(DATABASE_URL)
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};"))
+    yield engine
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(f"DROP SCHEMA {SCHEMA} CASCADE;"))
+    engine.dispose()
+
+
+def fetch(engine, query):
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query)
+        return cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def test_single_column_missing_values_are_null(engine):
+    copy_dataframe(pd.DataFrame({"value": [1.5, np.nan, 2.0]}), "single", engine, schema=SCHEMA)
+    assert fetch(engine, f"SELECT value FROM {SCHEMA}.single ORDER BY value NULLS LAST") == [(1.5,), (2.0,), (None,)]
+
+
+def test_explicit_column_types_take_later_floats(engine):
+    parts = [pd.DataFrame({"id": [1, 2], "amount": [10, 20]}), pd.DataFrame({"id": [3, 4], "amount": [3.0, np.nan]})]
+    column_types = {col: map_dtype_to_pg(dtype) for col, dtype in merge_column_dtypes(
+        part.dtypes.to_dict() for part in parts).items()}
+    loader = CopyLoader(engine, "parts", schema=SCHEMA, column_types=column_types)
+    for part in parts:
+        loader.write(part)
+    loader.commit()
+    assert fetch(engine, f"SELECT id, amount FROM {SCHEMA}.parts ORDER BY id") == [(1, 10.0), (2, 20.0), (3, 3.0), (4, None)]
+
+
+def test_inferred_columns_widen_for_later_chunks(engine):
+    # Chunks parsed separately: amount has nulls only in the second, notes is empty in the first
+    chunks = [
+        pd.DataFrame({"id": [1, 2], "amount": [10, 20], "notes": [np.nan, np.nan]}),
+        pd.DataFrame({"id": [3, 4], "amount": [3.5, np.nan], "notes": ["late", np.nan]}),
+    ]
+    loader = CopyLoader(engine, "chunks", schema=SCHEMA)
+    for chunk in chunks:
+        loader.write(chunk)
+    loader.commit()
+    assert loader.types == {"id": "BIGINT", "amount": "DOUBLE PRECISION", "notes": "TEXT"}
+    assert fetch(engine, f"SELECT id, amount, notes FROM {SCHEMA}.chunks ORDER BY id") == [
+        (1, 10.0, None), (2, 20.0, None), (3, 3.5, "late"), (4, None, None)
+    ]
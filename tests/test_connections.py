@@ -0,0 +1,54 @@
+"""Pool replacement in connections.py when the credentials rotate; needs LOCAL_DATABASE_URL."""
+import os
+import pytest
+
+import connections
+
+DATABASE_URL = os.environ.get("LOCAL_DATABASE_URL")
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    if not DATABASE_URL:
+        pytest.skip("LOCAL_DATABASE_URL is not set")
+    from sqlalchemy.engine import make_url
+    url = make_url(DATABASE_URL)
+    secret = {"host": url.host, "port": url.port or 5432, "username": url.username, "password": url.password or ""}
+    monkeypatch.setattr(connections, "get_secret", lambda *args, **kwargs: secret)
+    monkeypatch.setattr(connections, "RDS_DB", url.database)
+    yield secret
+    connections.close_all()
+
+
+def rotate(secret):
+    secret["password"] += "-rotated"
+
+
+def test_rotation_keeps_borrowed_connection_open(secret):
+    old_pool = connections.get_pool(connections.RDS_DB)
+    with connections.pooled_connection(connections.RDS_DB) as conn:
+        rotate(secret)
+        new_pool = connections.get_pool(connections.RDS_DB)
+        assert new_pool is not old_pool and not old_pool.closed
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.fetchone() == (1,)
+    # The replaced pool is closed once its last connection is back
+    assert old_pool.closed and not new_pool.closed
+
+
+def test_idle_pool_is_closed_on_rotation(secret):
+    old_pool = connections.get_pool(connections.RDS_DB)
+    rotate(secret)
+    assert connections.get_pool(connections.RDS_DB) is not old_pool
+    assert old_pool.closed
+
+
+def test_close_all_closes_replaced_pools(secret):
+    old_pool = connections.get_pool(connections.RDS_DB)
+    conn = old_pool.getconn()
+    rotate(secret)
+    connections.get_pool(connections.RDS_DB)
+    assert not old_pool.closed
+    connections.close_all()
+    assert old_pool.closed and conn.closed
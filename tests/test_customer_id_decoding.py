@@ -0,0 +1,72 @@
+"""The batch customer_id decoder of DataCleaningJob against the literal_eval chain it replaced."""
+import ast
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+from string_kernels import clean_customer_id
+from DataCleaningJob import decode_customer_ids, decoded_customer_ids, decode_literal_batch
+
+# Pieces of the generated literals: plain characters, hex escapes of any byte (letters and
+# digits included, in either case), octal escapes up to \777, one-byte escapes and unknown escapes
+TOKENS = (
+    list("Cc09-_ .,!~") + [f"\\x{b:02x}" for b in range(256)] + [f"\\x{b:02X}" for b in range(0, 256, 7)]
+    + [f"\\{oct(n)[2:]}" for n in (0, 7, 60, 101, 141, 377, 400, 501, 777)] + ["\\12", "\\0"]
+    + ["\\n", "\\t", "\\r", "\\a", "\\b", "\\f", "\\v", "\\\\", "\\'", '\\"', "\\q", "\\N", "\\8", "\\ "]
+)
+
+# Forms literal_eval accepts besides b'...' and b"..."
+OTHER_FORMS = [
+    " b'abc'", "b'abc' ", "\tb'abc'", "B'abc'", "b'ab\tc'", "b'a' b'b'", "b'''abc'''", 'b"""a\'b"""',
+    "br'a\\x41'", "Rb'C-1_0'", "(b'C01')",
+]
+# Literals literal_eval rejects or that are not bytes
+INVALID = ["b'\\x4'", "b'\\xg0'", "b'a'b'", "b'a\\'", 'b"a"b"', "'C01'", "C01", "", "12", "b'é'"]
+
+
+def expected_id(literal):
+    """convert_to_bytes -> decode_ibm866 -> clean_customer_id, then removing '-' and '_'."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            byte_values = ast.literal_eval(literal)
+    except Exception:
+        return None
+    if not isinstance(byte_values, bytes):
+        return None
+    return clean_customer_id(byte_values.decode("ibm866", errors="ignore")).replace("-", "").replace("_", "")
+
+
+def random_literals(count, seed):
+    rng = np.random.default_rng(seed)
+    literals = []
+    for _ in range(count):
+        body = "".join(rng.choice(TOKENS, rng.integers(0, 12)))
+        quote = "'" if rng.random() < 0.7 else '"'
+        # The other quote character needs no escape
+        body += "'" if quote == '"' and rng.random() < 0.2 else ""
+        literals.append(f"b{quote}{body}{quote}")
+    return literals
+
+
+@pytest.mark.parametrize("literal", OTHER_FORMS + INVALID + ["b'\\x41\\x8f0'", "b'\\1\\x8f2'", "b'\\\\x41'"])
+def test_literal_matches_scalar_chain(literal):
+    assert decode_literal_batch([literal]) == [expected_id(literal)]
+
+
+def test_other_forms_are_not_dropped():
+    assert all(decode_literal_batch(OTHER_FORMS))
+
+
+def test_random_escapes_match_scalar_chain():
+    literals = random_literals(20_000, seed=0)
+    assert decode_literal_batch(literals) == [expected_id(literal) for literal in literals]
+
+
+def test_decode_customer_ids_keeps_index_and_missing_values():
+    decoded_customer_ids.clear()
+    values = pd.Series(["b'C\\x8f01'", None, " b'C02'", "b'C\\x8f01'"], index=[3, 5, 7, 9], name="customer_id")
+    decoded = decode_customer_ids(values)
+    assert list(decoded) == ["C01", None, "C02", "C01"]
+    assert list(decoded.index) == [3, 5, 7, 9] and decoded.name == "customer_id"
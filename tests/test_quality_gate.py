@@ -0,0 +1,30 @@
+"""Verdicts of quality_gate.gate_verdict read by the QualityGate Choice state."""
+from datetime import datetime
+
+from quality_gate import gate_verdict
+
+RUN_TIME = datetime(2024, 1, 1)
+PASSED = {"passed": True, "failed_rules": [], "warnings": []}
+FAILED = {"passed": False, "failed_rules": ["loan_amount:expect_column_values_to_be_between"], "warnings": []}
+
+
+def test_nothing_changed_and_dataset_still_quarantined_passes():
+    verdict = gate_verdict({}, [], RUN_TIME, ["loan_data"])
+    assert verdict["status"] == "PASSED"
+    assert verdict["quarantined"] == ["loan_data"] and verdict["failed"] == []
+
+
+def test_every_validated_dataset_failing_fails():
+    assert gate_verdict({"loan_data": FAILED, "customers": FAILED}, [], RUN_TIME)["status"] == "FAILED"
+    assert gate_verdict({"customers": FAILED}, [], RUN_TIME, ["loan_data"])["status"] == "FAILED"
+
+
+def test_some_changed_datasets_going_on_is_partial():
+    assert gate_verdict({"loan_data": FAILED, "customers": PASSED}, [], RUN_TIME)["status"] == "PARTIAL"
+    assert gate_verdict({"loan_data": FAILED}, ["loan_purposes"], RUN_TIME)["status"] == "PARTIAL"
+
+
+def test_no_failure_passes_alongside_quarantined_datasets():
+    verdict = gate_verdict({"customers": PASSED}, ["loan_purposes"], RUN_TIME, ["loan_data"])
+    assert verdict["status"] == "PASSED"
+    assert verdict["passed"] == ["customers"] and verdict["not_validated"] == ["loan_purposes"]